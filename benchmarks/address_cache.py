@@ -0,0 +1,41 @@
+import random
+import sys
+import time
+
+from denaro import helpers
+from denaro.helpers import string_to_bytes
+from denaro.lru_cache import LRUCache
+from denaro.transactions import TransactionOutput
+
+from .helpers import generate_keys
+
+
+def generate_sample(count: int, addresses_count: int):
+    """Output address bytes as a chain reuses them: a few miners and exchanges receive most outputs."""
+    _, addresses = generate_keys(addresses_count)
+    weights = [1 / (rank + 1) for rank in range(addresses_count)]
+    return [string_to_bytes(address) for address in random.choices(addresses, weights, k=count)]
+
+
+def run(sample, cache_size: int):
+    helpers.address_cache = LRUCache(cache_size) if cache_size else None
+    start = time.perf_counter()
+    for address_bytes in sample:
+        # what reading an output and then rebuilding it from its address does
+        tx_output = TransactionOutput.from_bytes(memoryview(address_bytes + bytes([1, 1])), len(address_bytes))
+        TransactionOutput(tx_output.address, 1).public_key
+    elapsed = time.perf_counter() - start
+    return len(sample) / elapsed, helpers.address_cache.stats() if cache_size else None
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    addresses_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    sample = generate_sample(count, addresses_count)
+    print(f'{count} outputs over {addresses_count} addresses')
+    for cache_size in (0, addresses_count // 4, addresses_count * 2):
+        outputs_per_second, stats = run(sample, cache_size)
+        print(f'cache size {cache_size}: {outputs_per_second:.0f} outputs/s', f'hit rate {stats["hit_rate"]:.2f}' if stats else '')
+
+
+main()
@@ -0,0 +1,71 @@
+import random
+import sys
+import time
+from decimal import Decimal
+
+from denaro.constants import SMALLEST
+
+
+def generate_amounts(count: int):
+    """Input and output amounts in smallest units, as decoded from transactions."""
+    transactions = []
+    for _ in range(count):
+        inputs = [random.randint(1, 10 ** 12) for _ in range(random.randint(1, 4))]
+        total = sum(inputs)
+        fees = random.randint(0, total // 100)
+        change = random.randint(1, total - fees - 1)
+        transactions.append((inputs, [total - fees - change, change]))
+    return transactions
+
+
+def validate_decimal(transactions):
+    """Amount checks of Transaction.verify as they were done with Decimal amounts."""
+    fees = []
+    for inputs, outputs in transactions:
+        input_amount = sum(amount / Decimal(SMALLEST) for amount in inputs)
+        output_amounts = [amount / Decimal(SMALLEST) for amount in outputs]
+        assert all((amount * SMALLEST) % 1 == 0.0 and amount > 0 for amount in output_amounts)
+        output_amount = sum(output_amounts)
+        assert input_amount >= output_amount
+        transaction_fees = input_amount - output_amount
+        assert (transaction_fees * SMALLEST) % 1 == 0.0
+        fees.append(transaction_fees)
+    return fees
+
+
+def validate_integer(transactions):
+    fees = []
+    for inputs, outputs in transactions:
+        input_amount = sum(inputs)
+        assert all(amount > 0 for amount in outputs)
+        output_amount = sum(outputs)
+        assert input_amount >= output_amount
+        fees.append(input_amount - output_amount)
+    return fees
+
+
+def measure(function, *args, repeat: int = 5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    transactions = generate_amounts(count)
+    decimal_time, decimal_fees = measure(validate_decimal, transactions)
+    integer_time, integer_fees = measure(validate_integer, transactions)
+    assert [fees * SMALLEST for fees in decimal_fees] == integer_fees
+    print(f'validation: Decimal {count / decimal_time:.0f} transactions/s, int {count / integer_time:.0f} transactions/s')
+    blocks = [decimal_fees[i:i + 1000] for i in range(0, count, 1000)], [integer_fees[i:i + 1000] for i in range(0, count, 1000)]
+    decimal_time, decimal_sums = measure(lambda: [sum(block) for block in blocks[0]])
+    integer_time, integer_sums = measure(lambda: [sum(block) for block in blocks[1]])
+    assert [fees * SMALLEST for fees in decimal_sums] == integer_sums
+    print(f'fees of 1000 transaction blocks: Decimal {decimal_time / len(blocks[0]) * 1e6:.1f} us/block, int {integer_time / len(blocks[1]) * 1e6:.1f} us/block')
+
+
+main()
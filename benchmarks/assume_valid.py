@@ -0,0 +1,47 @@
+import asyncio
+import random
+import sys
+import time
+from decimal import Decimal
+
+from denaro.helpers import timestamp
+from denaro.manager import BulkIngest, block_to_bytes, check_block, get_transactions_merkle_tree_ordered
+from denaro.transactions import Transaction
+
+from .helpers import generate_keys, generate_transactions
+
+
+def generate_blocks(count: int, transactions_count: int):
+    """Blocks of signed transactions, with the outputs they spend kept in a BulkIngest so check_block reads no database."""
+    _, addresses = generate_keys()
+    bulk_ingest = BulkIngest()
+    blocks = []
+    for _ in range(count):
+        transactions = generate_transactions(transactions_count, max_inputs=1, related_amount=10 ** 7)
+        for transaction in transactions:
+            for tx_input in transaction.inputs:
+                bulk_ingest.unspent_outputs[(tx_input.tx_hash, tx_input.index)] = tx_input.related_output
+        block = {'address': addresses[0], 'merkle_tree': get_transactions_merkle_tree_ordered(transactions), 'timestamp': timestamp(), 'difficulty': Decimal(6), 'random': 0}
+        blocks.append((block_to_bytes(random.randbytes(32).hex(), block).hex(), [transaction.tobytes() for transaction in transactions]))
+    return blocks, bulk_ingest
+
+
+async def check_blocks(blocks, bulk_ingest, assume_valid: bool):
+    start = time.perf_counter()
+    for block_content, transactions in blocks:
+        transactions = [await Transaction.from_hex(tx_bytes) for tx_bytes in transactions]
+        assert await check_block(block_content, transactions, (Decimal(6), {}), bulk_ingest, assume_valid=assume_valid)
+    return time.perf_counter() - start
+
+
+async def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    transactions_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    blocks, bulk_ingest = generate_blocks(count, transactions_count)
+    Transaction.parsed_cache = Transaction.verified_cache = None
+    for label, assume_valid in (('signatures verified', False), ('assume valid', True)):
+        elapsed = await check_blocks(blocks, bulk_ingest, assume_valid)
+        print(f'{label}: {count} blocks of {transactions_count} transactions checked in {elapsed:.2f}s, {count / elapsed:.1f} blocks/s')
+
+
+asyncio.run(run())
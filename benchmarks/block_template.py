@@ -0,0 +1,50 @@
+import asyncio
+import sys
+import time
+
+from denaro.manager import BlockTemplate, ChainState, get_transactions_merkle_tree
+from denaro.mempool import Mempool
+from denaro.transactions import Transaction
+
+from .helpers import generate_pending_transactions
+
+
+async def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    calls = 100
+    transactions = generate_pending_transactions(count)
+    rows = [(transaction.tobytes(), fees) for transaction, fees in transactions]
+    mempool = Mempool()
+    for transaction, fees in transactions:
+        mempool.add(transaction, fees)
+    chain_state = ChainState(None)
+
+    # what get_mining_info did on every call: read the 1000 pending transactions with the most fees, parse them and hash them
+    Transaction.parsed_cache = None
+    start = time.perf_counter()
+    for _ in range(calls):
+        top = sorted(rows, key=lambda row: row[1], reverse=True)[:1000]
+        txs = [await Transaction.from_hex(tx_hex) for tx_hex in sorted(tx_bytes.hex() for tx_bytes, _ in top)]
+        get_transactions_merkle_tree(txs)
+    print(f'mining info from the table: {(time.perf_counter() - start) / calls * 1000:.2f} ms per call')
+
+    template = BlockTemplate()
+    start = time.perf_counter()
+    template.update(chain_state, mempool)
+    print(f'block template of {len(template.transactions)} out of {count} built in {(time.perf_counter() - start) * 1000:.2f} ms')
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        template.update(chain_state, mempool)
+    print(f'unchanged block template: {(time.perf_counter() - start) / calls * 10 ** 6:.2f} us per call')
+
+    # a transaction admitted between two calls
+    admitted = generate_pending_transactions(calls)
+    start = time.perf_counter()
+    for transaction, fees in admitted:
+        mempool.add(transaction, fees)
+        template.update(chain_state, mempool)
+    print(f'block template after an admission: {(time.perf_counter() - start) / calls * 1000:.2f} ms per call')
+
+
+asyncio.run(run())
@@ -0,0 +1,39 @@
+import random
+from typing import List, Tuple
+
+from fastecdsa import keys
+
+from denaro.constants import CURVE
+from denaro.helpers import point_to_string
+from denaro.transactions import Transaction, TransactionInput, TransactionOutput
+
+
+def generate_keys(count: int = 20) -> Tuple[List[int], List[str]]:
+    private_keys = [keys.gen_private_key(CURVE) for _ in range(count)]
+    return private_keys, [point_to_string(keys.get_public_key(private_key, CURVE)) for private_key in private_keys]
+
+
+def generate_transactions(count: int, max_inputs: int = 4, max_amount: int = 10 ** 6, related_amount: int = None) -> List[Transaction]:
+    """
+    Transactions spending random outpoints of one of 20 keys to two of their addresses, signed.
+    With related_amount the outputs they spend are filled, as check_block sees them after the unspent outputs lookup.
+    """
+    private_keys, addresses = generate_keys()
+    transactions = []
+    for _ in range(count):
+        i = random.randrange(len(private_keys))
+        inputs = [TransactionInput(random.randbytes(32).hex(), random.randint(0, 3)) for _ in range(random.randint(1, max_inputs))]
+        outputs = [TransactionOutput(random.choice(addresses), random.randint(1, max_amount)) for _ in range(2)]
+        transaction = Transaction(inputs, outputs)
+        signing_hex = transaction.hex(False)
+        for tx_input in inputs:
+            tx_input.sign(signing_hex, private_keys[i])
+            if related_amount is not None:
+                tx_input.related_output = TransactionOutput(addresses[i], related_amount)
+        transactions.append(transaction)
+    return transactions
+
+
+def generate_pending_transactions(count: int) -> List[Tuple[Transaction, int]]:
+    """Transactions with the fees they pay, as they are added to the mempool."""
+    return [(transaction, random.randint(0, 10 ** 5)) for transaction in generate_transactions(count)]
@@ -0,0 +1,37 @@
+import asyncio
+import sys
+import time
+
+from denaro.mempool import Mempool
+from denaro.transactions import Transaction
+
+from .helpers import generate_pending_transactions
+
+
+async def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    transactions = generate_pending_transactions(count)
+    rows = [(transaction.tobytes(), fees) for transaction, fees in transactions]
+    mempool = Mempool()
+    for transaction, fees in transactions:
+        mempool.add(transaction, fees)
+
+    # what get_pending_transactions_limit did with the rows of pending_transactions: sort by fees and parse again
+    Transaction.parsed_cache = None
+    start = time.perf_counter()
+    top = sorted(rows, key=lambda row: row[1], reverse=True)[:1000]
+    [await Transaction.from_hex(tx_hex) for tx_hex in sorted(tx_bytes.hex() for tx_bytes, _ in top)]
+    print(f'table selection of 1000 out of {count}: {(time.perf_counter() - start) * 1000:.2f} ms')
+
+    start = time.perf_counter()
+    mempool.select(1000)
+    print(f'mempool selection of 1000 out of {count}: {(time.perf_counter() - start) * 1000:.2f} ms')
+
+    outpoints = [(tx_input.tx_hash, tx_input.index) for transaction, _ in transactions for tx_input in transaction.inputs]
+    start = time.perf_counter()
+    for outpoint in outpoints:
+        mempool.get_spender([outpoint])
+    print(f'conflict lookup: {(time.perf_counter() - start) / len(outpoints) * 10 ** 6:.3f} us per outpoint')
+
+
+asyncio.run(run())
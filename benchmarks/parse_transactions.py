@@ -0,0 +1,30 @@
+import asyncio
+import sys
+import time
+
+from denaro.transactions import Transaction
+
+from .helpers import generate_transactions
+
+
+async def parse(transactions, touch_outputs: bool):
+    start = time.perf_counter()
+    for tx_bytes in transactions:
+        transaction = await Transaction.from_hex(tx_bytes, False)
+        if touch_outputs:
+            for tx_output in transaction.outputs:
+                tx_output.address, tx_output.amount
+    return len(transactions) / (time.perf_counter() - start)
+
+
+async def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    transactions = [transaction.tobytes() for transaction in generate_transactions(count, max_amount=10 ** 11)]
+    Transaction.parsed_cache = None
+    for tx_bytes in transactions:
+        assert (await Transaction.from_hex(tx_bytes)).tobytes() == tx_bytes
+    print(f'{await parse(transactions, False):.0f} transactions/s parsed')
+    print(f'{await parse(transactions, True):.0f} transactions/s parsed with output addresses and amounts')
+
+
+asyncio.run(run())
@@ -0,0 +1,41 @@
+import asyncio
+import random
+import sys
+import time
+from os import cpu_count
+
+from fastecdsa import keys, ecdsa
+
+from denaro.constants import CURVE
+from denaro.signature_verifier import SignatureVerifier
+
+
+def generate_signatures(count: int, duplicates: float):
+    """Signed transaction messages, a part of them repeated as when a block and a sync page overlap."""
+    private_keys = [keys.gen_private_key(CURVE) for _ in range(20)]
+    public_keys = [keys.get_public_key(private_key, CURVE) for private_key in private_keys]
+    items = []
+    for _ in range(int(count * (1 - duplicates))):
+        i = random.randrange(len(private_keys))
+        message = random.randbytes(150).hex()
+        items.append((message, ecdsa.sign(bytes.fromhex(message), private_keys[i]), public_keys[i]))
+    items += random.choices(items, k=count - len(items))
+    return items
+
+
+async def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    items = generate_signatures(count, 0.1)
+    print(f'{count} signatures, {len(set((message, signed) for message, signed, _ in items))} distinct, {cpu_count()} cores')
+    for workers in sorted({0, 2, cpu_count() or 1}):
+        verifier = SignatureVerifier(workers)
+        await verifier.verify(items[:100])
+        start = time.perf_counter()
+        results = await verifier.verify(items)
+        elapsed = time.perf_counter() - start
+        verifier.close()
+        assert all(results)
+        print(f'{workers} workers: {count / elapsed:.0f} signatures/s')
+
+
+asyncio.run(run())
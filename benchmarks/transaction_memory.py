@@ -0,0 +1,68 @@
+import asyncio
+import random
+import sys
+import tracemalloc
+
+from denaro.constants import SMALLEST
+from denaro.transactions import Transaction, CoinbaseTransaction
+
+from .helpers import generate_keys, generate_transactions
+
+
+def generate_block_transactions(count: int):
+    """Transactions and a tenth as many coinbase transactions, serialized."""
+    _, addresses = generate_keys()
+    transactions = [transaction.tobytes() for transaction in generate_transactions(count, max_amount=10 ** 11)]
+    return transactions + [CoinbaseTransaction(random.randbytes(32).hex(), random.choice(addresses), 100 * SMALLEST).tobytes() for _ in range(count // 10)]
+
+
+async def load_block(transactions):
+    """A block as /get_blocks and clear_pending_transactions see it: parsed, hashed, outputs decoded."""
+    block = [await Transaction.from_hex(tx_bytes, False) for tx_bytes in transactions]
+    for transaction in block:
+        transaction.hash()
+        for tx_output in transaction.outputs:
+            tx_output.address, tx_output.amount, tx_output.public_key
+    return block
+
+
+async def rebuild_unspent_outputs(transactions):
+    """What get_unspent_outputs_from_all_transactions holds before returning."""
+    parsed = [await Transaction.from_hex(tx_bytes, False) for tx_bytes in transactions]
+    transactions = {transaction.hash(): transaction for transaction in parsed}
+    spent_outputs = set()
+    for transaction in transactions.values():
+        if isinstance(transaction, CoinbaseTransaction):
+            continue
+        spent_outputs.update((tx_input.tx_hash, tx_input.index) for tx_input in transaction.inputs)
+    outputs = []
+    for tx_hash, transaction in transactions.items():
+        for index, tx_output in enumerate(transaction.outputs):
+            if (tx_hash, index) not in spent_outputs:
+                outputs.append((tx_hash, index, tx_output.address_bytes, tx_output.amount))
+    return transactions, outputs
+
+
+async def measure(function, transactions) -> int:
+    tracemalloc.start()
+    result = await function(transactions)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+async def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    Transaction.parsed_cache = None
+    block = generate_block_transactions(1000)
+    chain = generate_block_transactions(count)
+    # fill the address cache first, it is shared by every block
+    await load_block(block + chain)
+    size = await measure(load_block, block)
+    print(f'1000 transaction block: {size / 1024 / 1024:.2f} MB, {size / len(block):.0f} B/transaction')
+    size = await measure(rebuild_unspent_outputs, chain)
+    print(f'unspent outputs rebuild over {len(chain)} transactions: {size / 1024 / 1024:.2f} MB, {size / len(chain):.0f} B/transaction')
+
+
+asyncio.run(run())
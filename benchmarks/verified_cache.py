@@ -0,0 +1,27 @@
+import asyncio
+import sys
+import time
+
+from denaro.lru_cache import LRUCache
+from denaro.transactions import Transaction
+
+from .helpers import generate_transactions
+
+
+async def verify(transactions):
+    start = time.perf_counter()
+    for transaction in transactions:
+        assert await transaction.verify(check_double_spend=False)
+    return (time.perf_counter() - start) * 1000
+
+
+async def run():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    transactions = generate_transactions(count, max_inputs=3, related_amount=10 ** 7)
+    Transaction.verified_cache = LRUCache(count)
+    # the first pass is the mempool admission, the second the block made of these transactions
+    print(f'{count} transactions verified in {await verify(transactions):.1f} ms at admission')
+    print(f'{count} transactions verified in {await verify(transactions):.1f} ms in the block')
+
+
+asyncio.run(run())
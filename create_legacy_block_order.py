@@ -0,0 +1,46 @@
+import asyncio
+import json
+import sys
+from os import environ
+
+import denaro
+from denaro import Database
+from denaro.constants import ENDIAN
+from denaro.legacy_block_order import LEGACY_ORDER_HEIGHT, TABLE_PATH, find_transactions_order
+from denaro.transactions import Transaction
+
+# blocks with more transactions than this are reported instead of searched
+MAX_TRANSACTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+
+async def run():
+    db = denaro.node.main.db = await Database.create(
+        user=environ.get('DENARO_DATABASE_USER', 'denaro'),
+        password=environ.get('DENARO_DATABASE_PASSWORD', ''),
+        database=environ.get('DENARO_DATABASE_NAME', 'denaro'),
+        host=environ.get('DENARO_DATABASE_HOST', None),
+        ignore=True
+    )
+    table, unresolved = {}, []
+    previous_hash = (30_06_2005).to_bytes(32, ENDIAN).hex()
+    print(f'Reading the blocks up to {LEGACY_ORDER_HEIGHT}... This will take a few minutes')
+    for offset in range(1, LEGACY_ORDER_HEIGHT + 1, 500):
+        for block_info in await db.get_blocks(offset, min(500, LEGACY_ORDER_HEIGHT + 1 - offset)):
+            block = block_info['block']
+            transactions = [await Transaction.from_hex(tx_hex) for tx_hex in block_info['transactions']]
+            # other nodes can return the transactions of a block in any order, so every block with several of them is kept
+            if len(transactions) > 1 and block['id'] != 17972:
+                order = find_transactions_order(previous_hash, block, transactions, MAX_TRANSACTIONS)
+                if order is None:
+                    unresolved.append(block['id'])
+                else:
+                    table[block['hash']] = order
+            previous_hash = block['hash']
+    TABLE_PATH.write_text(json.dumps(table, indent=1, sort_keys=True) + '\n')
+    print(f'Wrote the order of {len(table)} blocks to {TABLE_PATH}')
+    if unresolved:
+        print(f'Order not found for blocks {unresolved}')
+
+
+loop = asyncio.get_event_loop()
+loop.run_until_complete(run())
@@ -0,0 +1,35 @@
+import asyncio
+from os import environ
+
+import denaro
+from denaro import Database
+
+
+async def run():
+    db = denaro.node.main.db = await Database.create(
+        user=environ.get('DENARO_DATABASE_USER', 'denaro'),
+        password=environ.get('DENARO_DATABASE_PASSWORD', ''),
+        database=environ.get('DENARO_DATABASE_NAME', 'denaro'),
+        host=environ.get('DENARO_DATABASE_HOST', None),
+        ignore=True
+    )
+    async with db.pool.acquire() as connection:
+        outputs_filled = await connection.fetchrow('SELECT * FROM outputs WHERE true LIMIT 1') is not None
+        spent_outpoints_filled = await connection.fetchrow('SELECT * FROM spent_outpoints WHERE true LIMIT 1') is not None
+    if outputs_filled:
+        print('Outputs table already filled')
+    else:
+        print('Retrieving outputs... This will take a few minutes')
+        outputs = await db.get_outputs_from_all_transactions()
+        print(f'Found {len(outputs)} outputs. Adding them...')
+        await db.add_outputs(outputs)
+    if spent_outpoints_filled:
+        print('Spent outpoints table already filled')
+    else:
+        print('Adding spent outpoints...')
+        await db.fill_spent_outpoints()
+    print('Done.')
+
+
+loop = asyncio.get_event_loop()
+loop.run_until_complete(run())
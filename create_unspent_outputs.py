@@ -1,7 +1,7 @@
 import asyncio
 from os import environ
 
-from asyncpg import UndefinedTableError
+from asyncpg import UndefinedTableError, UndefinedColumnError
 
 import denaro
 from denaro import Database, node
@@ -18,21 +18,30 @@ async def run():
     )
     async with db.pool.acquire() as connection:
         try:
-            res = await connection.fetchrow('SELECT * FROM unspent_outputs WHERE true LIMIT 1')
+            res = await connection.fetchrow('SELECT amount FROM unspent_outputs WHERE true LIMIT 1')
             if res is not None:
                 print('Unspent outputs table already exist')
                 exit()
-        except UndefinedTableError:
-            print('Creating table unspent_outputs and type tx_output')
+        except (UndefinedTableError, UndefinedColumnError) as e:
+            if isinstance(e, UndefinedColumnError):
+                print('Dropping old unspent_outputs table')
+                await connection.execute('DROP TABLE unspent_outputs')
+            else:
+                print('Creating type tx_output')
+                await connection.execute("""
+                    CREATE TYPE tx_output AS (
+                        tx_hash BYTEA,
+                        index SMALLINT
+                    );"""
+                )
+            print('Creating table unspent_outputs')
             await connection.execute("""
-                CREATE TYPE tx_output AS (
-                    tx_hash CHAR(64),
-                    index SMALLINT
-                );
-
                 CREATE TABLE IF NOT EXISTS unspent_outputs (
-                    tx_hash CHAR(64) REFERENCES transactions(tx_hash) ON DELETE CASCADE,
-                    index SMALLINT NOT NULL
+                    tx_hash BYTEA REFERENCES transactions(tx_hash) ON DELETE CASCADE,
+                    index SMALLINT NOT NULL,
+                    address_bytes BYTEA NOT NULL,
+                    amount BIGINT NOT NULL,
+                    PRIMARY KEY (tx_hash, index)
                 );"""
             )
             print('Created')
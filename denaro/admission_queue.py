@@ -0,0 +1,103 @@
+import asyncio
+from itertools import islice
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from icecream import ic
+
+from .transactions import Transaction
+
+_print = print
+print = ic
+
+
+class AdmissionQueue:
+    """
+    Transactions pushed to the node, waiting to be added as pending.
+    A single worker task admits them in batches of what was queued while the previous batch was processed,
+    with admit returning whether each transaction of a batch was added.
+    A transaction already queued or being admitted is not queued again, its submitter waits for the same admission,
+    and no more are queued while max_size are waiting.
+    """
+
+    def __init__(self, admit: Callable[[List[Transaction]], Awaitable[List[bool]]], batch_size: int = 256, max_size: int = 10_000):
+        self.admit = admit
+        self.batch_size = batch_size
+        self.max_size = max_size
+        # tx hash: (transaction, future of its admission, time it was queued)
+        self.queue: Dict[str, Tuple[Transaction, asyncio.Future, float]] = {}
+        # tx hash: future of its admission, for the batch being admitted
+        self.admitting: Dict[str, asyncio.Future] = {}
+        self.worker: asyncio.Task = None
+        self.batches = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.latency = 0
+        self.max_latency = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __contains__(self, tx_hash: str):
+        return tx_hash in self.queue or tx_hash in self.admitting
+
+    def full(self) -> bool:
+        return len(self.queue) >= self.max_size
+
+    async def submit(self, transaction: Transaction) -> bool:
+        """Queues transaction and returns whether it has been added as pending."""
+        tx_hash = transaction.hash()
+        if tx_hash in self.admitting:
+            return await asyncio.shield(self.admitting[tx_hash])
+        if tx_hash in self.queue:
+            return await asyncio.shield(self.queue[tx_hash][1])
+        future = asyncio.get_running_loop().create_future()
+        self.queue[tx_hash] = (transaction, future, perf_counter())
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        batch = []
+        try:
+            while self.queue:
+                batch = [self.queue.pop(tx_hash) for tx_hash in list(islice(self.queue, self.batch_size))]
+                self.admitting = {transaction.hash(): future for transaction, future, _ in batch}
+                try:
+                    results = await self.admit([transaction for transaction, _, _ in batch])
+                except Exception as e:
+                    print(f'admission of {len(batch)} transactions failed: {e!r}')
+                    results = [False] * len(batch)
+                self.batches += 1
+                now = perf_counter()
+                for (_, future, queued), admitted in zip(batch, results):
+                    self.latency += now - queued
+                    self.max_latency = max(self.max_latency, now - queued)
+                    if admitted:
+                        self.admitted += 1
+                    else:
+                        self.rejected += 1
+                    if not future.done():
+                        future.set_result(admitted)
+                batch = []
+                self.admitting = {}
+        finally:
+            # left when the worker is cancelled or admit raises a BaseException, nothing else would resolve them
+            for _, future, _ in batch + list(self.queue.values()):
+                if not future.done():
+                    future.set_result(False)
+            self.queue.clear()
+            self.admitting = {}
+            self.worker = None
+
+    def stats(self) -> dict:
+        processed = self.admitted + self.rejected
+        return {
+            'depth': len(self),
+            'max_size': self.max_size,
+            'batches': self.batches,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'average_latency_ms': round(self.latency / processed * 1000, 3) if processed else None,
+            'max_latency_ms': round(self.max_latency * 1000, 3) if processed else None
+        }
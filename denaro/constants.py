@@ -6,3 +6,6 @@ SMALLEST = 1000000
 MAX_SUPPLY = 30_062_005
 VERSION = 1
 MAX_BLOCK_SIZE_HEX = 4096 * 1024  # 4MB in HEX format, 2MB in raw bytes
+# (height, hash) of a block whose ancestors are synced without verifying their signatures, None to verify all of them
+# bumped near the tip before each release with update_assume_valid.py, see README.md
+ASSUME_VALID = (17972, '37cb1a0522c039330775e07d824c94e0422dbfb2dba6dcd421f4dc9f11601672')
@@ -1,12 +1,41 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Union, Tuple
+from typing import List, Union, Tuple, Dict
 
 import asyncpg
-from asyncpg import Connection, Pool, UndefinedTableError
-
-from .helpers import sha256, point_to_string, string_to_point, point_to_bytes, AddressFormat, normalize_block
-from .transactions import Transaction, CoinbaseTransaction, TransactionInput
+from asyncpg import Connection, Pool, UndefinedTableError, UndefinedColumnError
+
+from .constants import SMALLEST
+from .helpers import sha256, point_to_string, string_to_point, normalize_block, bytes_to_string
+from .mempool import Mempool
+from .transactions import Transaction, CoinbaseTransaction, TransactionInput, TransactionOutput
+from .unspent_outputs_cache import UnspentOutputsCache
+
+# hex columns of databases created before transactions and hashes were stored as bytes
+BINARY_COLUMNS = {
+    'blocks': ('hash',),
+    'transactions': ('block_hash', 'tx_hash', 'tx_hex'),
+    'pending_transactions': ('tx_hash', 'tx_hex'),
+    'unspent_outputs': ('tx_hash',),
+    'outputs': ('tx_hash', 'spent_by'),
+    'spent_outpoints': ('tx_hash', 'spent_by'),
+}
+BINARY_FOREIGN_KEYS = [
+    ('transactions', 'block_hash', 'blocks(hash) ON DELETE CASCADE'),
+    ('unspent_outputs', 'tx_hash', 'transactions(tx_hash) ON DELETE CASCADE'),
+    ('outputs', 'tx_hash', 'transactions(tx_hash) ON DELETE CASCADE'),
+    ('outputs', 'spent_by', 'transactions(tx_hash) ON DELETE SET NULL'),
+]
+# decimal columns of databases created before amounts were stored as integers of the smallest unit
+AMOUNT_COLUMNS = {
+    'blocks': ('reward',),
+    'transactions': ('fees',),
+    'pending_transactions': ('fees',),
+    'unspent_outputs': ('amount',),
+    'outputs': ('amount',),
+}
 
 
 class Database:
@@ -14,6 +43,17 @@ class Database:
     credentials = {}
     instance = None
     pool: Pool = None
+    _transaction_connection: ContextVar = ContextVar('transaction_connection', default=None)
+    unspent_outputs_cache: UnspentOutputsCache = None
+    mempool: Mempool = None
+    # manager.ChainState, loaded by get_chain_state
+    chain_state = None
+    secondary_indexes = {
+        'outputs_address_idx': 'CREATE INDEX IF NOT EXISTS outputs_address_idx ON outputs (address)',
+        'outputs_spent_by_idx': 'CREATE INDEX IF NOT EXISTS outputs_spent_by_idx ON outputs (spent_by)',
+        'spent_outpoints_outpoint_idx': 'CREATE INDEX IF NOT EXISTS spent_outpoints_outpoint_idx ON spent_outpoints (tx_hash, index)',
+        'spent_outpoints_spent_by_idx': 'CREATE INDEX IF NOT EXISTS spent_outpoints_spent_by_idx ON spent_outpoints (spent_by)',
+    }
 
     @staticmethod
     async def create(user='denaro', password='', database='denaro', host='127.0.0.1', ignore: bool = False):
@@ -30,10 +70,26 @@ class Database:
         if not ignore:
             async with self.pool.acquire() as connection:
                 try:
-                    res = await connection.fetchrow('SELECT * FROM unspent_outputs WHERE true LIMIT 1')
-                except UndefinedTableError:
+                    res = await connection.fetchrow('SELECT amount FROM unspent_outputs WHERE true LIMIT 1')
+                except (UndefinedTableError, UndefinedColumnError):
                     print('Unspent outputs missing, run create_unspent_outputs.py')
                     exit()
+                try:
+                    await connection.fetchrow('SELECT tx_bytes FROM transactions WHERE true LIMIT 1')
+                except UndefinedColumnError:
+                    print('Transactions are stored as hex, run migrate_binary_storage.py')
+                    exit()
+                if await connection.fetchval("SELECT data_type FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = 'unspent_outputs' AND column_name = 'amount'") == 'numeric':
+                    print('Amounts are stored as decimals, run migrate_integer_amounts.py')
+                    exit()
+                # added after schema.sql was first applied to existing databases
+                await connection.execute('CREATE TABLE IF NOT EXISTS assume_valid_state (block_id INTEGER NOT NULL, checkpoint_hash BYTEA NOT NULL)')
+                fill_pending_outputs = await connection.fetchval("SELECT to_regclass('pending_outputs')") is None
+                await connection.execute('CREATE TABLE IF NOT EXISTS pending_outputs (tx_hash BYTEA NOT NULL, address TEXT NOT NULL, amount BIGINT NOT NULL)')
+                await connection.execute('CREATE INDEX IF NOT EXISTS pending_outputs_tx_hash_idx ON pending_outputs (tx_hash)')
+                await connection.execute('CREATE INDEX IF NOT EXISTS pending_outputs_address_idx ON pending_outputs (address)')
+            if fill_pending_outputs:
+                await self.fill_pending_outputs()
         Database.instance = self
         return self
 
@@ -54,182 +110,301 @@ class Database:
     def connection(self):
         return await self.pool.acquire()"""
 
+    @asynccontextmanager
+    async def acquire(self):
+        connection = Database._transaction_connection.get()
+        if connection is not None:
+            yield connection
+        else:
+            async with self.pool.acquire() as connection:
+                yield connection
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Every query made through the database by the current task inside this block runs in a single
+        transaction, committed on exit and rolled back if an exception is raised.
+        Nested blocks become savepoints.
+        Changes to the unspent outputs cache, the mempool and the chain state follow the transaction, from
+        savepoints taken once it has begun: with SQLite the outermost block then holds the pool write lock,
+        so no other task is changing them. The cache is flushed before committing when it is due.
+        """
+        connection = Database._transaction_connection.get()
+        if connection is not None:
+            async with connection.transaction():
+                async with self._states_savepoint():
+                    yield
+            return
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                token = Database._transaction_connection.set(connection)
+                try:
+                    async with self._states_savepoint():
+                        yield
+                        cache = self.unspent_outputs_cache
+                        if cache is not None and cache.flush_due():
+                            await self.flush_unspent_outputs()
+                finally:
+                    Database._transaction_connection.reset(token)
+
+    @asynccontextmanager
+    async def _states_savepoint(self):
+        states = [state for state in (self.unspent_outputs_cache, self.mempool, self.chain_state) if state is not None]
+        savepoints = [state.savepoint() for state in states]
+        try:
+            yield
+        except BaseException:
+            for state, savepoint in zip(states, savepoints):
+                state.rollback(savepoint)
+            raise
+        for state, savepoint in zip(states, savepoints):
+            state.release(savepoint)
+
+    async def fill_related_outputs(self, transactions: List[Union[Transaction, CoinbaseTransaction]], with_transactions: bool = False) -> None:
+        """
+        Attaches to the inputs of transactions the outputs they spend, instead of a query per input.
+        Unspent outputs are read from the cache or in one query, the others from their transactions in a second one.
+        With with_transactions, the transactions of all the inputs are read and attached too.
+        """
+        inputs = [
+            tx_input for transaction in transactions if isinstance(transaction, Transaction) for tx_input in transaction.inputs
+            if tx_input.transaction is None and (with_transactions or tx_input.related_output is None)
+        ]
+        if not inputs:
+            return
+        outputs = {} if with_transactions else await self.get_unspent_outputs_info(list({(tx_input.tx_hash, tx_input.index) for tx_input in inputs}))
+        missing = list({tx_input.tx_hash for tx_input in inputs if (tx_input.tx_hash, tx_input.index) not in outputs})
+        input_txs = await self.get_transactions(missing) if missing else {}
+        for tx_input in inputs:
+            related_output = outputs.get((tx_input.tx_hash, tx_input.index))
+            if related_output is None:
+                input_tx = input_txs.get(tx_input.tx_hash)
+                # left unresolved, get_related_output fails on them as before
+                if input_tx is None or tx_input.index >= len(input_tx.outputs):
+                    continue
+                tx_input.transaction = input_tx
+                related_output = input_tx.outputs[tx_input.index]
+            if tx_input.related_output is None:
+                tx_input.related_output = related_output
+            tx_input.amount = tx_input.related_output.amount
+
     async def add_pending_transaction(self, transaction: Transaction, verify: bool = True):
         if isinstance(transaction, CoinbaseTransaction):
             return False
         tx_hex = transaction.hex()
+        if self.mempool is not None and transaction.hash() in self.mempool:
+            return False
+        await self.fill_related_outputs([transaction])
         if verify and not await transaction.verify_pending():
             return False
-        async with self.pool.acquire() as connection:
-            await connection.execute(
-                'INSERT INTO pending_transactions (tx_hash, tx_hex, inputs_addresses, fees) VALUES ($1, $2, $3, $4)',
-                sha256(tx_hex),
-                tx_hex,
-                [point_to_string(await tx_input.get_public_key()) for tx_input in transaction.inputs],
-                transaction.fees
-            )
+        async with self.transaction():
+            # another transaction may have been added while this one was verified
+            if self.mempool is not None and (transaction.hash() in self.mempool or not await transaction._verify_double_spend_pending()):
+                return False
+            async with self.acquire() as connection:
+                await connection.execute(
+                    'INSERT INTO pending_transactions (tx_hash, tx_bytes, inputs_addresses, fees) VALUES ($1, $2, $3, $4)',
+                    bytes.fromhex(sha256(tx_hex)),
+                    bytes.fromhex(tx_hex),
+                    [point_to_string(await tx_input.get_public_key()) for tx_input in transaction.inputs],
+                    transaction.fees
+                )
+            await self.add_spent_outpoints([transaction], pending=True)
+            await self.add_pending_outputs([transaction])
+            if self.mempool is not None:
+                self.mempool.add(transaction, transaction.fees or 0)
         return True
 
+    async def enable_mempool(self, mempool: Mempool) -> None:
+        """Puts the mempool in front of pending_transactions, loading the transactions it persists."""
+        async with self.acquire() as connection:
+            txs = await connection.fetch('SELECT tx_bytes, fees FROM pending_transactions')
+        for tx in txs:
+            mempool.add(await Transaction.from_hex(tx['tx_bytes']), tx['fees'] or 0)
+        self.mempool = mempool
+
     async def remove_pending_transaction(self, tx_hash: str):
-        async with self.pool.acquire() as connection:
-            await connection.execute('DELETE FROM pending_transactions WHERE tx_hash = $1', tx_hash)
+        async with self.transaction(), self.acquire() as connection:
+            await connection.execute('DELETE FROM pending_transactions WHERE tx_hash = $1', bytes.fromhex(tx_hash))
+            await connection.execute('DELETE FROM pending_outputs WHERE tx_hash = $1', bytes.fromhex(tx_hash))
+            await connection.execute('DELETE FROM spent_outpoints WHERE spent_by = $1 AND pending', bytes.fromhex(tx_hash))
+            if self.mempool is not None:
+                self.mempool.remove([tx_hash])
 
     async def remove_pending_transactions_by_hash(self, tx_hashes: List[str]):
-        async with self.pool.acquire() as connection:
+        async with self.transaction(), self.acquire() as connection:
+            if self.mempool is not None:
+                self.mempool.remove(tx_hashes)
+            tx_hashes = [bytes.fromhex(tx_hash) for tx_hash in tx_hashes]
             await connection.execute('DELETE FROM pending_transactions WHERE tx_hash = ANY($1)', tx_hashes)
+            await connection.execute('DELETE FROM pending_outputs WHERE tx_hash = ANY($1)', tx_hashes)
+            await connection.execute('DELETE FROM spent_outpoints WHERE spent_by = ANY($1) AND pending', tx_hashes)
 
     async def remove_pending_transactions(self):
-        async with self.pool.acquire() as connection:
+        async with self.transaction(), self.acquire() as connection:
             await connection.execute('DELETE FROM pending_transactions')
+            await connection.execute('DELETE FROM pending_outputs')
+            await connection.execute('DELETE FROM spent_outpoints WHERE pending')
+            if self.mempool is not None:
+                self.mempool.clear()
+
+    async def evict_pending_transactions(self, tx_hashes: List[str] = (), outpoints: List[Tuple[str, int]] = ()) -> None:
+        """Removes the pending transactions tx_hashes and, with the mempool, the ones spending any of outpoints."""
+        tx_hashes = set(tx_hashes)
+        if self.mempool is not None:
+            tx_hashes.update(self.mempool.get_spenders(outpoints))
+        if tx_hashes:
+            await self.remove_pending_transactions_by_hash(list(tx_hashes))
 
     async def delete_blockchain(self):
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute('TRUNCATE transactions, blocks RESTART IDENTITY')
 
+    async def _delete_blocks_where(self, condition: str, *args):
+        async with self.acquire() as connection:
+            await connection.execute(f'DELETE FROM spent_outpoints WHERE NOT pending AND spent_by IN (SELECT tx_hash FROM transactions WHERE block_hash IN (SELECT hash FROM blocks WHERE {condition}))', *args)
+            await connection.execute(f'DELETE FROM blocks WHERE {condition}', *args)
+
+    async def _delete_blocks(self, height: int, condition: str, *args):
+        # the unspent outputs of the deleted transactions are removed in the database, so the cache is written and emptied
+        async with self.transaction():
+            await self.flush_unspent_outputs()
+            await self._delete_blocks_where(condition, *args)
+            if self.unspent_outputs_cache is not None:
+                self.unspent_outputs_cache.clear()
+                await self._set_unspent_outputs_block()
+            if self.chain_state is not None:
+                self.chain_state.disconnect(height)
+
     async def delete_block(self, id: int):
-        async with self.pool.acquire() as connection:
-            await connection.execute('DELETE FROM blocks WHERE id = $1', id)
+        await self._delete_blocks(id - 1, 'id = $1', id)
 
     async def delete_blocks(self, offset: int):
-        async with self.pool.acquire() as connection:
-            await connection.execute('DELETE FROM blocks WHERE id > $1', offset)
+        await self._delete_blocks(offset, 'id > $1', offset)
 
     async def get_pending_transactions_limit(self, limit: int = 1000, hex_only: bool = False) -> List[Union[Transaction, str]]:
-        async with self.pool.acquire() as connection:
-            txs = await connection.fetch(f'SELECT tx_hex FROM pending_transactions ORDER BY fees DESC LIMIT {limit}')
-        txs_hex = sorted(tx['tx_hex'] for tx in txs)
+        if self.mempool is not None:
+            # highest fee per byte first
+            transactions = self.mempool.select(limit)
+            return [transaction.hex() for transaction in transactions] if hex_only else [transaction.copy() for transaction in transactions]
+        async with self.acquire() as connection:
+            txs = await connection.fetch(f'SELECT tx_bytes FROM pending_transactions ORDER BY fees DESC LIMIT {limit}')
+        txs_hex = sorted(tx['tx_bytes'].hex() for tx in txs)
         if hex_only:
             return txs_hex
         return [await Transaction.from_hex(tx_hex) for tx_hex in txs_hex]
 
     async def add_transaction(self, transaction: Union[Transaction, CoinbaseTransaction], block_hash: str):
-        tx_hex = transaction.hex()
-        async with self.pool.acquire() as connection:
-            stmt = await connection.prepare('INSERT INTO transactions (block_hash, tx_hash, tx_hex, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)')
+        await self.fill_related_outputs([transaction])
+        tx_bytes = transaction.tobytes()
+        async with self.acquire() as connection:
+            stmt = await connection.prepare('INSERT INTO transactions (block_hash, tx_hash, tx_bytes, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)')
             await stmt.fetchval(
-                block_hash,
-                sha256(tx_hex),
-                tx_hex,
+                bytes.fromhex(block_hash),
+                bytes.fromhex(sha256(tx_bytes)),
+                tx_bytes,
                 [point_to_string(await tx_input.get_public_key()) for tx_input in transaction.inputs] if isinstance(transaction, Transaction) else [],
                 transaction.fees if isinstance(transaction, Transaction) else 0
             )
 
     async def add_transactions(self, transactions: List[Union[Transaction, CoinbaseTransaction]], block_hash: str):
+        await self.fill_related_outputs(transactions)
         data = []
         for transaction in transactions:
+            tx_bytes = transaction.tobytes()
             data.append((
-                block_hash,
-                transaction.hash(),
-                transaction.hex(),
+                bytes.fromhex(block_hash),
+                bytes.fromhex(sha256(tx_bytes)),
+                tx_bytes,
                 [point_to_string(await tx_input.get_public_key()) for tx_input in transaction.inputs] if isinstance(transaction, Transaction) else [],
                 transaction.fees if isinstance(transaction, Transaction) else 0
             ))
-        async with self.pool.acquire() as connection:
-            stmt = await connection.prepare('INSERT INTO transactions (block_hash, tx_hash, tx_hex, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)')
+        async with self.acquire() as connection:
+            stmt = await connection.prepare('INSERT INTO transactions (block_hash, tx_hash, tx_bytes, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)')
             await stmt.executemany(data)
 
-    async def add_block(self, id: int, block_hash: str, address: str, random: int, difficulty: Decimal, reward: Decimal, timestamp: Union[datetime, int]):
-        async with self.pool.acquire() as connection:
+    async def add_block(self, id: int, block_hash: str, address: str, random: int, difficulty: Decimal, reward: int, timestamp: Union[datetime, int]):
+        async with self.acquire() as connection:
             stmt = await connection.prepare('INSERT INTO blocks (id, hash, address, random, difficulty, reward, timestamp) VALUES ($1, $2, $3, $4, $5, $6, $7)')
             await stmt.fetchval(
                 id,
-                block_hash,
+                bytes.fromhex(block_hash),
                 address,
                 random,
                 difficulty,
                 reward,
                 timestamp if isinstance(timestamp, datetime) else datetime.utcfromtimestamp(timestamp)
             )
-        from .manager import Manager
-        Manager.difficulty = None
 
     async def get_transaction(self, tx_hash: str, check_signatures: bool = True) -> Union[Transaction, CoinbaseTransaction]:
-        async with self.pool.acquire() as connection:
-            res = tx = await connection.fetchrow('SELECT tx_hex, block_hash FROM transactions WHERE tx_hash = $1', tx_hash)
+        async with self.acquire() as connection:
+            res = tx = await connection.fetchrow('SELECT tx_bytes, block_hash FROM transactions WHERE tx_hash = $1', bytes.fromhex(tx_hash))
         if res is not None:
-            tx = await Transaction.from_hex(res['tx_hex'], check_signatures)
-            tx.block_hash = res['block_hash']
+            tx = await Transaction.from_hex(res['tx_bytes'], check_signatures)
+            tx.block_hash = res['block_hash'].hex()
         return tx
 
     async def get_pending_transaction(self, tx_hash: str, check_signatures: bool = True) -> Transaction:
-        async with self.pool.acquire() as connection:
-            res = await connection.fetchrow('SELECT tx_hex FROM pending_transactions WHERE tx_hash = $1', tx_hash)
-        return await Transaction.from_hex(res['tx_hex'], check_signatures) if res is not None else None
+        if self.mempool is not None:
+            transaction = self.mempool.get(tx_hash)
+            return transaction.copy() if transaction is not None else None
+        async with self.acquire() as connection:
+            res = await connection.fetchrow('SELECT tx_bytes FROM pending_transactions WHERE tx_hash = $1', bytes.fromhex(tx_hash))
+        return await Transaction.from_hex(res['tx_bytes'], check_signatures) if res is not None else None
 
     async def get_pending_transactions_by_hash(self, hashes: List[str], check_signatures: bool = True) -> List[Transaction]:
-        async with self.pool.acquire() as connection:
-            res = await connection.fetch('SELECT tx_hex FROM pending_transactions WHERE tx_hash = ANY($1)', hashes)
-        return [await Transaction.from_hex(tx['tx_hex'], check_signatures) for tx in res]
+        if self.mempool is not None:
+            return [self.mempool.get(tx_hash).copy() for tx_hash in hashes if tx_hash in self.mempool]
+        async with self.acquire() as connection:
+            res = await connection.fetch('SELECT tx_bytes FROM pending_transactions WHERE tx_hash = ANY($1)', [bytes.fromhex(tx_hash) for tx_hash in hashes])
+        return [await Transaction.from_hex(tx['tx_bytes'], check_signatures) for tx in res]
 
     async def get_transactions(self, tx_hashes: List[str]):
-        async with self.pool.acquire() as connection:
-            res = await connection.fetch('SELECT tx_hex FROM transactions WHERE tx_hash = ANY($1)', tx_hashes)
-        return {sha256(res['tx_hex']): await Transaction.from_hex(res['tx_hex']) for res in res}
-
-    async def get_transaction_by_contains_multi(self, contains: List[str], ignore: str = None):
-        async with self.pool.acquire() as connection:
-            if ignore is not None:
-                res = await connection.fetchrow(
-                    'SELECT tx_hash FROM transactions WHERE tx_hex LIKE ANY($1) AND tx_hash != $2 LIMIT 1',
-                    [f"%{contains}%" for contains in contains],
-                    ignore
-                )
-            else:
-                res = await connection.fetchrow(
-                    'SELECT tx_hash FROM transactions WHERE tx_hex LIKE ANY($1) LIMIT 1',
-                    [f"%{contains}%" for contains in contains],
-                )
-        return await Transaction.from_hex(res['tx_hex']) if res is not None else None
+        async with self.acquire() as connection:
+            res = await connection.fetch('SELECT tx_hash, tx_bytes, block_hash FROM transactions WHERE tx_hash = ANY($1)', [bytes.fromhex(tx_hash) for tx_hash in tx_hashes])
+        transactions = {}
+        for row in res:
+            tx = transactions[row['tx_hash'].hex()] = await Transaction.from_hex(row['tx_bytes'])
+            tx.block_hash = row['block_hash'].hex()
+        return transactions
 
     async def get_pending_transactions_by_contains(self, contains: str):
-        async with self.pool.acquire() as connection:
-            res = await connection.fetch('SELECT tx_hex FROM pending_transactions WHERE tx_hex LIKE $1 AND tx_hash != $2', f"%{contains}%", contains)
-        return [await Transaction.from_hex(res['tx_hex']) for res in res] if res is not None else None
-
-    async def get_pending_transaction_by_contains_multi(self, contains: List[str], ignore: str = None):
-        async with self.pool.acquire() as connection:
-            if ignore is not None:
-                res = await connection.fetchrow(
-                    'SELECT tx_hash FROM pending_transactions WHERE tx_hex LIKE ANY($1) AND tx_hash != $2 LIMIT 1',
-                    [f"%{contains}%" for contains in contains],
-                    ignore
-                )
-            else:
-                res = await connection.fetchrow(
-                    'SELECT tx_hash FROM pending_transactions WHERE tx_hex LIKE ANY($1) LIMIT 1',
-                    [f"%{contains}%" for contains in contains],
-                )
-        return await Transaction.from_hex(res['tx_hex']) if res is not None else None
+        async with self.acquire() as connection:
+            res = await connection.fetch('SELECT tx_bytes FROM pending_transactions WHERE position($1 IN tx_bytes) > 0 AND tx_hash != $1', bytes.fromhex(contains))
+        return [await Transaction.from_hex(res['tx_bytes']) for res in res] if res is not None else None
 
     async def get_last_block(self) -> dict:
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             last_block = await connection.fetchrow("SELECT * FROM blocks ORDER BY id DESC LIMIT 1")
         return normalize_block(last_block) if last_block is not None else None
 
     async def get_next_block_id(self) -> int:
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             last_id = await connection.fetchval('SELECT id FROM blocks ORDER BY id DESC LIMIT 1', column=0)
         last_id = last_id if last_id is not None else 0
         return last_id + 1
 
     async def get_block(self, block_hash: str) -> dict:
-        async with self.pool.acquire() as connection:
-            block = await connection.fetchrow('SELECT * FROM blocks WHERE hash = $1', block_hash)
+        if self.chain_state is not None:
+            return self.chain_state.headers.get_block_by_hash(block_hash)
+        async with self.acquire() as connection:
+            block = await connection.fetchrow('SELECT * FROM blocks WHERE hash = $1', bytes.fromhex(block_hash))
         return normalize_block(block) if block is not None else None
 
     async def get_blocks(self, offset: int, limit: int) -> list:
-        async with self.pool.acquire() as connection:
-            transactions: list = await connection.fetch(f'SELECT tx_hex, block_hash FROM transactions WHERE block_hash = ANY(SELECT hash FROM blocks WHERE id >= $1 ORDER BY id LIMIT $2)', offset, limit)
+        async with self.acquire() as connection:
+            transactions: list = await connection.fetch(f'SELECT tx_bytes, block_hash FROM transactions WHERE block_hash = ANY(SELECT hash FROM blocks WHERE id >= $1 ORDER BY id LIMIT $2)', offset, limit)
             blocks = await connection.fetch(f'SELECT * FROM blocks WHERE id >= $1 ORDER BY id LIMIT $2', offset, limit)
         result = []
         for block in blocks:
+            block_hash = block['hash']
             block = normalize_block(block)
             txs = []
             for transaction in transactions.copy():
-                if transaction['block_hash'] == block['hash']:
+                if transaction['block_hash'] == block_hash:
                     transactions.remove(transaction)
-                    if isinstance(await Transaction.from_hex(transaction['tx_hex']), Transaction):
-                        txs.append(transaction['tx_hex'])
+                    if isinstance(await Transaction.from_hex(transaction['tx_bytes']), Transaction):
+                        txs.append(transaction['tx_bytes'].hex())
             result.append({
                 'block': block,
                 'transactions': txs
@@ -237,101 +412,320 @@ class Database:
         return result
 
     async def get_block_by_id(self, block_id: int) -> dict:
-        async with self.pool.acquire() as connection:
+        if self.chain_state is not None:
+            return self.chain_state.headers.get_block(block_id)
+        async with self.acquire() as connection:
             block = await connection.fetchrow('SELECT * FROM blocks WHERE id = $1', block_id)
         return normalize_block(block) if block is not None else None
 
-    async def get_block_transactions(self, block_hash: str, check_signatures: bool = True) -> List[Union[Transaction, CoinbaseTransaction]]:
-        async with self.pool.acquire() as connection:
-            txs = await connection.fetch('SELECT * FROM transactions WHERE block_hash = $1', block_hash)
-        return [await Transaction.from_hex(tx['tx_hex'], check_signatures) for tx in txs] if txs is not None else None
-
-    async def add_unspent_outputs(self, outputs: List[Tuple[str, int]]) -> None:
-        async with self.pool.acquire() as connection:
-            await connection.executemany('INSERT INTO unspent_outputs (tx_hash, index) VALUES ($1, $2)', outputs)
+    async def get_block_headers(self, offset: int, limit: int) -> list:
+        async with self.acquire() as connection:
+            blocks = await connection.fetch('SELECT * FROM blocks WHERE id >= $1 ORDER BY id LIMIT $2', offset, limit)
+        return [normalize_block(block) for block in blocks]
 
-    async def add_unspent_transactions_outputs(self, transactions: List[Transaction]) -> None:
-        outputs = sum([[(transaction.hash(), index) for index in range(len(transaction.outputs))] for transaction in transactions], [])
+    async def get_block_transactions(self, block_hash: str, check_signatures: bool = True) -> List[Union[Transaction, CoinbaseTransaction]]:
+        async with self.acquire() as connection:
+            txs = await connection.fetch('SELECT * FROM transactions WHERE block_hash = $1', bytes.fromhex(block_hash))
+        return [await Transaction.from_hex(tx['tx_bytes'], check_signatures) for tx in txs] if txs is not None else None
+
+    async def _insert_unspent_outputs(self, outputs: List[Tuple[str, int, bytes, int]]) -> None:
+        outputs = [(bytes.fromhex(tx_hash), index, address_bytes, amount) for tx_hash, index, address_bytes, amount in outputs]
+        async with self.acquire() as connection:
+            await connection.copy_records_to_table('unspent_outputs', records=outputs, columns=('tx_hash', 'index', 'address_bytes', 'amount'))
+
+    async def _delete_unspent_outputs(self, outputs: List[Tuple[str, int]]) -> None:
+        async with self.acquire() as connection:
+            await connection.execute('DELETE FROM unspent_outputs WHERE (tx_hash, index) = ANY($1::tx_output[])', [(bytes.fromhex(tx_hash), index) for tx_hash, index in outputs])
+
+    async def _select_unspent_outputs_info(self, outputs: List[Tuple[str, int]]) -> Dict[Tuple[str, int], TransactionOutput]:
+        async with self.acquire() as connection:
+            results = await connection.fetch('SELECT tx_hash, index, address_bytes, amount FROM unspent_outputs WHERE (tx_hash, index) = ANY($1::tx_output[])', [(bytes.fromhex(tx_hash), index) for tx_hash, index in outputs])
+        return {(row['tx_hash'].hex(), row['index']): TransactionOutput(bytes_to_string(row['address_bytes']), row['amount']) for row in results}
+
+    async def add_unspent_outputs(self, outputs: List[Tuple[str, int, bytes, int]]) -> None:
+        """Writes the outputs to the database directly, bypassing the cache."""
+        if self.unspent_outputs_cache is not None:
+            self.unspent_outputs_cache.discard([(tx_hash, index) for tx_hash, index, _, _ in outputs])
+        await self._insert_unspent_outputs(outputs)
+
+    async def add_unspent_transactions_outputs(self, transactions: List[Union[Transaction, CoinbaseTransaction]]) -> None:
+        if self.unspent_outputs_cache is not None:
+            self.unspent_outputs_cache.add({(transaction.hash(), index): tx_output for transaction in transactions for index, tx_output in enumerate(transaction.outputs)})
+            return
+        outputs = sum([[(transaction.hash(), index, tx_output.address_bytes, tx_output.amount) for index, tx_output in enumerate(transaction.outputs)] for transaction in transactions], [])
+        await self._insert_unspent_outputs(outputs)
+
+    async def restore_unspent_outputs(self, transactions: List[Transaction]) -> None:
+        inputs = sum([[(tx_input.tx_hash, tx_input.index) for tx_input in transaction.inputs] for transaction in transactions], [])
+        if not inputs:
+            return
+        input_txs = await self.get_transactions(list({tx_hash for tx_hash, _ in inputs}))
+        outputs = []
+        for tx_hash, index in inputs:
+            if tx_hash in input_txs:
+                tx_output = input_txs[tx_hash].outputs[index]
+                outputs.append((tx_hash, index, tx_output.address_bytes, tx_output.amount))
         await self.add_unspent_outputs(outputs)
 
     async def remove_unspent_outputs(self, transactions: List[Transaction]) -> None:
         inputs = sum([[(tx_input.tx_hash, tx_input.index) for tx_input in transaction.inputs] for transaction in transactions], [])
-        async with self.pool.acquire() as connection:
-            await connection.execute('DELETE FROM unspent_outputs WHERE (tx_hash, index) = ANY($1::tx_output[])', inputs)
+        if self.unspent_outputs_cache is not None:
+            self.unspent_outputs_cache.remove(inputs)
+            return
+        await self._delete_unspent_outputs(inputs)
 
     async def get_unspent_outputs(self, outputs: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
-        async with self.pool.acquire() as connection:
-            results = await connection.fetch('SELECT tx_hash, index FROM unspent_outputs WHERE (tx_hash, index) = ANY($1::tx_output[])', outputs)
-            return [(row['tx_hash'], row['index']) for row in results]
+        return list(await self.get_unspent_outputs_info(outputs))
+
+    async def get_unspent_outputs_info(self, outputs: List[Tuple[str, int]]) -> Dict[Tuple[str, int], TransactionOutput]:
+        cache = self.unspent_outputs_cache
+        if cache is None:
+            return await self._select_unspent_outputs_info(outputs)
+        result, missing = cache.get(outputs)
+        if missing:
+            version = cache.version
+            found = await self._select_unspent_outputs_info(missing)
+            cache.load(found, version)
+            result.update(found)
+        return result
 
-    async def get_unspent_outputs_from_all_transactions(self):
-        async with self.pool.acquire() as connection:
-            txs = await connection.fetch('SELECT tx_hex FROM transactions WHERE true')
-            transactions = {sha256(tx['tx_hex']): await Transaction.from_hex(tx['tx_hex'], False) for tx in txs}
-            outputs = sum([[(transaction.hash(), index) for index in range(len(transaction.outputs))] for transaction in transactions.values()], [])
-            for tx_hash, transaction in transactions.items():
-                if isinstance(transaction, CoinbaseTransaction):
-                    continue
-                for tx_input in transaction.inputs:
-                    if (tx_input.tx_hash, tx_input.index) in outputs:
-                        outputs.remove((tx_input.tx_hash, tx_input.index))
-            return outputs
+    async def flush_unspent_outputs(self) -> None:
+        """Writes the outputs added and spent in the cache since the last flush."""
+        cache = self.unspent_outputs_cache
+        if cache is None or not cache.dirty:
+            return
+        async with self.transaction():
+            added, removed = cache.flushed()
+            await self._delete_unspent_outputs(list(removed))
+            await self._insert_unspent_outputs([(tx_hash, index, tx_output.address_bytes, tx_output.amount) for (tx_hash, index), tx_output in added.items()])
+            await self._set_unspent_outputs_block()
+
+    async def _set_unspent_outputs_block(self) -> None:
+        async with self.acquire() as connection:
+            await connection.execute('UPDATE unspent_outputs_state SET block_id = (SELECT COALESCE(MAX(id), 0) FROM blocks)')
+
+    async def get_assume_valid_state(self) -> Union[Tuple[int, str], None]:
+        """First block synced without verifying its signatures and the hash of the checkpoint it was synced to, if not checked yet."""
+        async with self.acquire() as connection:
+            row = await connection.fetchrow('SELECT block_id, checkpoint_hash FROM assume_valid_state')
+        return (row['block_id'], row['checkpoint_hash'].hex()) if row is not None else None
+
+    async def set_assume_valid_state(self, block_id: int = None, checkpoint_hash: str = None) -> None:
+        async with self.acquire() as connection:
+            await connection.execute('DELETE FROM assume_valid_state')
+            if block_id is not None:
+                await connection.execute('INSERT INTO assume_valid_state (block_id, checkpoint_hash) VALUES ($1, $2)', block_id, bytes.fromhex(checkpoint_hash))
+
+    async def enable_unspent_outputs_cache(self, cache: UnspentOutputsCache) -> None:
+        """
+        Puts the cache in front of unspent_outputs. unspent_outputs_state keeps the last block whose outputs were flushed,
+        the blocks added after it, if the node stopped without flushing, are replayed first.
+        """
+        async with self.acquire() as connection:
+            await connection.execute('CREATE TABLE IF NOT EXISTS unspent_outputs_state (block_id INTEGER NOT NULL)')
+            block_id = await connection.fetchval('SELECT block_id FROM unspent_outputs_state')
+            if block_id is None:
+                await connection.execute('INSERT INTO unspent_outputs_state (block_id) VALUES (0)')
+                block_id = await self.get_next_block_id() - 1
+        if block_id < await self.get_next_block_id() - 1:
+            print(f'Replaying unspent outputs of blocks after {block_id}')
+            async with self.acquire() as connection:
+                txs = await connection.fetch('SELECT tx_bytes FROM transactions INNER JOIN blocks ON (transactions.block_hash = blocks.hash) WHERE blocks.id > $1', block_id)
+            transactions = [await Transaction.from_hex(tx['tx_bytes'], False) for tx in txs]
+            outputs = [(transaction.hash(), index, tx_output.address_bytes, tx_output.amount) for transaction in transactions for index, tx_output in enumerate(transaction.outputs)]
+            async with self.transaction():
+                await self._delete_unspent_outputs([(tx_hash, index) for tx_hash, index, _, _ in outputs])
+                await self._insert_unspent_outputs(outputs)
+                await self._delete_unspent_outputs([(tx_input.tx_hash, tx_input.index) for transaction in transactions if isinstance(transaction, Transaction) for tx_input in transaction.inputs])
+        await self._set_unspent_outputs_block()
+        self.unspent_outputs_cache = cache
+
+    async def get_unspent_outputs_from_all_transactions(self) -> List[Tuple[str, int, bytes, int]]:
+        async with self.acquire() as connection:
+            txs = await connection.fetch('SELECT tx_hash, tx_bytes FROM transactions WHERE true')
+        transactions = {tx['tx_hash'].hex(): await Transaction.from_hex(tx['tx_bytes'], False) for tx in txs}
+        spent_outputs = set()
+        for transaction in transactions.values():
+            if isinstance(transaction, CoinbaseTransaction):
+                continue
+            spent_outputs.update((tx_input.tx_hash, tx_input.index) for tx_input in transaction.inputs)
+        outputs = []
+        for tx_hash, transaction in transactions.items():
+            for index, tx_output in enumerate(transaction.outputs):
+                if (tx_hash, index) not in spent_outputs:
+                    outputs.append((tx_hash, index, tx_output.address_bytes, tx_output.amount))
+        return outputs
+
+    async def add_outputs(self, outputs: List[Tuple[str, int, str, int, str]]) -> None:
+        outputs = [(bytes.fromhex(tx_hash), index, address, amount, bytes.fromhex(spent_by) if spent_by is not None else None) for tx_hash, index, address, amount, spent_by in outputs]
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO outputs (tx_hash, index, address, amount, spent_by) VALUES ($1, $2, $3, $4, $5)', outputs)
+
+    async def add_transactions_outputs(self, transactions: List[Union[Transaction, CoinbaseTransaction]]) -> None:
+        outputs = sum([[(transaction.hash(), index, point_to_string(tx_output.public_key), tx_output.amount, None) for index, tx_output in enumerate(transaction.outputs)] for transaction in transactions], [])
+        await self.add_outputs(outputs)
+
+    async def spend_outputs(self, transactions: List[Transaction]) -> None:
+        inputs = sum([[(bytes.fromhex(transaction.hash()), bytes.fromhex(tx_input.tx_hash), tx_input.index) for tx_input in transaction.inputs] for transaction in transactions], [])
+        async with self.acquire() as connection:
+            await connection.executemany('UPDATE outputs SET spent_by = $1 WHERE tx_hash = $2 AND index = $3', inputs)
+
+    async def add_spent_outpoints(self, transactions: List[Transaction], pending: bool = False) -> None:
+        outpoints = sum([[(bytes.fromhex(tx_input.tx_hash), tx_input.index, bytes.fromhex(transaction.hash()), pending) for tx_input in transaction.inputs] for transaction in transactions], [])
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO spent_outpoints (tx_hash, index, spent_by, pending) VALUES ($1, $2, $3, $4)', outpoints)
+
+    async def add_pending_outputs(self, transactions: List[Transaction]) -> None:
+        outputs = [(bytes.fromhex(transaction.hash()), point_to_string(tx_output.public_key), tx_output.amount) for transaction in transactions for tx_output in transaction.outputs]
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO pending_outputs (tx_hash, address, amount) VALUES ($1, $2, $3)', outputs)
+
+    async def fill_pending_outputs(self) -> None:
+        async with self.acquire() as connection:
+            txs = await connection.fetch('SELECT tx_bytes FROM pending_transactions')
+        await self.add_pending_outputs([await Transaction.from_hex(tx['tx_bytes'], False) for tx in txs])
+
+    async def get_outpoints_spender(self, outpoints: List[Tuple[str, int]], pending: bool = False, ignore: str = None) -> Union[str, None]:
+        async with self.acquire() as connection:
+            spender = await connection.fetchval(
+                'SELECT spent_by FROM spent_outpoints WHERE (tx_hash, index) = ANY($1::tx_output[]) AND pending = $2 AND spent_by IS DISTINCT FROM $3 LIMIT 1',
+                [(bytes.fromhex(tx_hash), index) for tx_hash, index in outpoints],
+                pending,
+                bytes.fromhex(ignore) if ignore is not None else None
+            )
+        return spender.hex() if spender is not None else None
+
+    async def fill_spent_outpoints(self) -> None:
+        async with self.acquire() as connection:
+            await connection.execute('INSERT INTO spent_outpoints (tx_hash, index, spent_by, pending) SELECT tx_hash, index, spent_by, false FROM outputs WHERE spent_by IS NOT NULL')
+            txs = await connection.fetch('SELECT tx_bytes FROM pending_transactions')
+        await self.add_spent_outpoints([await Transaction.from_hex(tx['tx_bytes']) for tx in txs], pending=True)
+
+    async def get_outputs_from_all_transactions(self) -> List[Tuple[str, int, str, int, str]]:
+        async with self.acquire() as connection:
+            txs = await connection.fetch('SELECT tx_hash, tx_bytes FROM transactions WHERE true')
+        transactions = {tx['tx_hash'].hex(): await Transaction.from_hex(tx['tx_bytes'], False) for tx in txs}
+        spent_by = {}
+        for tx_hash, transaction in transactions.items():
+            if isinstance(transaction, CoinbaseTransaction):
+                continue
+            for tx_input in transaction.inputs:
+                spent_by[(tx_input.tx_hash, tx_input.index)] = tx_hash
+        outputs = []
+        for tx_hash, transaction in transactions.items():
+            for index, tx_output in enumerate(transaction.outputs):
+                outputs.append((tx_hash, index, point_to_string(tx_output.public_key), tx_output.amount, spent_by.get((tx_hash, index))))
+        return outputs
+
+    @staticmethod
+    def _bulk_ingest_records(bulk_ingest) -> Dict[str, list]:
+        """Rows of a BulkIngest with the hashes as bytes, as they are stored."""
+        unhex = lambda tx_hash: bytes.fromhex(tx_hash) if tx_hash is not None else None
+        return {
+            'blocks': [(id, unhex(block_hash), *block) for id, block_hash, *block in bulk_ingest.blocks],
+            'transactions': [(unhex(block_hash), unhex(tx_hash), bytes.fromhex(tx_hex), *transaction) for block_hash, tx_hash, tx_hex, *transaction in bulk_ingest.transactions],
+            'outputs': [(unhex(tx_hash), index, address, amount, unhex(spent_by)) for tx_hash, index, address, amount, spent_by in bulk_ingest.outputs.values()],
+            'spent_by': [(unhex(spent_by), unhex(tx_hash), index) for spent_by, tx_hash, index in bulk_ingest.spent_by],
+            'spent_outpoints': [(unhex(tx_hash), index, unhex(spent_by), pending) for tx_hash, index, spent_by, pending in bulk_ingest.spent_outpoints],
+        }
+
+    async def add_bulk_ingest(self, bulk_ingest) -> None:
+        """Writes the rows of the blocks validated in a BulkIngest, table by table."""
+        records = self._bulk_ingest_records(bulk_ingest)
+        async with self.acquire() as connection:
+            await connection.copy_records_to_table('blocks', records=records['blocks'], columns=('id', 'hash', 'address', 'random', 'difficulty', 'reward', 'timestamp'))
+            await connection.copy_records_to_table('transactions', records=records['transactions'], columns=('block_hash', 'tx_hash', 'tx_bytes', 'inputs_addresses', 'fees'))
+            await connection.copy_records_to_table('outputs', records=records['outputs'], columns=('tx_hash', 'index', 'address', 'amount', 'spent_by'))
+            await connection.executemany('UPDATE outputs SET spent_by = $1 WHERE tx_hash = $2 AND index = $3', records['spent_by'])
+            await connection.copy_records_to_table('spent_outpoints', records=records['spent_outpoints'], columns=('tx_hash', 'index', 'spent_by', 'pending'))
+        await self._add_bulk_ingest_unspent_outputs(bulk_ingest)
+        await self.evict_pending_transactions(bulk_ingest.transactions_hashes, [outpoint[:2] for outpoint in bulk_ingest.spent_outpoints])
+
+    async def _add_bulk_ingest_unspent_outputs(self, bulk_ingest) -> None:
+        if self.unspent_outputs_cache is not None:
+            self.unspent_outputs_cache.remove(list(bulk_ingest.spent_outputs))
+            self.unspent_outputs_cache.add(bulk_ingest.unspent_outputs)
+            return
+        await self._delete_unspent_outputs(list(bulk_ingest.spent_outputs))
+        await self._insert_unspent_outputs(bulk_ingest.get_unspent_outputs())
+
+    async def drop_secondary_indexes(self) -> None:
+        async with self.acquire() as connection:
+            for name in self.secondary_indexes:
+                await connection.execute(f'DROP INDEX IF EXISTS {name}')
+
+    async def create_secondary_indexes(self) -> None:
+        async with self.acquire() as connection:
+            for statement in self.secondary_indexes.values():
+                await connection.execute(statement)
+
+    async def migrate_binary_storage(self) -> None:
+        """Converts the hex columns of a database created before transactions and hashes were stored as bytes."""
+        async with self.transaction():
+            async with self.acquire() as connection:
+                rows = await connection.fetch('SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = current_schema()')
+                columns = {(row['table_name'], row['column_name']) for row in rows}
+                if ('transactions', 'tx_hex') not in columns:
+                    return
+                foreign_keys = [foreign_key for foreign_key in BINARY_FOREIGN_KEYS if foreign_key[:2] in columns]
+                for table, column, _ in foreign_keys:
+                    await connection.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_{column}_fkey')
+                for table, table_columns in BINARY_COLUMNS.items():
+                    table_columns = [column for column in table_columns if (table, column) in columns]
+                    if table_columns:
+                        await connection.execute(f'ALTER TABLE {table} ' + ', '.join(f"ALTER COLUMN {column} TYPE BYTEA USING decode({column}, 'hex')" for column in table_columns))
+                    if 'tx_hex' in table_columns:
+                        await connection.execute(f'ALTER TABLE {table} RENAME COLUMN tx_hex TO tx_bytes')
+                if await connection.fetchval("SELECT true FROM pg_type WHERE typname = 'tx_output'"):
+                    await connection.execute('ALTER TYPE tx_output ALTER ATTRIBUTE tx_hash TYPE BYTEA')
+                for table, column, reference in foreign_keys:
+                    await connection.execute(f'ALTER TABLE {table} ADD FOREIGN KEY ({column}) REFERENCES {reference}')
+
+    async def migrate_integer_amounts(self) -> None:
+        """Converts the decimal amount columns of a database created before amounts were stored in smallest units."""
+        async with self.transaction():
+            async with self.acquire() as connection:
+                rows = await connection.fetch("SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = current_schema() AND data_type = 'numeric'")
+                columns = {(row['table_name'], row['column_name']) for row in rows}
+                for table, table_columns in AMOUNT_COLUMNS.items():
+                    table_columns = [column for column in table_columns if (table, column) in columns]
+                    if table_columns:
+                        await connection.execute(f'ALTER TABLE {table} ' + ', '.join(f'ALTER COLUMN {column} TYPE BIGINT USING ({column} * {SMALLEST})::BIGINT' for column in table_columns))
 
     async def get_address_transactions(self, address: str, check_pending_txs: bool = False, check_signatures: bool = False, limit: int = 50) -> List[Union[Transaction, CoinbaseTransaction]]:
         point = string_to_point(address)
-        search = ['%' + point_to_bytes(string_to_point(address), address_format).hex() + '%' for address_format in list(AddressFormat)]
-        addresses = [point_to_string(point, address_format) for address_format in list(AddressFormat)]
-        async with self.pool.acquire() as connection:
-            txs = await connection.fetch('SELECT tx_hex, blocks.id AS block_no FROM transactions INNER JOIN blocks ON (transactions.block_hash = blocks.hash) WHERE tx_hex LIKE ANY($1) OR $2 && inputs_addresses ORDER BY block_no DESC LIMIT $3', search, addresses, limit)
+        async with self.acquire() as connection:
+            txs = await connection.fetch('SELECT tx_bytes, blocks.id AS block_no FROM transactions INNER JOIN blocks ON (transactions.block_hash = blocks.hash) WHERE tx_hash IN (SELECT tx_hash FROM outputs WHERE address = $1 UNION SELECT spent_by FROM outputs WHERE address = $1) ORDER BY block_no DESC LIMIT $2', point_to_string(point), limit)
             if check_pending_txs:
-                txs = await connection.fetch("SELECT tx_hex FROM pending_transactions WHERE tx_hex LIKE ANY($1) OR $1 && inputs_addresses", addresses) + txs
-        return [await Transaction.from_hex(tx['tx_hex'], check_signatures) for tx in txs]
+                txs = await connection.fetch(
+                    'SELECT tx_bytes FROM pending_transactions WHERE tx_hash IN (SELECT tx_hash FROM pending_outputs WHERE address = $1 UNION '
+                    'SELECT spent_outpoints.spent_by FROM outputs INNER JOIN spent_outpoints ON (spent_outpoints.tx_hash = outputs.tx_hash AND spent_outpoints.index = outputs.index) WHERE outputs.address = $1 AND spent_outpoints.pending)',
+                    point_to_string(point)
+                ) + txs
+        return [await Transaction.from_hex(tx['tx_bytes'], check_signatures) for tx in txs]
 
     async def get_spendable_outputs(self, address: str, check_pending_txs: bool = False) -> List[TransactionInput]:
         point = string_to_point(address)
-        search = ['%'+point_to_bytes(string_to_point(address), address_format).hex()+'%' for address_format in list(AddressFormat)]
-        addresses = [point_to_string(point, address_format) for address_format in list(AddressFormat)]
-        async with self.pool.acquire() as connection:
-            txs = await connection.fetch('SELECT tx_hex FROM transactions WHERE tx_hex LIKE ANY($1) AND tx_hash = ANY(SELECT tx_hash FROM unspent_outputs)', search)
-            spender_txs = await connection.fetch("SELECT tx_hex FROM pending_transactions WHERE $1 && inputs_addresses", addresses) if check_pending_txs else []
+        # without the mempool, the outputs spent by pending transactions are left out through spent_outpoints
+        not_pending = ' AND NOT EXISTS (SELECT 1 FROM spent_outpoints WHERE spent_outpoints.tx_hash = outputs.tx_hash AND spent_outpoints.index = outputs.index AND pending)' if check_pending_txs and self.mempool is None else ''
+        async with self.acquire() as connection:
+            outputs = await connection.fetch(f'SELECT tx_hash, index, amount FROM outputs WHERE address = $1 AND spent_by IS NULL{not_pending}', point_to_string(point))
+        pending_spent_outputs = self.mempool.spenders if check_pending_txs and self.mempool is not None else set()
         inputs = []
-        outputs = []
-        for tx in txs:
-            tx_hash = sha256(tx['tx_hex'])
-            tx = await Transaction.from_hex(tx['tx_hex'], check_signatures=False)
-            for i, tx_output in enumerate(tx.outputs):
-                if tx_output.address in addresses:
-                    tx_input = TransactionInput(tx_hash, i, transaction=tx, amount=tx_output.amount)
-                    outputs.append((tx_hash, i))
-                    inputs.append(tx_input)
-        for spender_tx in spender_txs:
-            spender_tx = await Transaction.from_hex(spender_tx['tx_hex'], check_signatures=False)
-            for tx_input in spender_tx.inputs:
-                if (tx_input.tx_hash, tx_input.index) in outputs:
-                    outputs.remove((tx_input.tx_hash, tx_input.index))
-
-        unspent_outputs = await self.get_unspent_outputs(outputs)
-
-        final = []
-        for tx_input in inputs:
-            if (tx_input.tx_hash, tx_input.index) in unspent_outputs:
-                final.append(tx_input)
-
-        return final
-
-    async def get_address_balance(self, address: str, check_pending_txs: bool = False) -> Decimal:
-        balance = Decimal(0)
+        for output in outputs:
+            if (output['tx_hash'].hex(), output['index']) in pending_spent_outputs:
+                continue
+            tx_input = TransactionInput(output['tx_hash'].hex(), output['index'], amount=output['amount'])
+            tx_input.public_key = point
+            inputs.append(tx_input)
+        return inputs
+
+    async def get_address_balance(self, address: str, check_pending_txs: bool = False) -> int:
+        balance = 0
         point = string_to_point(address)
-        search = ['%'+point_to_bytes(string_to_point(address), address_format).hex()+'%' for address_format in list(AddressFormat)]
-        addresses = [point_to_string(point, address_format) for address_format in list(AddressFormat)]
         for input in await self.get_spendable_outputs(address, check_pending_txs=check_pending_txs):
             balance += input.amount
         if check_pending_txs:
-            async with self.pool.acquire() as connection:
-                txs = await connection.fetch('SELECT tx_hex FROM pending_transactions WHERE tx_hex LIKE ANY($1)', search)
-            for tx in txs:
-                tx = await Transaction.from_hex(tx['tx_hex'], check_signatures=False)
-                for i, tx_output in enumerate(tx.outputs):
-                    if tx_output.address in addresses:
-                        balance += tx_output.amount
+            async with self.acquire() as connection:
+                balance += await connection.fetchval('SELECT COALESCE(SUM(amount), 0) FROM pending_outputs WHERE address = $1', point_to_string(point))
         return balance
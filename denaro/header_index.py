@@ -0,0 +1,81 @@
+from array import array
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+
+class HeaderIndex:
+    """
+    Headers of the chain in arrays indexed by height, plus the height of each block hash.
+    Difficulty is stored as an integer and every address once, which keeps a header around 200 bytes.
+    """
+
+    def __init__(self):
+        self.hashes = bytearray()
+        self.heights: Dict[bytes, int] = {}
+        self.timestamps = array('I')
+        self.difficulties = array('H')
+        self.randoms = array('I')
+        self.rewards = array('Q')
+        self.address_ids = array('I')
+        self.addresses: List[str] = []
+        self.address_index: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    async def load(database, page_size: int = 100_000) -> 'HeaderIndex':
+        headers = HeaderIndex()
+        while blocks := await database.get_block_headers(len(headers) + 1, page_size):
+            for block in blocks:
+                headers.append(block)
+        return headers
+
+    def append(self, block: dict):
+        assert block['id'] == len(self) + 1
+        block_hash = bytes.fromhex(block['hash'])
+        self.hashes += block_hash
+        self.heights[block_hash] = block['id']
+        self.timestamps.append(block['timestamp'])
+        self.difficulties.append(int(block['difficulty'] * 10))
+        self.randoms.append(block['random'])
+        self.rewards.append(block['reward'])
+        address_id = self.address_index.get(block['address'])
+        if address_id is None:
+            address_id = self.address_index[block['address']] = len(self.addresses)
+            self.addresses.append(block['address'])
+        self.address_ids.append(address_id)
+
+    def truncate(self, height: int) -> List[dict]:
+        """Removes the headers above height and returns them."""
+        removed = [self.get_block(id) for id in range(height + 1, len(self) + 1)]
+        for block in removed:
+            del self.heights[bytes.fromhex(block['hash'])]
+        del self.hashes[height * 32:]
+        for values in (self.timestamps, self.difficulties, self.randoms, self.rewards, self.address_ids):
+            del values[height:]
+        return removed
+
+    def get_block(self, height: int) -> Optional[dict]:
+        if not 1 <= height <= len(self):
+            return None
+        i = height - 1
+        return {
+            'id': height,
+            'hash': self.hashes[i * 32:height * 32].hex(),
+            'address': self.addresses[self.address_ids[i]],
+            'random': self.randoms[i],
+            'difficulty': Decimal(self.difficulties[i]) / 10,
+            'reward': self.rewards[i],
+            'timestamp': self.timestamps[i]
+        }
+
+    def get_height(self, block_hash: str) -> Optional[int]:
+        return self.heights.get(bytes.fromhex(block_hash))
+
+    def get_block_by_hash(self, block_hash: str) -> Optional[dict]:
+        height = self.get_height(block_hash)
+        return self.get_block(height) if height is not None else None
+
+    def get_timestamp(self, height: int) -> int:
+        return self.timestamps[height - 1]
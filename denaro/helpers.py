@@ -5,6 +5,7 @@ import sys
 from enum import Enum
 from math import ceil
 from datetime import datetime, timezone
+from decimal import Decimal
 from typing import Union
 
 import base58
@@ -12,7 +13,8 @@ from fastecdsa.point import Point
 from fastecdsa.util import mod_sqrt
 from icecream import ic
 
-from .constants import ENDIAN, CURVE
+from .constants import ENDIAN, CURVE, SMALLEST
+from .lru_cache import LRUCache
 
 _print = print
 
@@ -46,13 +48,30 @@ def byte_length(i: int):
     return ceil(i.bit_length() / 8.0)
 
 
+def decimal_to_smallest(amount: Union[Decimal, str]) -> int:
+    """Converts an amount of coins to the integer count of its smallest unit, which is how amounts are handled."""
+    amount = Decimal(amount) * SMALLEST
+    assert amount % 1 == 0
+    return int(amount)
+
+
+def smallest_to_decimal(amount: int) -> Decimal:
+    """Converts an amount in smallest units to coins, only done when rendering it."""
+    return Decimal(amount) / SMALLEST
+
+
 def normalize_block(block) -> dict:
     block = dict(block)
+    block['hash'] = block['hash'].hex()
     block['address'] = block['address'].strip(' ')
     block['timestamp'] = int(block['timestamp'].replace(tzinfo=timezone.utc).timestamp())
     return block
 
 
+def block_to_json(block: dict) -> dict:
+    return {**block, 'reward': smallest_to_decimal(block['reward'])} if 'reward' in block else block
+
+
 def x_to_y(x: int, is_odd: bool = False):
     a, b, p = CURVE.a, CURVE.b, CURVE.p
     y2 = x ** 3 + a * x + b
@@ -65,16 +84,19 @@ class AddressFormat(Enum):
     COMPRESSED = 'compressed'
 
 
-def point_to_bytes(point: Point, address_format: AddressFormat = AddressFormat.FULL_HEX) -> bytes:
-    if address_format is AddressFormat.FULL_HEX:
-        return point.x.to_bytes(32, byteorder=ENDIAN) + point.y.to_bytes(32, byteorder=ENDIAN)
-    elif address_format is AddressFormat.COMPRESSED:
-        return string_to_bytes(point_to_string(point, AddressFormat.COMPRESSED))
-    else:
-        raise NotImplementedError()
+# decompressed point, compressed string and hex string of recently seen addresses, by address bytes.
+# Compressed strings are keys too, base58 decoding costs about as much as encoding
+address_cache: LRUCache = LRUCache(100_000)
 
 
-def bytes_to_point(point_bytes: bytes) -> Point:
+def _address_entry(point: Point) -> tuple:
+    x, y = point.x, point.y
+    compressed = base58.b58encode((42 if y % 2 == 0 else 43).to_bytes(1, ENDIAN) + x.to_bytes(32, ENDIAN))
+    compressed = compressed if isinstance(compressed, str) else compressed.decode('utf-8')
+    return point, compressed, (x.to_bytes(32, ENDIAN) + y.to_bytes(32, ENDIAN)).hex()
+
+
+def _decode_point(point_bytes: bytes) -> Point:
     if len(point_bytes) == 64:
         x, y = int.from_bytes(point_bytes[:32], ENDIAN), int.from_bytes(point_bytes[32:], ENDIAN)
         return Point(x, y, CURVE)
@@ -86,34 +108,71 @@ def bytes_to_point(point_bytes: bytes) -> Point:
         raise NotImplementedError()
 
 
+def get_address_entry(point_bytes: bytes) -> tuple:
+    """Returns (point, compressed string, hex string) of the address encoded in point_bytes."""
+    cache = address_cache
+    entry = cache.get(point_bytes) if cache is not None else None
+    if entry is None:
+        entry = _address_entry(_decode_point(point_bytes))
+        if cache is not None:
+            cache.put(point_bytes, entry)
+    return entry
+
+
+def point_to_bytes(point: Point, address_format: AddressFormat = AddressFormat.FULL_HEX) -> bytes:
+    if address_format is AddressFormat.FULL_HEX:
+        return point.x.to_bytes(32, byteorder=ENDIAN) + point.y.to_bytes(32, byteorder=ENDIAN)
+    elif address_format is AddressFormat.COMPRESSED:
+        return (42 if point.y % 2 == 0 else 43).to_bytes(1, ENDIAN) + point.x.to_bytes(32, byteorder=ENDIAN)
+    else:
+        raise NotImplementedError()
+
+
+def bytes_to_point(point_bytes: bytes) -> Point:
+    return get_address_entry(point_bytes)[0]
+
+
 def bytes_to_string(point_bytes: bytes) -> str:
-    point = bytes_to_point(point_bytes)
     if len(point_bytes) == 64:
-        address_format = AddressFormat.FULL_HEX
+        return get_address_entry(point_bytes)[2]
     elif len(point_bytes) == 33:
-        address_format = AddressFormat.COMPRESSED
+        return get_address_entry(point_bytes)[1]
     else:
         raise NotImplementedError()
-    return point_to_string(point, address_format)
 
 
 def point_to_string(point: Point, address_format: AddressFormat = AddressFormat.COMPRESSED) -> str:
     if address_format is AddressFormat.FULL_HEX:
-        point_bytes = point_to_bytes(point)
-        return point_bytes.hex()
+        index = 2
     elif address_format is AddressFormat.COMPRESSED:
-        x, y = point.x, point.y
-        address = base58.b58encode((42 if y % 2 == 0 else 43).to_bytes(1, ENDIAN) + x.to_bytes(32, ENDIAN))
-        return address if isinstance(address, str) else address.decode('utf-8')
+        index = 1
     else:
         raise NotImplementedError()
+    cache = address_cache
+    if cache is None:
+        return _address_entry(point)[index]
+    point_bytes = point_to_bytes(point)
+    entry = cache.get(point_bytes)
+    if entry is None:
+        entry = _address_entry(point)
+        cache.put(point_bytes, entry)
+    return entry[index]
 
 
 def string_to_bytes(string: str) -> bytes:
     try:
-        point_bytes = bytes.fromhex(string)
+        return bytes.fromhex(string)
     except ValueError:
-        point_bytes = base58.b58decode(string)
+        pass
+    cache = address_cache
+    entry = cache.get(string) if cache is not None else None
+    if entry is not None:
+        return point_to_bytes(entry[0], AddressFormat.COMPRESSED)
+    point_bytes = base58.b58decode(string)
+    if cache is not None and len(point_bytes) == 33 and point_bytes[0] in (42, 43):
+        entry = get_address_entry(point_bytes)
+        if entry[1] == string:
+            cache.put(string, entry)
     return point_bytes
 
 
@@ -127,7 +186,7 @@ async def transaction_to_json(tx, verify: bool = False):
     if isinstance(tx, CoinbaseTransaction):
         transaction = {'is_coinbase': True, 'hash': tx.hash(), 'block_hash': tx.block_hash, 'outputs': []}
     else:
-        transaction = {'is_coinbase': False, 'hash': tx.hash(), 'block_hash': tx.block_hash, 'message': tx.message.hex() if tx.message is not None else None, 'inputs': [], 'outputs': [], 'fees': tx.fees}
+        transaction = {'is_coinbase': False, 'hash': tx.hash(), 'block_hash': tx.block_hash, 'message': tx.message.hex() if tx.message is not None else None, 'inputs': [], 'outputs': [], 'fees': smallest_to_decimal(tx.fees) if tx.fees is not None else None}
         for input in tx.inputs:
             related_transaction = await transaction_to_json(await input.get_transaction()) if verify else None
             transaction['inputs'].append({
@@ -135,13 +194,13 @@ async def transaction_to_json(tx, verify: bool = False):
                 'tx_hash': input.tx_hash,
                 'signature': input.get_signature() if input.signed is not None else None,
                 'address': (await input.get_related_output()).address if verify else None,
-                'amount': input.amount,
+                'amount': smallest_to_decimal(input.amount) if input.amount is not None else None,
                 'transaction': related_transaction
             })
     for output in tx.outputs:
         transaction['outputs'].append({
             'address': output.address,
-            'amount': output.amount
+            'amount': smallest_to_decimal(output.amount)
         })
     return transaction
 
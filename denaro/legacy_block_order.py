@@ -0,0 +1,44 @@
+import hashlib
+import json
+from itertools import permutations
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .manager import block_to_bytes
+
+# blocks up to this height have the merkle tree of their transactions in a given order, see manager.check_block
+LEGACY_ORDER_HEIGHT = 22500
+TABLE_PATH = Path(__file__).parent / 'legacy_block_order.json'
+
+_table: Dict[str, List[str]] = None
+
+
+def get_table() -> Dict[str, List[str]]:
+    """Hashes of the transactions of the legacy blocks in merkle tree order, by block hash. Built by create_legacy_block_order.py."""
+    global _table
+    if _table is None:
+        _table = json.loads(TABLE_PATH.read_text()) if TABLE_PATH.exists() else {}
+    return _table
+
+
+def get_transactions_order(block_hash: str) -> Optional[List[str]]:
+    return get_table().get(block_hash)
+
+
+def find_transactions_order(previous_hash: str, block: dict, transactions: list, max_transactions: int = None) -> Optional[List[str]]:
+    """
+    Searches the order of transactions giving block its hash, trying every permutation of them.
+    Only the merkle tree is hashed again for each of them, between the block bytes before and after it.
+    """
+    if max_transactions is not None and len(transactions) > max_transactions:
+        return None
+    content = block_to_bytes(previous_hash, dict(block, merkle_tree='00' * 32))
+    # the merkle tree is followed by the timestamp, difficulty and random
+    prefix, suffix = content[:-42], content[-10:]
+    digests = {transaction.hash(): hashlib.sha256(transaction.tobytes()).digest() for transaction in transactions}
+    block_hash = bytes.fromhex(block['hash'])
+    for ordered in permutations(digests):
+        merkle_tree = hashlib.sha256(b''.join(digests[tx_hash] for tx_hash in ordered)).digest()
+        if hashlib.sha256(prefix + merkle_tree + suffix).digest() == block_hash:
+            return list(ordered)
+    return None
@@ -1,14 +1,17 @@
 import hashlib
+from datetime import datetime
 from decimal import Decimal
 from io import BytesIO
 from math import ceil, floor, log
-from typing import Tuple, List, Union
+from typing import Tuple, List, Union, Dict
 
 from icecream import ic
 
 from . import Database
-from .constants import MAX_SUPPLY, ENDIAN, MAX_BLOCK_SIZE_HEX
-from .helpers import sha256, timestamp, bytes_to_string, string_to_bytes
+from .constants import MAX_SUPPLY, ENDIAN, MAX_BLOCK_SIZE_HEX, SMALLEST
+from .header_index import HeaderIndex
+from .signature_verifier import SignatureVerifier
+from .helpers import sha256, timestamp, bytes_to_string, string_to_bytes, point_to_string, smallest_to_decimal
 from .transactions import CoinbaseTransaction, Transaction
 
 BLOCK_TIME = 180
@@ -18,6 +21,9 @@ START_DIFFICULTY = Decimal('6.0')
 _print = print
 print = ic
 
+# verifies the signatures of the transactions of a block, or of a sync page, at once. Set up by the node
+signature_verifier = SignatureVerifier()
+
 
 def difficulty_to_hashrate_old(difficulty: Decimal) -> int:
     decimal = difficulty % 1 or 1/16
@@ -47,19 +53,13 @@ def hashrate_to_difficulty(hashrate: int) -> Decimal:
     return Decimal(difficulty + decimal)
 
 
-async def calculate_difficulty() -> Tuple[Decimal, dict]:
-    database = Database.instance
-    last_block = await database.get_last_block()
-    if last_block is None:
-        return START_DIFFICULTY, dict()
-    last_block = dict(last_block)
-    last_block['address'] = last_block['address'].strip(' ')
-    if last_block['id'] < BLOCKS_COUNT:
-        return START_DIFFICULTY, last_block
+def next_difficulty(last_block: dict, window_start: int = None) -> Decimal:
+    """Difficulty of the block after last_block, window_start is the timestamp of the first block of its retarget window."""
+    if not last_block or last_block['id'] < BLOCKS_COUNT:
+        return START_DIFFICULTY
 
     if last_block['id'] % BLOCKS_COUNT == 0:
-        last_adjust_block = await database.get_block_by_id(last_block['id'] - BLOCKS_COUNT + 1)
-        elapsed = last_block['timestamp'] - last_adjust_block['timestamp']
+        elapsed = last_block['timestamp'] - window_start
         average_per_block = elapsed / BLOCKS_COUNT
         last_difficulty = last_block['difficulty']
         hashrate = difficulty_to_hashrate_old(last_difficulty) if last_block['id'] <= 17500 else difficulty_to_hashrate(last_difficulty)
@@ -67,15 +67,101 @@ async def calculate_difficulty() -> Tuple[Decimal, dict]:
         hashrate *= ratio
         new_difficulty = hashrate_to_difficulty_old(hashrate) if last_block['id'] < 17500 else hashrate_to_difficulty(hashrate)
         new_difficulty = floor(new_difficulty * 10) / Decimal(10)
-        return new_difficulty, last_block
+        return new_difficulty
+
+    return last_block['difficulty']
+
+
+class ChainState:
+    """
+    Chain kept in memory: the header index, the last block and the difficulty of the next block.
+    Blocks are connected and disconnected inside their database transaction, which restores the state if rolled back.
+    """
+
+    def __init__(self, database: Database):
+        self.database = database
+        self.headers = HeaderIndex()
+        self.last_block: dict = {}
+        self.difficulty: Decimal = START_DIFFICULTY
+        self.journal = None
+        self.depth = 0
+
+    @property
+    def height(self) -> int:
+        return len(self.headers)
+
+    @property
+    def window_start(self) -> int:
+        """Timestamp of the first block of the retarget window of the last block."""
+        height = self.height
+        return self.headers.get_timestamp(int(height - (height - 1) % BLOCKS_COUNT)) if height else None
+
+    async def load(self):
+        self.headers = await HeaderIndex.load(self.database)
+        self._update_tip()
+
+    def _update_tip(self):
+        self.last_block = self.headers.get_block(self.height) or {}
+        self.difficulty = next_difficulty(self.last_block, self.window_start)
+
+    def connect(self, block: dict):
+        self.headers.append(block)
+        self._update_tip()
+
+    def disconnect(self, height: int):
+        """Removes the blocks above height."""
+        removed = self.headers.truncate(height)
+        if removed and self.journal is not None:
+            self.journal.append(removed)
+        self._update_tip()
+
+    def mining_info(self) -> Tuple[Decimal, dict]:
+        return self.difficulty, dict(self.last_block)
+
+    def savepoint(self) -> Tuple[int, int]:
+        if self.journal is None:
+            self.journal = []
+        self.depth += 1
+        return self.height, len(self.journal)
+
+    def rollback(self, savepoint: Tuple[int, int]):
+        height, position = savepoint
+        while len(self.journal) > position:
+            removed = self.journal.pop()
+            self.headers.truncate(removed[0]['id'] - 1)
+            for block in removed:
+                self.headers.append(block)
+        self.headers.truncate(height)
+        self._update_tip()
+        self.release(savepoint)
+
+    def release(self, savepoint: Tuple[int, int]):
+        self.depth -= 1
+        if self.depth == 0:
+            self.journal = None
+
+
+async def get_chain_state() -> ChainState:
+    database = Database.instance
+    if database.chain_state is None:
+        chain_state = ChainState(database)
+        await chain_state.load()
+        database.chain_state = chain_state
+    return database.chain_state
 
-    return last_block['difficulty'], last_block
+
+async def calculate_difficulty() -> Tuple[Decimal, dict]:
+    """Same as get_difficulty, read from the database."""
+    database = Database.instance
+    last_block = await database.get_last_block()
+    if last_block is None:
+        return START_DIFFICULTY, dict()
+    window_start = await database.get_block_by_id(int(last_block['id'] - (last_block['id'] - 1) % BLOCKS_COUNT))
+    return next_difficulty(last_block, window_start['timestamp']), last_block
 
 
 async def get_difficulty() -> Tuple[Decimal, dict]:
-    if Manager.difficulty is None:
-        Manager.difficulty = await calculate_difficulty()
-    return Manager.difficulty
+    return (await get_chain_state()).mining_info()
 
 
 async def check_block_is_valid(block_content: str, mining_info: tuple = None) -> bool:
@@ -99,17 +185,17 @@ async def check_block_is_valid(block_content: str, mining_info: tuple = None) ->
     return block_hash.startswith(last_block_hash[-difficulty:])
 
 
-def get_block_reward(number: int) -> Decimal:
+def get_block_reward(number: int) -> int:
     divider = floor(number / 150000)
     if divider == 0:
-        return Decimal(100)
+        return 100 * SMALLEST
     if divider > 8:
         if number < 150000 * 9 + 458732 - 150000:
-            return Decimal('0.390625')
+            return 390625
         elif number < 150000 * 9 + 458733 - 150000:
-            return Decimal('0.3125')
-        return Decimal(0)
-    return Decimal(100) / (2 ** Decimal(divider))
+            return 312500
+        return 0
+    return 100 * SMALLEST // 2 ** divider
 
 
 def __check():
@@ -124,41 +210,70 @@ def __check():
         r += n
 
     print(r)
-    print(MAX_SUPPLY - r)
+    print(MAX_SUPPLY * SMALLEST - r)
     print(index)
 
 
 async def clear_pending_transactions():
     database: Database = Database.instance
     transactions = await database.get_pending_transactions_limit(1000)
+    await database.fill_related_outputs(transactions)
 
     used_inputs = []
     for transaction in transactions:
         tx_hash = sha256(transaction.hex())
-        if not await transaction.verify() or await database.get_transaction(tx_hash, False) is not None:
+        if not await transaction._verify_unspent() or not await transaction.verify(check_double_spend=False) or await database.get_transaction(tx_hash, False) is not None:
             await database.remove_pending_transaction(tx_hash)
         else:
             tx_inputs = [f"{tx_input.tx_hash}{tx_input.index}" for tx_input in transaction.inputs]
             if any(used_input in tx_inputs for used_input in used_inputs):
                 await database.remove_pending_transaction(tx_hash)
-                return await clear_pending_transactions()
+                continue
             used_inputs += tx_inputs
 
 
+async def admit_transactions(transactions: List[Transaction]) -> List[bool]:
+    """
+    Adds transactions as pending in a single database transaction, returning whether each was added.
+    The outputs they spend are read and their signatures verified for all of them at once.
+    """
+    database: Database = Database.instance
+    signed = [transaction for transaction in transactions if isinstance(transaction, Transaction)]
+    await database.fill_related_outputs(signed)
+    verified_signatures = {transaction.hash(): valid for transaction, valid in zip(signed, await signature_verifier.verify_transactions(signed))}
+    cache = Transaction.verified_cache
+    results = []
+    async with database.transaction():
+        for transaction in transactions:
+            valid_signatures = verified_signatures.get(transaction.hash())
+            if valid_signatures is False:
+                results.append(False)
+                continue
+            if valid_signatures and cache is not None:
+                cache.put(transaction.hash(), True)
+            try:
+                # a savepoint, so a failing transaction does not roll back the others
+                async with database.transaction():
+                    results.append(await database.add_pending_transaction(transaction))
+            except Exception as e:
+                print(e)
+                results.append(False)
+    return results
+
+
 def get_transactions_merkle_tree_ordered(transactions: List[Union[Transaction, str]]):
-    _bytes = bytes()
-    for transaction in transactions:
-        _bytes += hashlib.sha256(bytes.fromhex(transaction.hex() if isinstance(transaction, Transaction) else transaction)).digest()
+    _bytes = b''.join(
+        hashlib.sha256(bytes.fromhex(transaction.hex() if isinstance(transaction, Transaction) else transaction)).digest()
+        for transaction in transactions
+    )
     return hashlib.sha256(_bytes).hexdigest()
 
 
 def get_transactions_merkle_tree(transactions: List[Union[Transaction, str]]):
-    _bytes = bytes()
     transactions_bytes = []
     for transaction in transactions:
         transactions_bytes.append(bytes.fromhex(transaction.hex() if isinstance(transaction, Transaction) else transaction))
-    for transaction in sorted(transactions_bytes):
-        _bytes += hashlib.sha256(transaction).digest()
+    _bytes = b''.join(hashlib.sha256(transaction).digest() for transaction in sorted(transactions_bytes))
     return hashlib.sha256(_bytes).hexdigest()
 
 
@@ -166,6 +281,72 @@ def get_transactions_size(transactions: List[Transaction]):
     return sum(len(transaction.hex()) for transaction in transactions)
 
 
+class BlockTemplate:
+    """
+    Next block to mine: the tip it extends, its difficulty, the pending transactions with the highest fee per byte
+    fitting in MAX_BLOCK_SIZE_HEX and their merkle root.
+    With the mempool it is only built again after a block is connected or disconnected, or a pending transaction
+    is added or removed, serializing only the transactions it did not select before.
+    """
+
+    def __init__(self, max_size_hex: int = MAX_BLOCK_SIZE_HEX):
+        self.max_size_hex = max_size_hex
+        self.key = None
+        self.id: str = None
+        self.difficulty: Decimal = None
+        self.last_block: dict = {}
+        self.transactions: List[Transaction] = []
+        self.hashes: List[str] = []
+        self.hexes: Dict[str, str] = {}
+        self.merkle_root: str = None
+        self.size = 0
+        self.builds = 0
+        self.hits = 0
+
+    def update(self, chain_state: ChainState, mempool) -> None:
+        key = (chain_state.last_block.get('hash'), mempool.version)
+        if key == self.key:
+            self.hits += 1
+            return
+        self.build(chain_state, [(tx_hash, mempool.get(tx_hash)) for tx_hash in mempool.select_hashes()])
+        self.key = key
+
+    def build(self, chain_state: ChainState, transactions: List[Tuple[str, Transaction]]) -> None:
+        """Builds the template from (tx hash, transaction) pairs, sorted by priority."""
+        self.key = None
+        self.difficulty, self.last_block = chain_state.mining_info()
+        selected, hexes, size = [], {}, 0
+        for tx_hash, transaction in transactions:
+            tx_hex = self.hexes.get(tx_hash) or transaction.hex()
+            if size + len(tx_hex) <= self.max_size_hex:
+                selected.append(transaction)
+                hexes[tx_hash] = tx_hex
+                size += len(tx_hex)
+        self.transactions, self.hashes, self.hexes, self.size = selected, list(hexes), hexes, size
+        # same as get_transactions_merkle_tree(_ordered), the hash of a transaction being the sha256 of its bytes
+        ordered = hexes if chain_state.height + 1 < 22500 else sorted(hexes, key=hexes.get)
+        self.merkle_root = hashlib.sha256(b''.join(bytes.fromhex(tx_hash) for tx_hash in ordered)).hexdigest()
+        self.id = sha256(self.last_block.get('hash', '') + self.merkle_root)
+        self.builds += 1
+
+    def stats(self) -> dict:
+        return {'id': self.id, 'transactions': len(self.transactions), 'size': self.size, 'builds': self.builds, 'hits': self.hits}
+
+
+block_template = BlockTemplate()
+
+
+async def get_block_template() -> BlockTemplate:
+    database = Database.instance
+    chain_state = await get_chain_state()
+    if database.mempool is not None:
+        block_template.update(chain_state, database.mempool)
+    else:
+        # without the mempool, changes to the pending transactions are not known
+        block_template.build(chain_state, [(transaction.hash(), transaction) for transaction in await database.get_pending_transactions_limit(1000)])
+    return block_template
+
+
 def block_to_bytes(last_block_hash: str, block: dict) -> bytes:
     address_bytes = string_to_bytes(block['address'])
     version = bytes([])
@@ -201,9 +382,32 @@ def split_block_content(block_content: str):
     return previous_hash, address, merkle_tree, timestamp, difficulty, random
 
 
-async def check_block(block_content: str, transactions: List[Transaction], mining_info: tuple = None):
+async def verify_blocks_signatures(blocks_transactions: List[List[str]]) -> Dict[str, bool]:
+    """
+    Verifies the signatures of the transactions of several blocks, given as hex, before they are connected.
+    The public keys come from the outputs of these transactions and from the unspent outputs,
+    transactions whose inputs can not be resolved yet are left to check_block.
+    """
+    transactions = []
+    for block_transactions in blocks_transactions:
+        for tx_hex in block_transactions:
+            transaction = await Transaction.from_hex(tx_hex, False)
+            # without looking up public keys, the inputs of a transaction signed by several keys can be left unsigned
+            if isinstance(transaction, Transaction) and all(tx_input.signed is not None for tx_input in transaction.inputs):
+                transactions.append(transaction)
+    public_keys = {(transaction.hash(), index): tx_output.public_key for transaction in transactions for index, tx_output in enumerate(transaction.outputs)}
+    outpoints = [(tx_input.tx_hash, tx_input.index) for transaction in transactions for tx_input in transaction.inputs]
+    missing = [outpoint for outpoint in outpoints if outpoint not in public_keys]
+    if missing:
+        unspent_outputs = await Database.instance.get_unspent_outputs_info(missing)
+        public_keys.update((outpoint, tx_output.public_key) for outpoint, tx_output in unspent_outputs.items())
+    results = await signature_verifier.verify_transactions(transactions, public_keys)
+    return {transaction.hash(): valid for transaction, valid in zip(transactions, results) if valid is not None}
+
+
+async def check_block(block_content: str, transactions: List[Transaction], mining_info: tuple = None, bulk_ingest: 'BulkIngest' = None, verified_signatures: Dict[str, bool] = None, assume_valid: bool = False):
     if mining_info is None:
-        mining_info = await calculate_difficulty()
+        mining_info = await get_difficulty()
     difficulty, last_block = mining_info
     block_no = last_block['id'] + 1 if last_block != {} else 1
     previous_hash, address, merkle_tree, content_time, content_difficulty, random = split_block_content(block_content)
@@ -242,20 +446,32 @@ async def check_block(block_content: str, transactions: List[Transaction], minin
 
     if transactions:
         check_inputs = sum([[(tx_input.tx_hash, tx_input.index) for tx_input in transaction.inputs] for transaction in transactions], [])
-        unspent_outputs = await database.get_unspent_outputs(check_inputs)
+        unspent_outputs = await (bulk_ingest if bulk_ingest is not None else database).get_unspent_outputs_info(check_inputs)
         if len(unspent_outputs) != len(check_inputs):
             print('double spend in block')
             print(set(check_inputs) - set(unspent_outputs))
             return False
 
-        input_txs_hash = sum([[tx_input.tx_hash for tx_input in transaction.inputs] for transaction in transactions], [])
-        input_txs = await database.get_transactions(input_txs_hash)
         for transaction in transactions:
-            await transaction._fill_transaction_inputs(input_txs)
+            await transaction._fill_related_outputs(unspent_outputs)
+
+    verified_signatures = dict(verified_signatures or {})
+    cache = Transaction.verified_cache
+    if assume_valid:
+        # an ancestor of the assume valid checkpoint, its inputs only have to be signed
+        verified_signatures = {transaction.hash(): all(tx_input.signed is not None for tx_input in transaction.inputs) for transaction in transactions}
+    elif cache is not None:
+        # transactions verified when they entered the mempool
+        verified_signatures.update((transaction.hash(), True) for transaction in transactions if transaction.hash() not in verified_signatures and cache.get(transaction.hash()))
+    unverified = [transaction for transaction in transactions if transaction.hash() not in verified_signatures]
+    verified_signatures.update(
+        (transaction.hash(), valid) for transaction, valid in zip(unverified, await signature_verifier.verify_transactions(unverified)) if valid is not None
+    )
 
     used_inputs = []
     for transaction in transactions:
-        if not await transaction.verify(check_double_spend=False):
+        valid_signatures = verified_signatures.get(transaction.hash())
+        if valid_signatures is False or not await transaction.verify(check_double_spend=False, check_signatures=valid_signatures is None):
             print(f'transaction {transaction.hash()} has been not verified')
             return False
         else:
@@ -280,13 +496,10 @@ async def check_block(block_content: str, transactions: List[Transaction], minin
     return True
 
 
-async def create_block(block_content: str, transactions: List[Transaction], last_block: dict = None):
-    Manager.difficulty = None
-    if last_block is None or last_block['id'] % BLOCKS_COUNT == 0:
-        difficulty, last_block = await calculate_difficulty()
-    else:
-        difficulty = Decimal(str(last_block['difficulty']))
-    if not await check_block(block_content, transactions, (difficulty, last_block)):
+async def create_block(block_content: str, transactions: List[Transaction], bulk_ingest: 'BulkIngest' = None, verified_signatures: Dict[str, bool] = None, assume_valid: bool = False):
+    chain_state = await get_chain_state()
+    difficulty, last_block = chain_state.mining_info()
+    if not await check_block(block_content, transactions, (difficulty, last_block), bulk_ingest, verified_signatures, assume_valid):
         return False
 
     database: Database = Database.instance
@@ -301,25 +514,94 @@ async def create_block(block_content: str, transactions: List[Transaction], last
     if block_no > 35000:
         if not coinbase_transaction.outputs[0].verify():
             return False
+    block = {'id': block_no, 'hash': block_hash, 'address': address, 'random': random, 'difficulty': difficulty, 'reward': block_reward + fees, 'timestamp': content_time}
 
-    await database.add_block(block_no, block_hash, address, random, difficulty, block_reward + fees, content_time)
-    await database.add_transaction(coinbase_transaction, block_hash)
+    if bulk_ingest is not None:
+        await bulk_ingest.add_block(block_no, block_hash, address, random, difficulty, block_reward + fees, content_time, coinbase_transaction, transactions)
+        chain_state.connect(block)
+        return True
 
     try:
-        await database.add_transactions(transactions, block_hash)
+        async with database.transaction():
+            # another block may have been connected while this one was checked
+            if chain_state.last_block.get('hash') != last_block.get('hash'):
+                return False
+            await database.add_block(block_no, block_hash, address, random, difficulty, block_reward + fees, content_time)
+            await database.add_transaction(coinbase_transaction, block_hash)
+            await database.add_transactions(transactions, block_hash)
+            await database.add_unspent_transactions_outputs(transactions + [coinbase_transaction])
+            await database.add_transactions_outputs(transactions + [coinbase_transaction])
+            if transactions:
+                await database.evict_pending_transactions(
+                    [transaction.hash() for transaction in transactions],
+                    [(tx_input.tx_hash, tx_input.index) for transaction in transactions for tx_input in transaction.inputs]
+                )
+                await database.remove_unspent_outputs(transactions)
+                await database.spend_outputs(transactions)
+                await database.add_spent_outpoints(transactions)
+            chain_state.connect(block)
     except Exception as e:
-        print(f'a transaction has not been added in block', e)
-        await database.delete_block(block_no)
+        print(f'block {block_no} has not been added', e)
         return False
-    await database.add_unspent_transactions_outputs(transactions + [coinbase_transaction])
     if transactions:
-        await database.remove_pending_transactions_by_hash([transaction.hash() for transaction in transactions])
-        await database.remove_unspent_outputs(transactions)
-
-        _print(f'Added {len(transactions)} transactions in block {block_no}. Reward: {block_reward}, Fees: {fees}')
-    Manager.difficulty = None
+        _print(f'Added {len(transactions)} transactions in block {block_no}. Reward: {smallest_to_decimal(block_reward)}, Fees: {smallest_to_decimal(fees)}')
     return True
 
 
-class Manager:
-    difficulty: Tuple[float, dict] = None
+class BulkIngest:
+    """
+    Blocks connected while syncing far behind the tip: they are validated against the unspent outputs
+    in the database plus the changes of the previous blocks kept here, and written at once by add_bulk_ingest.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.transactions = []
+        self.transactions_hashes = []
+        self.unspent_outputs = {}
+        self.spent_outputs = set()
+        self.outputs = {}
+        self.spent_by = []
+        self.spent_outpoints = []
+
+    def __len__(self):
+        return len(self.blocks)
+
+    async def get_unspent_outputs_info(self, outputs: List[Tuple[str, int]]):
+        result = {output: self.unspent_outputs[output] for output in outputs if output in self.unspent_outputs}
+        missing = [output for output in outputs if output not in result and output not in self.spent_outputs]
+        if missing:
+            result.update(await Database.instance.get_unspent_outputs_info(missing))
+        return result
+
+    def get_unspent_outputs(self) -> List[tuple]:
+        return [(tx_hash, index, tx_output.address_bytes, tx_output.amount) for (tx_hash, index), tx_output in self.unspent_outputs.items()]
+
+    async def add_block(self, block_no: int, block_hash: str, address: str, random: int, difficulty: Decimal, reward: int, content_time: int, coinbase_transaction: CoinbaseTransaction, transactions: List[Transaction]):
+        self.blocks.append((block_no, block_hash, address, random, difficulty, reward, datetime.utcfromtimestamp(content_time)))
+        for transaction in [coinbase_transaction] + transactions:
+            tx_hash = transaction.hash()
+            is_transaction = isinstance(transaction, Transaction)
+            self.transactions.append((
+                block_hash,
+                tx_hash,
+                transaction.hex(),
+                [point_to_string(await tx_input.get_public_key()) for tx_input in transaction.inputs] if is_transaction else [],
+                transaction.fees if is_transaction else 0
+            ))
+            for index, tx_output in enumerate(transaction.outputs):
+                self.unspent_outputs[(tx_hash, index)] = tx_output
+                self.outputs[(tx_hash, index)] = [tx_hash, index, point_to_string(tx_output.public_key), tx_output.amount, None]
+        for transaction in transactions:
+            tx_hash = transaction.hash()
+            self.transactions_hashes.append(tx_hash)
+            for tx_input in transaction.inputs:
+                outpoint = (tx_input.tx_hash, tx_input.index)
+                # an output created and spent in the same ingest never reaches unspent_outputs
+                if self.unspent_outputs.pop(outpoint, None) is None:
+                    self.spent_outputs.add(outpoint)
+                if outpoint in self.outputs:
+                    self.outputs[outpoint][4] = tx_hash
+                else:
+                    self.spent_by.append((tx_hash, tx_input.tx_hash, tx_input.index))
+                self.spent_outpoints.append((tx_input.tx_hash, tx_input.index, tx_hash, False))
@@ -0,0 +1,141 @@
+from heapq import heappush, nsmallest
+from typing import Dict, List, Optional, Tuple
+
+from .transactions import Transaction
+
+
+class Mempool:
+    """
+    Pending transactions kept in memory in front of the pending_transactions table, which only persists them.
+    Transactions are selected by fee per byte from a heap, and the outpoint spent by each of their inputs is indexed
+    so a conflicting transaction is found without a query.
+    Changes made inside a database transaction are journaled and undone with it.
+    """
+
+    def __init__(self):
+        self.transactions: Dict[str, Transaction] = {}
+        self.fees: Dict[str, int] = {}
+        self.fee_rates: Dict[str, float] = {}
+        self.spenders: Dict[Tuple[str, int], str] = {}
+        # (-fee rate, tx hash) entries, the ones of removed transactions stay until the heap is rebuilt
+        self.heap: List[Tuple[float, str]] = []
+        self.stale = 0
+        self.size = 0
+        # changed by every addition and removal, so what is built from the selection knows when it is outdated
+        self.version = 0
+        self.journal = None
+        self.depth = 0
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __contains__(self, tx_hash: str):
+        return tx_hash in self.transactions
+
+    def get(self, tx_hash: str) -> Optional[Transaction]:
+        return self.transactions.get(tx_hash)
+
+    def get_spender(self, outpoints: List[Tuple[str, int]], ignore: str = None) -> Optional[str]:
+        """Returns the hash of a pending transaction spending one of outpoints."""
+        for outpoint in outpoints:
+            spender = self.spenders.get(outpoint)
+            if spender is not None and spender != ignore:
+                return spender
+        return None
+
+    def get_spenders(self, outpoints: List[Tuple[str, int]]) -> List[str]:
+        """Returns the hashes of the pending transactions spending any of outpoints."""
+        spenders = {self.spenders.get(outpoint) for outpoint in outpoints}
+        spenders.discard(None)
+        return list(spenders)
+
+    def add(self, transaction: Transaction, fees: int) -> None:
+        tx_hash = transaction.hash()
+        if tx_hash in self.transactions:
+            return
+        size = len(transaction.tobytes())
+        fee_rate = fees / size
+        self.transactions[tx_hash] = transaction
+        self.fees[tx_hash] = fees
+        self.fee_rates[tx_hash] = fee_rate
+        self.size += size
+        for tx_input in transaction.inputs:
+            self.spenders[(tx_input.tx_hash, tx_input.index)] = tx_hash
+        heappush(self.heap, (-fee_rate, tx_hash))
+        self.version += 1
+        if self.journal is not None:
+            self.journal.append((tx_hash, None, None))
+
+    def remove(self, tx_hashes: List[str]) -> List[Transaction]:
+        removed = []
+        for tx_hash in tx_hashes:
+            transaction = self.transactions.pop(tx_hash, None)
+            if transaction is None:
+                continue
+            fees = self.fees.pop(tx_hash)
+            del self.fee_rates[tx_hash]
+            self.size -= len(transaction.tobytes())
+            for tx_input in transaction.inputs:
+                outpoint = (tx_input.tx_hash, tx_input.index)
+                if self.spenders.get(outpoint) == tx_hash:
+                    del self.spenders[outpoint]
+            self.stale += 1
+            self.version += 1
+            if self.journal is not None:
+                self.journal.append((tx_hash, transaction, fees))
+            removed.append(transaction)
+        if self.stale > len(self.transactions):
+            self.heap = [(-fee_rate, tx_hash) for tx_hash, fee_rate in self.fee_rates.items()]
+            self.heap.sort()
+            self.stale = 0
+        return removed
+
+    def clear(self) -> None:
+        self.remove(list(self.transactions))
+
+    def select(self, limit: int = None) -> List[Transaction]:
+        """Returns the pending transactions with the highest fee per byte first."""
+        return [self.transactions[tx_hash] for tx_hash in self.select_hashes(limit)]
+
+    def select_hashes(self, limit: int = None) -> List[str]:
+        entries = sorted(self.heap) if limit is None else nsmallest(limit + self.stale, self.heap)
+        selected, seen = [], set()
+        for fee_rate, tx_hash in entries:
+            # entries left by removed transactions, or by a transaction removed and added again
+            if self.fee_rates.get(tx_hash) != -fee_rate or tx_hash in seen:
+                continue
+            seen.add(tx_hash)
+            selected.append(tx_hash)
+            if len(selected) == limit:
+                break
+        return selected
+
+    def savepoint(self) -> int:
+        if self.journal is None:
+            self.journal = []
+        self.depth += 1
+        return len(self.journal)
+
+    def rollback(self, savepoint: int):
+        journal, self.journal = self.journal, None
+        while len(journal) > savepoint:
+            tx_hash, transaction, fees = journal.pop()
+            if transaction is None:
+                self.remove([tx_hash])
+            else:
+                self.add(transaction, fees)
+        self.journal = journal
+        self.release(savepoint)
+
+    def release(self, savepoint: int):
+        self.depth -= 1
+        if self.depth == 0:
+            self.journal = None
+
+    def stats(self) -> dict:
+        return {
+            'transactions': len(self),
+            'size': self.size,
+            'max_fee_rate': max(self.fee_rates.values(), default=None),
+            'min_fee_rate': min(self.fee_rates.values(), default=None)
+        }
@@ -1,7 +1,6 @@
 import random
 from os import environ
 
-from asyncpg import UniqueViolationError
 from fastapi import FastAPI, Body
 from httpx import TimeoutException
 from icecream import ic
@@ -9,14 +8,21 @@ from starlette.background import BackgroundTasks
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
-from denaro.helpers import timestamp, sha256, transaction_to_json
-from denaro.manager import create_block, get_difficulty, Manager, get_transactions_merkle_tree, \
-    split_block_content, calculate_difficulty, clear_pending_transactions, block_to_bytes, get_transactions_merkle_tree_ordered
+from denaro.helpers import timestamp, sha256, transaction_to_json, smallest_to_decimal, block_to_json
+from denaro.manager import create_block, get_difficulty, get_chain_state, get_transactions_merkle_tree, \
+    split_block_content, clear_pending_transactions, admit_transactions, block_to_bytes, get_transactions_merkle_tree_ordered, \
+    BulkIngest, verify_blocks_signatures, get_block_template
 from denaro.node.nodes_manager import NodesManager, NodeInterface
 from denaro.node.utils import ip_is_local
 from denaro.transactions import Transaction, CoinbaseTransaction
-from denaro import Database
-from denaro.constants import VERSION, ENDIAN
+from denaro import Database, helpers, manager
+from denaro.legacy_block_order import LEGACY_ORDER_HEIGHT, get_transactions_order, find_transactions_order
+from denaro.lru_cache import LRUCache
+from denaro.mempool import Mempool
+from denaro.admission_queue import AdmissionQueue
+from denaro.unspent_outputs_cache import UnspentOutputsCache
+from denaro.signature_verifier import SignatureVerifier, DEFAULT_WORKERS
+from denaro.constants import VERSION, ENDIAN, ASSUME_VALID
 
 app = FastAPI()
 db: Database = None
@@ -27,6 +33,27 @@ self_url = None
 
 print = ic
 
+SYNC_BATCH_SIZE = int(environ.get('DENARO_SYNC_BATCH_SIZE', 100))
+# 0 disables the unspent outputs cache
+UNSPENT_OUTPUTS_CACHE_SIZE = int(environ.get('DENARO_UNSPENT_OUTPUTS_CACHE_SIZE', 500_000))
+UNSPENT_OUTPUTS_FLUSH_SIZE = int(environ.get('DENARO_UNSPENT_OUTPUTS_FLUSH_SIZE', 100_000))
+UNSPENT_OUTPUTS_FLUSH_INTERVAL = float(environ.get('DENARO_UNSPENT_OUTPUTS_FLUSH_INTERVAL', 60))
+TRANSACTIONS_CACHE_SIZE = int(environ.get('DENARO_TRANSACTIONS_CACHE_SIZE', 50_000))
+ADDRESS_CACHE_SIZE = int(environ.get('DENARO_ADDRESS_CACHE_SIZE', 100_000))
+VERIFIED_CACHE_SIZE = int(environ.get('DENARO_VERIFIED_CACHE_SIZE', 50_000))
+# processes verifying signatures, one less than the cores by default, 0 verifies them on a thread of the node process
+SIGNATURE_WORKERS = int(environ.get('DENARO_SIGNATURE_WORKERS', DEFAULT_WORKERS))
+# pushed transactions waiting to be admitted before push_tx answers that the node is busy, and admitted at once
+ADMISSION_QUEUE_SIZE = int(environ.get('DENARO_ADMISSION_QUEUE_SIZE', 10_000))
+ADMISSION_BATCH_SIZE = int(environ.get('DENARO_ADMISSION_BATCH_SIZE', 256))
+# height:hash of the assume valid checkpoint, 0 verifies the signatures of every block
+if 'DENARO_ASSUME_VALID' in environ:
+    ASSUME_VALID = environ['DENARO_ASSUME_VALID'].split(':')
+    ASSUME_VALID = (int(ASSUME_VALID[0]), ASSUME_VALID[1]) if len(ASSUME_VALID) == 2 else None
+# height of the first block connected without verifying its signatures, until the checkpoint is reached
+assumed_valid_from: int = None
+admission_queue = AdmissionQueue(admit_transactions, ADMISSION_BATCH_SIZE, ADMISSION_QUEUE_SIZE)
+
 from denaro.sqlitedb import LiteDatabase
 db: LiteDatabase = None
 
@@ -51,39 +78,146 @@ async def propagate(path: str, args: dict, ignore_url=None):
             NodesManager.sync()
 
 
-async def create_blocks(blocks: list):
-    _, last_block = await calculate_difficulty()
-    last_block['id'] = last_block['id'] if last_block != {} else 0
-    last_block['hash'] = last_block['hash'] if 'hash' in last_block else (30_06_2005).to_bytes(32, ENDIAN).hex()
+async def _prepare_block(block_info: dict, last_block: dict):
+    block = block_info['block']
     i = last_block['id'] + 1
-    for block_info in blocks:
-        block = block_info['block']
-        txs_hex = block_info['transactions']
-        txs = [await Transaction.from_hex(tx) for tx in txs_hex]
-        for tx in txs:
-            if isinstance(tx, CoinbaseTransaction):
-                txs.remove(tx)
-                break
-        hex_txs = [tx.hex() for tx in txs]
-        block['merkle_tree'] = get_transactions_merkle_tree(hex_txs) if i > 22500 else get_transactions_merkle_tree_ordered(hex_txs)
+    txs = [await Transaction.from_hex(tx) for tx in block_info['transactions']]
+    for tx in txs:
+        if isinstance(tx, CoinbaseTransaction):
+            txs.remove(tx)
+            break
+    hex_txs = [tx.hex() for tx in txs]
+    block['merkle_tree'] = get_transactions_merkle_tree(hex_txs) if i > LEGACY_ORDER_HEIGHT else get_transactions_merkle_tree_ordered(hex_txs)
+    block_content = block_to_bytes(last_block['hash'], block)
+
+    if i <= LEGACY_ORDER_HEIGHT and sha256(block_content) != block['hash'] and i != 17972:
+        # the transactions came in another order than the one of the merkle tree, it is read from the bundled table
+        # or, for a block missing from it, searched
+        order = get_transactions_order(block['hash']) or find_transactions_order(last_block['hash'], block, txs)
+        txs_by_hash = {tx.hash(): tx for tx in txs}
+        if order is None or sorted(order) != sorted(txs_by_hash):
+            # connecting it would give the block another hash
+            print(f'transactions order of block {i} not found, see create_legacy_block_order.py')
+            return block, None, txs
+        txs = [txs_by_hash[tx_hash] for tx_hash in order]
+        block['merkle_tree'] = get_transactions_merkle_tree_ordered(txs)
         block_content = block_to_bytes(last_block['hash'], block)
+    return block, block_content, txs
+
+
+async def _rewind_blocks(height: int, page_size: int = 500, readmit: bool = False):
+    """
+    Removes the blocks above height, from the last one, and gives back the outputs they spent.
+    Pending transactions spending the outputs of the removed transactions are evicted, and with readmit
+    the removed transactions are added back as pending once all the blocks are removed.
+    """
+    readmitted = []
+    while (last_height := (await get_chain_state()).height) > height:
+        offset = max(height + 1, last_height - page_size + 1)
+        removed = [await Transaction.from_hex(tx) for block_info in await db.get_blocks(offset, page_size) for tx in block_info['transactions']]
+        async with db.transaction():
+            await db.delete_blocks(offset - 1)
+            await db.restore_unspent_outputs(removed)
+            await db.evict_pending_transactions(outpoints=[(transaction.hash(), index) for transaction in removed for index in range(len(transaction.outputs))])
+        if readmit:
+            readmitted = removed + readmitted
+    if readmitted:
+        await admit_transactions(readmitted)
+
+
+async def _check_assume_valid(synced: bool = False) -> bool:
+    """
+    Once the checkpoint is connected, removes the blocks connected without verifying their signatures if it is not the one expected.
+    They are removed too when synced is set before reaching it, the node they came from not having it.
+    """
+    global assumed_valid_from
+    chain_state = await get_chain_state()
+    if assumed_valid_from is None or (chain_state.height < ASSUME_VALID[0] and not synced):
+        return True
+    checkpoint = chain_state.headers.get_block(ASSUME_VALID[0]) if chain_state.height >= ASSUME_VALID[0] else None
+    height, assumed_valid_from = assumed_valid_from, None
+    if checkpoint is None or checkpoint['hash'] != ASSUME_VALID[1]:
+        print(f'block {ASSUME_VALID[0]} is not the assume valid checkpoint, removing the blocks from {height}')
+        await _rewind_blocks(height - 1)
+        await db.set_assume_valid_state()
+        return False
+    await db.set_assume_valid_state()
+    return True
 
-        if i <= 22500 and sha256(block_content) != block['hash'] and i != 17972:
-            from itertools import permutations
-            for l in permutations(hex_txs):
-                _hex_txs = list(l)
-                block['merkle_tree'] = get_transactions_merkle_tree_ordered(_hex_txs)
-                block_content = block_to_bytes(last_block['hash'], block)
-                if sha256(block_content) == block['hash']:
-                    break
-        assert i == block['id']
-        if not await create_block(block_content.hex(), txs, last_block):
+
+async def _load_assume_valid():
+    """Checks the blocks synced without verifying their signatures before the node stopped, or removes them if the checkpoint changed."""
+    global assumed_valid_from
+    state = await db.get_assume_valid_state()
+    if state is None:
+        return
+    if ASSUME_VALID is None or state[1] != ASSUME_VALID[1]:
+        print(f'blocks from {state[0]} were synced to another assume valid checkpoint, removing them')
+        await _rewind_blocks(state[0] - 1)
+        await db.set_assume_valid_state()
+        return
+    assumed_valid_from = state[0]
+    await _check_assume_valid()
+
+
+async def create_blocks(blocks: list, batch_size: int = SYNC_BATCH_SIZE, bulk: bool = False, assume_valid: bool = False):
+    """
+    Connects blocks received from another node, batch_size blocks per database transaction.
+    With bulk, the blocks of a batch are validated in memory and written at once (see BulkIngest).
+    With assume_valid, the signatures of the blocks up to the ASSUME_VALID checkpoint are not verified.
+    """
+    global assumed_valid_from
+    _, last_block = await get_difficulty()
+    last_block['id'] = last_block['id'] if last_block != {} else 0
+    last_block['hash'] = last_block['hash'] if 'hash' in last_block else (30_06_2005).to_bytes(32, ENDIAN).hex()
+    i = last_block['id'] + 1
+    assumed_height = ASSUME_VALID[0] if assume_valid and ASSUME_VALID is not None else 0
+    for offset in range(0, len(blocks), batch_size):
+        verified_signatures = await verify_blocks_signatures([
+            block_info['transactions'] for block_info in blocks[offset:offset + batch_size] if block_info['block']['id'] > assumed_height
+        ])
+        async with db.transaction():
+            bulk_ingest = BulkIngest() if bulk else None
+            for block_info in blocks[offset:offset + batch_size]:
+                try:
+                    block, block_content, txs = await _prepare_block(block_info, last_block)
+                except AssertionError:
+                    if not bulk_ingest:
+                        raise
+                    # an input whose transaction is still in the ingest is needed to read the signatures
+                    await db.add_bulk_ingest(bulk_ingest)
+                    bulk_ingest = BulkIngest()
+                    block, block_content, txs = await _prepare_block(block_info, last_block)
+                assert i == block['id']
+                if block_content is None or not await create_block(block_content.hex(), txs, bulk_ingest, verified_signatures, i <= assumed_height):
+                    # blocks already connected in this batch are valid and get committed
+                    if bulk_ingest:
+                        await db.add_bulk_ingest(bulk_ingest)
+                    return False
+                if i <= assumed_height and assumed_valid_from is None:
+                    assumed_valid_from = i
+                    # kept with the blocks, so they are still checked if the node stops before the checkpoint
+                    await db.set_assume_valid_state(i, ASSUME_VALID[1])
+                last_block = block
+                i += 1
+            if bulk_ingest:
+                await db.add_bulk_ingest(bulk_ingest)
+        if not await _check_assume_valid():
             return False
-        last_block = block
-        i += 1
     return True
 
 
+async def _node_has_checkpoint(node_interface: NodeInterface, height: int) -> bool:
+    """Whether blocks from the node can be synced up to the assume valid checkpoint without verifying their signatures."""
+    if ASSUME_VALID is None or height > ASSUME_VALID[0]:
+        return False
+    try:
+        return (await node_interface.get_block(ASSUME_VALID[0]))['block']['hash'] == ASSUME_VALID[1]
+    except Exception as e:
+        print(e)
+        return False
+
+
 async def _sync_blockchain(node_url: str = None):
     print('sync blockchain')
     if node_url is None:
@@ -92,8 +226,8 @@ async def _sync_blockchain(node_url: str = None):
             return
         node_url = random.choice(nodes)
     node_url = node_url.strip('/')
-    _, last_block = await calculate_difficulty()
-    i = await db.get_next_block_id()
+    _, last_block = await get_difficulty()
+    i = (await get_chain_state()).height + 1
     node_interface = NodeInterface(node_url)
     local_cache = None
     if last_block != {} and last_block['id'] > 500:
@@ -101,52 +235,56 @@ async def _sync_blockchain(node_url: str = None):
         if remote_last_block['hash'] != last_block['hash']:
             print(remote_last_block['hash'])
             offset, limit = i - 500, 500
-            remote_blocks = await node_interface.get_blocks(i-500, 500)
-            local_blocks = await db.get_blocks(offset, limit)
-            local_blocks.reverse()
-            remote_blocks.reverse()
-            print(len(remote_blocks), len(local_blocks))
-            if len(local_blocks) > len(remote_blocks):
+            remote_blocks = await node_interface.get_blocks(offset, limit)
+            headers = (await get_chain_state()).headers
+            print(len(remote_blocks))
+            if len(remote_blocks) < limit:
                 return
-            for n, local_block in enumerate(local_blocks):
-                if local_block['block']['hash'] == remote_blocks[n]['block']['hash']:
-                    print(local_block, remote_blocks[n])
-                    local_cache = local_blocks[:n]
-                    local_cache.reverse()
-                    last_common_block = i = local_block['block']['id']
-                    blocks_to_remove = await db.get_blocks(last_common_block + 1, 500)
-                    transactions_to_remove = sum([block_to_remove['transactions'] for block_to_remove in blocks_to_remove], [])
-                    used_outputs = sum([[(tx_input.tx_hash, tx_input.index) for tx_input in (await Transaction.from_hex(transaction)).inputs] for transaction in transactions_to_remove], [])
-                    await db.delete_blocks(last_common_block)
-                    await db.add_unspent_outputs(used_outputs)
-                    for tx in transactions_to_remove:
-                        await db.add_pending_transaction(await Transaction.from_hex(tx))
+            for remote_block in reversed(remote_blocks):
+                if headers.get_height(remote_block['block']['hash']) == remote_block['block']['id']:
+                    print(remote_block)
+                    last_common_block = i = remote_block['block']['id']
+                    local_cache = await db.get_blocks(last_common_block + 1, 500)
+                    await _rewind_blocks(last_common_block, readmit=True)
                     print([c['block']['id'] for c in local_cache])
                     break
 
     #return
     limit = 1000
-    while True:
-        i = await db.get_next_block_id()
-        print("block id ", i)
-        try:
-            blocks = await node_interface.get_blocks(i, limit)
-        except Exception as e:
-            print(e)
-            #NodesManager.get_nodes().remove(node_url)
-            NodesManager.sync()
-            break
-        if not blocks:
-            print('syncing complete')
-            return
-        try:
-            assert await create_blocks(blocks)
-        except Exception as e:
-            print(e)
-            if local_cache is not None:
-                await db.delete_blocks(last_common_block)
-                await create_blocks(local_cache)
-            return
+    secondary_indexes_dropped = False
+    assume_valid = await _node_has_checkpoint(node_interface, i)
+    try:
+        while True:
+            i = (await get_chain_state()).height + 1
+            print("block id ", i)
+            try:
+                blocks = await node_interface.get_blocks(i, limit)
+            except Exception as e:
+                print(e)
+                #NodesManager.get_nodes().remove(node_url)
+                NodesManager.sync()
+                break
+            if not blocks:
+                print('syncing complete')
+                await _check_assume_valid(synced=True)
+                return
+            # a full page means the node is far behind: ingest in bulk and index once at the tip
+            bulk = len(blocks) == limit
+            if bulk and not secondary_indexes_dropped:
+                await db.drop_secondary_indexes()
+                secondary_indexes_dropped = True
+            try:
+                assert await create_blocks(blocks, bulk=bulk, assume_valid=assume_valid)
+            except Exception as e:
+                print(e)
+                if local_cache is not None:
+                    await _rewind_blocks(last_common_block)
+                    await create_blocks(local_cache)
+                return
+    finally:
+        if secondary_indexes_dropped:
+            print('creating secondary indexes')
+            await db.create_secondary_indexes()
 
 async def sync_blockchain(node_url: str = None):
     try:
@@ -162,12 +300,29 @@ async def sync_blockchain(node_url: str = None):
 @app.on_event("startup")
 async def startup():
     global db
+    Transaction.parsed_cache = LRUCache(TRANSACTIONS_CACHE_SIZE) if TRANSACTIONS_CACHE_SIZE else None
+    helpers.address_cache = LRUCache(ADDRESS_CACHE_SIZE) if ADDRESS_CACHE_SIZE else None
+    Transaction.verified_cache = LRUCache(VERIFIED_CACHE_SIZE) if VERIFIED_CACHE_SIZE else None
+    manager.signature_verifier = SignatureVerifier(SIGNATURE_WORKERS)
     db = await Database.create(
         user=environ.get('DENARO_DATABASE_USER', 'denaro'),
         password=environ.get('DENARO_DATABASE_PASSWORD', ''),
         database=environ.get('DENARO_DATABASE_NAME', 'denaro'),
         host=environ.get('DENARO_DATABASE_HOST', None)
     )
+    if UNSPENT_OUTPUTS_CACHE_SIZE:
+        await db.enable_unspent_outputs_cache(UnspentOutputsCache(UNSPENT_OUTPUTS_CACHE_SIZE, UNSPENT_OUTPUTS_FLUSH_SIZE, UNSPENT_OUTPUTS_FLUSH_INTERVAL))
+    await db.enable_mempool(Mempool())
+    # loads the header index
+    await get_chain_state()
+    await _load_assume_valid()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if db is not None:
+        await db.flush_unspent_outputs()
+    manager.signature_verifier.close()
 
 
 @app.get("/")
@@ -235,31 +390,48 @@ async def exception_handler(request: Request, e: Exception):
 async def push_tx(background_tasks: BackgroundTasks, tx_hex: str = None, body=Body(False)):
     if body and tx_hex is None:
         tx_hex = body['tx_hex']
+    tx_hash = sha256(tx_hex)
+    if (db.mempool is not None and tx_hash in db.mempool) or tx_hash in admission_queue:
+        return {'ok': False, 'error': 'Transaction already present'}
+    if admission_queue.full():
+        return {'ok': False, 'error': 'Node is busy, try again later'}
     tx = await Transaction.from_hex(tx_hex)
-    try:
-        if await db.add_pending_transaction(tx):
-            background_tasks.add_task(propagate, 'push_tx', {'tx_hex': tx_hex})
-            return {'ok': True, 'result': 'Transaction has been accepted'}
-        else:
-            return {'ok': False, 'error': 'Transaction has not been added'}
-    except UniqueViolationError:
+    # the same transaction may have been pushed while this one was parsed
+    if (db.mempool is not None and tx_hash in db.mempool) or tx_hash in admission_queue:
         return {'ok': False, 'error': 'Transaction already present'}
+    if await admission_queue.submit(tx):
+        background_tasks.add_task(propagate, 'push_tx', {'tx_hex': tx_hex})
+        return {'ok': True, 'result': 'Transaction has been accepted'}
+    else:
+        return {'ok': False, 'error': 'Transaction has not been added'}
 
 
 @app.post("/push_block")
 @app.get("/push_block")
-async def push_block(request: Request, background_tasks: BackgroundTasks, block_content: str = '', txs='', body=Body(False), id: int = None):
+async def push_block(request: Request, background_tasks: BackgroundTasks, block_content: str = '', txs='', body=Body(False), id: int = None, template_id: str = None):
     if body:
-        txs = body['txs']
+        txs = body.get('txs', '')
         if 'block_content' in body:
             block_content = body['block_content']
+        template_id = body.get('template_id', template_id)
+    template_transactions = None
+    if template_id is not None:
+        # the transactions of the block template given by get_mining_info, in the order of its merkle root
+        template = await get_block_template()
+        if template.id != template_id:
+            return {'ok': False, 'error': 'Template expired'}
+        template_transactions = [transaction.copy() for transaction in template.transactions]
+        txs = list(template.hashes)
     if isinstance(txs, str):
         txs = txs.split(',')
         if txs == ['']:
             txs = []
     previous_hash = split_block_content(block_content)[0]
-    next_block_id = await db.get_next_block_id()
-    if id is None:
+    chain_state = await get_chain_state()
+    next_block_id = chain_state.height + 1
+    if id is None and previous_hash == chain_state.last_block.get('hash'):
+        id = next_block_id
+    elif id is None:
         previous_block = await db.get_block(previous_hash)
         if previous_block is None:
             if 'Sender-Node' in request.headers:
@@ -274,9 +446,9 @@ async def push_block(request: Request, background_tasks: BackgroundTasks, block_
         return {'ok': False, 'error': 'Blocks missing, had to sync according to sender node, block may have been accepted'}
     if next_block_id > id:
         return {'ok': False, 'error': 'Too old block'}
-    final_transactions = []
+    final_transactions = template_transactions or []
     hashes = []
-    for tx_hex in txs:
+    for tx_hex in txs if template_transactions is None else []:
         if len(tx_hex) == 64:  # it's an hash
             hashes.append(tx_hex)
         else:
@@ -308,17 +480,17 @@ async def sync(node_url: str = None):
 
 @app.get("/get_mining_info")
 async def get_mining_info(background_tasks: BackgroundTasks):
-    Manager.difficulty = None
-    difficulty, last_block = await get_difficulty()
-    pending_transactions = await db.get_pending_transactions_limit(1000, True)
-    if random.randint(0, 10 + len(pending_transactions)) == 0:
+    template = await get_block_template()
+    # with the mempool, pending transactions are evicted when blocks are connected and disconnected
+    if db.mempool is None and random.randint(0, 10 + len(template.transactions)) == 0:
         background_tasks.add_task(clear_pending_transactions)
     return {'ok': True, 'result': {
-        'difficulty': difficulty,
-        'last_block': last_block,
-        'pending_transactions': pending_transactions[:10],
-        'pending_transactions_hashes': (sha256(tx) for tx in pending_transactions),
-        'merkle_root': get_transactions_merkle_tree(pending_transactions[:10])
+        'difficulty': template.difficulty,
+        'last_block': block_to_json(template.last_block),
+        'pending_transactions': [transaction.hex() for transaction in template.transactions[:10]],
+        'pending_transactions_hashes': template.hashes,
+        'merkle_root': template.merkle_root,
+        'template_id': template.id
     }}
 
 
@@ -327,8 +499,8 @@ async def get_address_info(address: str, transactions_count_limit: int = 5):
     outputs = await db.get_spendable_outputs(address)
     balance = sum(output.amount for output in outputs)
     return {'ok': True, 'result': {
-        'balance': balance,
-        'spendable_outputs': [{'amount': output.amount, 'tx_hash': output.tx_hash, 'index': output.index} for output in outputs],
+        'balance': smallest_to_decimal(balance),
+        'spendable_outputs': [{'amount': smallest_to_decimal(output.amount), 'tx_hash': output.tx_hash, 'index': output.index} for output in outputs],
         'transactions': [await transaction_to_json(tx) for tx in await db.get_address_transactions(address, limit=transactions_count_limit, check_signatures=True)]
     }}
 
@@ -352,6 +524,20 @@ async def add_node(url: str, background_tasks: BackgroundTasks):
             return {'ok': False, 'error': 'Could not add node'}
 
 
+@app.get("/get_cache_stats")
+async def get_cache_stats():
+    cache = db.unspent_outputs_cache
+    return {'ok': True, 'result': {
+        'unspent_outputs': cache.stats() if cache is not None else None,
+        'transactions': Transaction.parsed_cache.stats() if Transaction.parsed_cache is not None else None,
+        'addresses': helpers.address_cache.stats() if helpers.address_cache is not None else None,
+        'verified_signatures': Transaction.verified_cache.stats() if Transaction.verified_cache is not None else None,
+        'mempool': db.mempool.stats() if db.mempool is not None else None,
+        'block_template': manager.block_template.stats(),
+        'admission_queue': admission_queue.stats()
+    }}
+
+
 @app.get("/get_nodes")
 async def get_nodes():
     nodes = NodesManager.get_nodes()
@@ -368,6 +554,8 @@ async def get_transaction(tx_hash: str, verify: bool = False):
     tx = await db.get_transaction(tx_hash) or await db.get_pending_transaction(tx_hash)
     if tx is None:
         return {'ok': False, 'error': 'Transaction not found'}
+    if verify:
+        await db.fill_related_outputs([tx], with_transactions=True)
     transaction = await transaction_to_json(tx, verify)
     return {'ok': True, 'result': transaction}
 
@@ -386,7 +574,7 @@ async def get_block(block: str, full_transactions: bool = False):
     if block_info:
         txs = await db.get_block_transactions(block_hash)
         return {'ok': True, 'result': {
-            'block': block_info,
+            'block': block_to_json(block_info),
             'transactions': [tx.hex() for tx in txs],
             'full_transactions': [await transaction_to_json(tx) for tx in txs] if full_transactions else None
         }}
@@ -397,4 +585,4 @@ async def get_block(block: str, full_transactions: bool = False):
 @app.get("/get_blocks")
 async def get_blocks(offset: int, limit: int):
     blocks = await db.get_blocks(offset, limit)
-    return {'ok': True, 'result': blocks}
+    return {'ok': True, 'result': [{**block, 'block': block_to_json(block['block'])} for block in blocks]}
@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from typing import List, Tuple, Dict, Optional
+
+from fastecdsa import ecdsa
+from fastecdsa.point import Point
+
+from .constants import CURVE
+
+# a core is left to the event loop
+DEFAULT_WORKERS = max(1, (cpu_count() or 1) - 1)
+
+
+def _verify_signature(message: str, signed: Tuple[int, int], x: int, y: int) -> bool:
+    # same two attempts as TransactionInput.verify, the bytes of the message first as wallets sign them
+    public_key = Point(x, y, CURVE)
+    return ecdsa.verify(signed, bytes.fromhex(message), public_key, CURVE) or ecdsa.verify(signed, message, public_key, CURVE)
+
+
+def _verify_signatures(items: List[tuple]) -> List[bool]:
+    return [_verify_signature(*item) for item in items]
+
+
+class SignatureVerifier:
+    """
+    Verifies the input signatures of many transactions at once, in a pool of worker processes.
+    Identical (message, signature, public key) triples are verified once.
+    With workers set to 0, or fewer than min_parallel signatures, they are verified in this process,
+    on a thread of the default executor so the event loop is not blocked.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, chunk_size: int = 128, min_parallel: int = 64):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.min_parallel = min_parallel
+        self.pool: ProcessPoolExecutor = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    async def verify(self, items: List[Tuple[str, Tuple[int, int], Point]]) -> List[bool]:
+        """Returns whether each (message, signature, public key) is valid."""
+        unique: Dict[tuple, int] = {}
+        for message, signed, public_key in items:
+            unique.setdefault((message, signed, public_key.x, public_key.y), len(unique))
+        unique_items = list(unique)
+        loop = asyncio.get_running_loop()
+        if not unique_items:
+            results = []
+        elif not self.workers or len(unique_items) < self.min_parallel:
+            results = await loop.run_in_executor(None, _verify_signatures, unique_items)
+        else:
+            pool = self._get_pool()
+            chunk_size = max(1, min(self.chunk_size, -(-len(unique_items) // self.workers)))
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(pool, _verify_signatures, unique_items[i:i + chunk_size])
+                for i in range(0, len(unique_items), chunk_size)
+            ))
+            results = [result for chunk in chunks for result in chunk]
+        return [results[unique[(message, signed, public_key.x, public_key.y)]] for message, signed, public_key in items]
+
+    async def verify_transactions(self, transactions: list, public_keys: Dict[Tuple[str, int], Point] = None) -> List[Optional[bool]]:
+        """
+        Returns whether the inputs of each transaction are correctly signed.
+        The public key of an input is taken from public_keys, then from the input and its related output.
+        None is returned for a transaction with an input whose public key is not known.
+        """
+        public_keys = public_keys or {}
+        items, owners, results = [], [], []
+        for i, transaction in enumerate(transactions):
+            tx_items = []
+            for tx_input in transaction.inputs:
+                public_key = public_keys.get((tx_input.tx_hash, tx_input.index))
+                if public_key is None:
+                    public_key = tx_input.public_key if tx_input.public_key is not None else tx_input.related_output.public_key if tx_input.related_output is not None else None
+                if public_key is None or tx_input.signed is None:
+                    break
+                tx_items.append((transaction.hex(False), tx_input.signed, public_key))
+            else:
+                items += tx_items
+                owners += [i] * len(tx_items)
+                results.append(True)
+                continue
+            results.append(None if tx_input.signed is not None else False)
+        for owner, valid in zip(owners, await self.verify(items)):
+            results[owner] = results[owner] and valid
+        return results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
@@ -1,74 +1,172 @@
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Union, Tuple
+from typing import List, Union, Tuple, Dict
 from pathlib import Path
 
 from .sqlitepool import Pool
 
-from .helpers import sha256, point_to_string, string_to_point, point_to_bytes, AddressFormat, normalize_block
-from .transactions import Transaction, CoinbaseTransaction, TransactionInput
+from .helpers import sha256, point_to_string, string_to_point, normalize_block, bytes_to_string
+from .transactions import Transaction, CoinbaseTransaction, TransactionInput, TransactionOutput
 
 from . import Database
+from .database import BINARY_COLUMNS, AMOUNT_COLUMNS
 
 LOCAL_DB_NAME = "DB/denarolite.db"
 
+
+def _placeholders(values: list, start: int = 1) -> str:
+    """'$1, $2, ...' for a list of values, '($1, $2), ($3, $4), ...' for a list of tuples"""
+    if values and isinstance(values[0], tuple):
+        width = len(values[0])
+        return ', '.join('(' + ', '.join(f'${start + i * width + j}' for j in range(width)) + ')' for i in range(len(values)))
+    return ', '.join(f'${start + i}' for i in range(len(values)))
+
+
+def _outpoints_args(outpoints: List[Tuple[str, int]]) -> list:
+    return [arg for tx_hash, index in outpoints for arg in (bytes.fromhex(tx_hash), index)]
+
 class LiteDatabase(Database) :
 
     credentials = {}
     instance = None
     pool: Pool = None
-    
+    secondary_indexes = {
+        'outputs_address_idx': 'CREATE INDEX IF NOT EXISTS outputs_address_idx ON outputs (address)',
+        'outputs_spent_by_idx': 'CREATE INDEX IF NOT EXISTS outputs_spent_by_idx ON outputs (spent_by)',
+        'spent_outpoints_outpoint_idx': 'CREATE INDEX IF NOT EXISTS spent_outpoints_outpoint_idx ON spent_outpoints (tx_hash, _index)',
+        'spent_outpoints_spent_by_idx': 'CREATE INDEX IF NOT EXISTS spent_outpoints_spent_by_idx ON spent_outpoints (spent_by)',
+    }
+
     @staticmethod
     async def createTable():
         self = await LiteDatabase.get()
-        async with self.pool.acquire() as conn:
+        async with self.pool.acquire() as conn, conn.transaction():
+            unspent_outputs_columns = [row['name'] for row in await conn.fetch('PRAGMA table_info(unspent_outputs)')]
+            rebuild_unspent_outputs = bool(unspent_outputs_columns) and 'amount' not in unspent_outputs_columns
+            if rebuild_unspent_outputs:
+                await conn.execute('DROP TABLE unspent_outputs')
+
+            # tables created when transactions and hashes were stored as hex, or amounts as decimals,
+            # are renamed and copied into the new ones with their columns converted
+            conversions = {}
+            tables = [row['name'] for row in await conn.fetch("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            if 'tx_hex' in [row['name'] for row in await conn.fetch('PRAGMA table_info(transactions)')]:
+                print('Converting transactions and hashes to binary... This will take a few minutes')
+                for table in BINARY_COLUMNS:
+                    if table in tables:
+                        conversions.setdefault(table, {}).update({column: f'unhex({column})' for column in BINARY_COLUMNS[table]})
+            decimal_columns = {}
+            for table, columns in AMOUNT_COLUMNS.items():
+                table_columns = [row['name'] for row in await conn.fetch(f'PRAGMA table_info({table})') if row['name'] in columns and row['type'].startswith('DECTEXT')]
+                if table_columns:
+                    decimal_columns[table] = table_columns
+            if decimal_columns:
+                print('Converting amounts to integers... This will take a few minutes')
+                for table, columns in decimal_columns.items():
+                    conversions.setdefault(table, {}).update({column: f'smallest({column})' for column in columns})
+            if conversions:
+                for name in LiteDatabase.secondary_indexes:
+                    await conn.execute(f'DROP INDEX IF EXISTS {name}')
+                for table in conversions:
+                    await conn.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+
             await conn.execute('''CREATE TABLE IF NOT EXISTS blocks (
                 id SERIAL PRIMARY KEY,
-                hash CHAR(64) UNIQUE,
+                hash BLOB UNIQUE,
                 address VARCHAR(128) NOT NULL,
                 random BIGINT NOT NULL,
                 difficulty DECTEXT(3, 1) NOT NULL,
-                reward DECTEXT(14, 6) NOT NULL,
+                reward INTEGER NOT NULL,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
             );''')
 
             await conn.execute('''CREATE TABLE IF NOT EXISTS transactions (
-                block_hash CHAR(64) NOT NULL REFERENCES blocks(hash) ON DELETE CASCADE,
-                tx_hash CHAR(64) UNIQUE,
-                tx_hex VARCHAR(2048) UNIQUE,
+                block_hash BLOB NOT NULL REFERENCES blocks(hash) ON DELETE CASCADE,
+                tx_hash BLOB UNIQUE,
+                tx_bytes BLOB,
                 inputs_addresses TEXT[],
-                fees DECTEXT(14, 6) NOT NULL
+                fees INTEGER NOT NULL
             );''')
 
 
             await conn.execute('''CREATE TABLE IF NOT EXISTS unspent_outputs (
-                tx_hash CHAR(64) REFERENCES transactions(tx_hash),
-                _index SMALLINT NOT NULL
+                tx_hash BLOB REFERENCES transactions(tx_hash),
+                _index SMALLINT NOT NULL,
+                address_bytes BLOB NOT NULL,
+                amount INTEGER NOT NULL,
+                PRIMARY KEY (tx_hash, _index)
+            );''')
+
+            await conn.execute('''CREATE TABLE IF NOT EXISTS outputs (
+                tx_hash BLOB REFERENCES transactions(tx_hash),
+                _index SMALLINT NOT NULL,
+                address TEXT NOT NULL,
+                amount INTEGER NOT NULL,
+                spent_by BLOB REFERENCES transactions(tx_hash),
+                PRIMARY KEY (tx_hash, _index)
+            );''')
+
+            await conn.execute('''CREATE TABLE IF NOT EXISTS spent_outpoints (
+                tx_hash BLOB NOT NULL,
+                _index SMALLINT NOT NULL,
+                spent_by BLOB NOT NULL,
+                pending BOOLEAN NOT NULL
             );''')
 
             await conn.execute('''CREATE TABLE IF NOT EXISTS pending_transactions (
-                tx_hash CHAR(64) UNIQUE,
-                tx_hex VARCHAR(2048) UNIQUE,
+                tx_hash BLOB UNIQUE,
+                tx_bytes BLOB,
                 inputs_addresses TEXT[],
-                fees DECTEXT(14, 6) NOT NULL
+                fees INTEGER NOT NULL
+            );''')
+
+            fill_pending_outputs = 'pending_transactions' in tables and 'pending_outputs' not in tables
+            await conn.execute('''CREATE TABLE IF NOT EXISTS pending_outputs (
+                tx_hash BLOB NOT NULL,
+                address TEXT NOT NULL,
+                amount INTEGER NOT NULL
+            );''')
+            await conn.execute('CREATE INDEX IF NOT EXISTS pending_outputs_tx_hash_idx ON pending_outputs (tx_hash)')
+            await conn.execute('CREATE INDEX IF NOT EXISTS pending_outputs_address_idx ON pending_outputs (address)')
+
+            await conn.execute('''CREATE TABLE IF NOT EXISTS assume_valid_state (
+                block_id INTEGER NOT NULL,
+                checkpoint_hash BLOB NOT NULL
             );''')
 
+            for table, table_conversions in conversions.items():
+                columns = [row['name'] for row in await conn.fetch(f'PRAGMA table_info({table}_old)')]
+                await conn.execute(
+                    f'INSERT INTO {table} ({", ".join("tx_bytes" if column == "tx_hex" else column for column in columns)}) '
+                    f'SELECT {", ".join(table_conversions.get(column, column) for column in columns)} FROM {table}_old'
+                )
+                await conn.execute(f'DROP TABLE {table}_old')
+
+            # dropped while a node bulk-syncs, created back here if it was interrupted
+            for statement in LiteDatabase.secondary_indexes.values():
+                await conn.execute(statement)
 
+        if rebuild_unspent_outputs:
+            print('Rebuilding unspent outputs... This will take a few minutes')
+            await self.add_unspent_outputs(await self.get_unspent_outputs_from_all_transactions())
+        if fill_pending_outputs:
+            await self.fill_pending_outputs()
 
     @staticmethod
     async def create(user='denaro', password='', database='denaro', host='127.0.0.1'):
         self = LiteDatabase()
-        
-        self.pool = Pool(database= LOCAL_DB_NAME)
-        
-        LiteDatabase.instance = self
 
         dbPath = Path(LOCAL_DB_NAME)
         if not dbPath.exists() : 
             if not dbPath.parent.exists():
                 dbPath.parent.mkdir(parents=True, exist_ok=True)
             dbPath.touch(exist_ok=True)
-            await self.createTable()
+
+        self.pool = Pool(database= LOCAL_DB_NAME)
+        
+        LiteDatabase.instance = self
+
+        await self.createTable()
         return self
 
     @staticmethod
@@ -83,7 +181,7 @@ class LiteDatabase(Database) :
     #     tx_hex = transaction.hex()
     #     if await self.get_transaction(sha256(tx_hex), False) is not None or not await transaction.verify():
     #         return False
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         await connection.fetch(
     #             'INSERT INTO pending_transactions (tx_hash, tx_hex, inputs_addresses, fees) VALUES ($1, $2, $3, $4)',
     #             sha256(tx_hex),
@@ -94,31 +192,39 @@ class LiteDatabase(Database) :
     #     return True
 
     # async def remove_pending_transaction(self, tx_hash: str):
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         await connection.fetch('DELETE FROM pending_transactions WHERE tx_hash = $1', tx_hash)
 
     async def remove_pending_transactions_by_hash(self, tx_hashes: List[str]):
-        async with self.pool.acquire() as connection:
-            await connection.fetch(f'DELETE FROM pending_transactions WHERE tx_hash in ({str(tx_hashes)[1:-1]})')
+        async with self.transaction(), self.acquire() as connection:
+            if self.mempool is not None:
+                self.mempool.remove(tx_hashes)
+            tx_hashes = [(bytes.fromhex(tx_hash),) for tx_hash in tx_hashes]
+            await connection.executemany('DELETE FROM pending_transactions WHERE tx_hash = $1', tx_hashes)
+            await connection.executemany('DELETE FROM pending_outputs WHERE tx_hash = $1', tx_hashes)
+            await connection.executemany('DELETE FROM spent_outpoints WHERE spent_by = $1 AND pending', tx_hashes)
 
     # async def remove_pending_transactions(self):
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         await connection.execute('DELETE FROM pending_transactions')
 
     # async def delete_blockchain(self):
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         await connection.execute('TRUNCATE transactions, blocks RESTART IDENTITY')
 
-    # async def delete_block(self, id: int):
-    #     async with self.pool.acquire() as connection:
-    #         await connection.execute('DELETE FROM blocks WHERE id = $1', id)
-
-    # async def delete_blocks(self, offset: int):
-    #     async with self.pool.acquire() as connection:
-    #         await connection.execute('DELETE FROM blocks WHERE id > $1', offset)
+    async def _delete_blocks_where(self, condition: str, *args):
+        # sqlite does not enforce the foreign keys, so the cascades declared in schema.sql are done by hand
+        blocks_txs = f'SELECT tx_hash FROM transactions WHERE block_hash IN (SELECT hash FROM blocks WHERE {condition})'
+        async with self.acquire() as connection:
+            await connection.execute(f'DELETE FROM spent_outpoints WHERE NOT pending AND spent_by IN ({blocks_txs})', *args)
+            await connection.execute(f'UPDATE outputs SET spent_by = NULL WHERE spent_by IN ({blocks_txs})', *args)
+            await connection.execute(f'DELETE FROM outputs WHERE tx_hash IN ({blocks_txs})', *args)
+            await connection.execute(f'DELETE FROM unspent_outputs WHERE tx_hash IN ({blocks_txs})', *args)
+            await connection.execute(f'DELETE FROM transactions WHERE block_hash IN (SELECT hash FROM blocks WHERE {condition})', *args)
+            await connection.execute(f'DELETE FROM blocks WHERE {condition}', *args)
 
     # async def get_pending_transactions_limit(self, limit: int = 1000, hex_only: bool = False) -> List[Union[Transaction, str]]:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         txs = await connection.fetch(f'SELECT tx_hex FROM pending_transactions ORDER BY fees DESC LIMIT {limit}')
     #     txs_hex = sorted(tx['tx_hex'] for tx in txs)
     #     if hex_only:
@@ -127,50 +233,51 @@ class LiteDatabase(Database) :
 
     async def add_transaction(self, transaction: Union[Transaction, CoinbaseTransaction], block_hash: str):
         """"""
-        tx_hex = transaction.hex()
-        async with self.pool.acquire() as connection:
-            await connection.execute('INSERT INTO transactions (block_hash, tx_hash, tx_hex, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)',
-                block_hash,
-                sha256(tx_hex),
-                tx_hex,
+        await self.fill_related_outputs([transaction])
+        tx_bytes = transaction.tobytes()
+        async with self.acquire() as connection:
+            await connection.execute('INSERT INTO transactions (block_hash, tx_hash, tx_bytes, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)',
+                bytes.fromhex(block_hash),
+                bytes.fromhex(sha256(tx_bytes)),
+                tx_bytes,
                 [point_to_string(await tx_input.get_public_key()) for tx_input in transaction.inputs] if isinstance(transaction, Transaction) else [],
                 transaction.fees if isinstance(transaction, Transaction) else 0
             )
 
     async def add_transactions(self, transactions: List[Union[Transaction, CoinbaseTransaction]], block_hash: str):
         if len(transactions) == 0: return
+        await self.fill_related_outputs(transactions)
         
         data = []
         for transaction in transactions:
+            tx_bytes = transaction.tobytes()
             data.append([
-                block_hash,
-                transaction.hash(),
-                transaction.hex(),
+                bytes.fromhex(block_hash),
+                bytes.fromhex(sha256(tx_bytes)),
+                tx_bytes,
                 [point_to_string(await tx_input.get_public_key()) for tx_input in transaction.inputs] if isinstance(transaction, Transaction) else [],
                 transaction.fees if isinstance(transaction, Transaction) else 0
             ])
         
-        async with self.pool.acquire() as connection:
-            await connection.executemany('INSERT INTO transactions (block_hash, tx_hash, tx_hex, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)', data)
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO transactions (block_hash, tx_hash, tx_bytes, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)', data)
 
 
-    async def add_block(self, id: int, block_hash: str, address: str, random: int, difficulty: Decimal, reward: Decimal, timestamp: Union[datetime, str]):
+    async def add_block(self, id: int, block_hash: str, address: str, random: int, difficulty: Decimal, reward: int, timestamp: Union[datetime, str]):
         """"""
-        async with self.pool.acquire() as connection:
+        async with self.acquire() as connection:
             await connection.execute('INSERT INTO blocks (id, hash, address, random, difficulty, reward, timestamp) VALUES ($1, $2, $3, $4, $5, $6, $7)',
                 id,
-                block_hash,
+                bytes.fromhex(block_hash),
                 address,
                 random,
                 difficulty,
                 reward,
                 timestamp if isinstance(timestamp, datetime) else datetime.utcfromtimestamp(timestamp)
             )
-        from .manager import Manager
-        Manager.difficulty = None
 
     # async def get_transaction(self, tx_hash: str, check_signatures: bool = True) -> Union[Transaction, CoinbaseTransaction]:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         res = tx = await connection.fetchrow('SELECT tx_hex, block_hash FROM transactions WHERE tx_hash = $1', tx_hash)
     #     if res is not None:
     #         tx = await Transaction.from_hex(res['tx_hex'], check_signatures)
@@ -178,79 +285,67 @@ class LiteDatabase(Database) :
     #     return tx
 
     # async def get_pending_transaction(self, tx_hash: str, check_signatures: bool = True) -> Transaction:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         res = await connection.fetchrow('SELECT tx_hex FROM pending_transactions WHERE tx_hash = $1', tx_hash)
     #     return await Transaction.from_hex(res['tx_hex'], check_signatures) if res is not None else None
 
     async def get_pending_transactions_by_hash(self, hashes: List[str], check_signatures: bool = True) -> List[Transaction]:
-        async with self.pool.acquire() as connection:
-            res = await connection.fetch(f'''SELECT tx_hex FROM pending_transactions WHERE tx_hash in ({str(hashes)[1:-1]})''')
-        return [await Transaction.from_hex(tx['tx_hex'], check_signatures) for tx in res]
+        if self.mempool is not None:
+            return [self.mempool.get(tx_hash).copy() for tx_hash in hashes if tx_hash in self.mempool]
+        async with self.acquire() as connection:
+            res = await connection.fetch(f'SELECT tx_bytes FROM pending_transactions WHERE tx_hash IN ({_placeholders(hashes)})', *[bytes.fromhex(tx_hash) for tx_hash in hashes])
+        return [await Transaction.from_hex(tx['tx_bytes'], check_signatures) for tx in res]
 
     async def get_transactions(self, tx_hashes: List[str]):
-        async with self.pool.acquire() as connection:
-            res = await connection.fetch(f'SELECT tx_hex FROM transactions WHERE tx_hex in ({str(tx_hashes)[1:-1]})')
-        return {sha256(res['tx_hex']): await Transaction.from_hex(res['tx_hex']) for res in res}
+        async with self.acquire() as connection:
+            res = await connection.fetch(f'SELECT tx_hash, tx_bytes, block_hash FROM transactions WHERE tx_hash IN ({_placeholders(tx_hashes)})', *[bytes.fromhex(tx_hash) for tx_hash in tx_hashes])
+        transactions = {}
+        for row in res:
+            tx = transactions[row['tx_hash'].hex()] = await Transaction.from_hex(row['tx_bytes'])
+            tx.block_hash = row['block_hash'].hex()
+        return transactions
 
+    async def get_pending_transactions_by_contains(self, contains: str):
+        async with self.acquire() as connection:
+            res = await connection.fetch('SELECT tx_bytes FROM pending_transactions WHERE instr(tx_bytes, $1) > 0 AND tx_hash != $1', bytes.fromhex(contains))
+        return [await Transaction.from_hex(res['tx_bytes']) for res in res]
 
-    async def get_transaction_by_contains_multi(self, contains: List[str], ignore: str = None):
-        async with self.pool.acquire() as connection:
-            if ignore is not None:
-                res = await connection.fetchrow(f'''SELECT tx_hash FROM transactions WHERE ({str(" or ".join([f'tx_hex LIKE "%{contains}%"' for contains in contains]))}) AND tx_hash != ? LIMIT 1''',
-                    ignore
-                )
-            else:
-                res = await connection.fetchrow(
-                    f'''SELECT tx_hash FROM transactions WHERE ({str(" or ".join([f'tx_hex LIKE "%{contains}%"' for contains in contains]))}) LIMIT 1'''
-                )
-        return await Transaction.from_hex(res['tx_hex']) if res is not None else None
 
     # async def get_pending_transactions_by_contains(self, contains: str):
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         res = await connection.fetch('SELECT tx_hex FROM pending_transactions WHERE tx_hex LIKE $1 AND tx_hash != $2', f"%{contains}%", contains)
     #     return [await Transaction.from_hex(res['tx_hex']) for res in res] if res is not None else None
 
-    async def get_pending_transaction_by_contains_multi(self, contains: List[str], ignore: str = None):
-        async with self.pool.acquire() as connection:
-            if ignore is not None:
-                res = await connection.fetchrow(f'''SELECT tx_hash FROM transactions WHERE ({str(" or ".join([f'tx_hex LIKE "%{contains}%"' for contains in contains]))}) AND tx_hash != ? LIMIT 1''',
-                    ignore
-                )
-            else:
-                res = await connection.fetchrow(
-                    f'''SELECT tx_hash FROM transactions WHERE ({str(" or ".join([f'tx_hex LIKE "%{contains}%"' for contains in contains]))}) LIMIT 1'''
-                )
-        return await Transaction.from_hex(res['tx_hex']) if res is not None else None
-
     # async def get_last_block(self) -> dict:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         last_block = await connection.fetchrow("SELECT * FROM blocks ORDER BY id DESC LIMIT 1")
     #     return normalize_block(last_block) if last_block is not None else None
 
     # async def get_next_block_id(self) -> int:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         last_id = await connection.fetchval('SELECT id FROM blocks ORDER BY id DESC LIMIT 1', column=0)
     #     last_id = last_id if last_id is not None else 0
     #     return last_id + 1
 
     # async def get_block(self, block_hash: str) -> dict:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         block = await connection.fetchrow('SELECT * FROM blocks WHERE hash = $1', block_hash)
     #     return normalize_block(block) if block is not None else None
 
     async def get_blocks(self, offset: int, limit: int) -> list:
-        async with self.pool.acquire() as connection:
-            transactions: list = await connection.fetch(f'SELECT tx_hex, block_hash FROM transactions WHERE EXISTS (SELECT hash FROM blocks WHERE id >= $1 ORDER BY id LIMIT $2)', offset, limit)
+        async with self.acquire() as connection:
+            transactions: list = await connection.fetch(f'SELECT tx_bytes, block_hash FROM transactions WHERE block_hash IN (SELECT hash FROM blocks WHERE id >= $1 ORDER BY id LIMIT $2)', offset, limit)
             blocks = await connection.fetch(f'SELECT * FROM blocks WHERE id >= $1 ORDER BY id LIMIT $2', offset, limit)
         result = []
         for block in blocks:
+            block_hash = block['hash']
             block = normalize_block(block)
             txs = []
             for transaction in transactions.copy():
-                if transaction['block_hash'] == block['hash']:
+                if transaction['block_hash'] == block_hash:
                     transactions.remove(transaction)
-                    if isinstance(await Transaction.from_hex(transaction['tx_hex']), Transaction):
-                        txs.append(transaction['tx_hex'])
+                    if isinstance(await Transaction.from_hex(transaction['tx_bytes']), Transaction):
+                        txs.append(transaction['tx_bytes'].hex())
             result.append({
                 'block': block,
                 'transactions': txs
@@ -258,35 +353,41 @@ class LiteDatabase(Database) :
         return result
 
     # async def get_block_by_id(self, block_id: int) -> dict:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         block = await connection.fetchrow('SELECT * FROM blocks WHERE id = $1', block_id)
     #     return normalize_block(block) if block is not None else None
 
     # async def get_block_transactions(self, block_hash: str, check_signatures: bool = True) -> List[Union[Transaction, CoinbaseTransaction]]:
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         txs = await connection.fetch('SELECT * FROM transactions WHERE block_hash = $1', block_hash)
     #     return [await Transaction.from_hex(tx['tx_hex'], check_signatures) for tx in txs] if txs is not None else None
 
-    async def add_unspent_outputs(self, outputs: List[Tuple[str, int]]) -> None:
-        async with self.pool.acquire() as connection:
-            await connection.executemany('INSERT INTO unspent_outputs (tx_hash, _index) VALUES ($1, $2)', outputs)
+    async def _insert_unspent_outputs(self, outputs: List[Tuple[str, int, bytes, int]]) -> None:
+        outputs = [(bytes.fromhex(tx_hash), index, address_bytes, amount) for tx_hash, index, address_bytes, amount in outputs]
+        if not outputs:
+            return
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO unspent_outputs (tx_hash, _index, address_bytes, amount) VALUES ($1, $2, $3, $4)', outputs)
 
     # async def add_unspent_transactions_outputs(self, transactions: List[Transaction]) -> None:
     #     outputs = sum([[(transaction.hash(), index) for index in range(len(transaction.outputs))] for transaction in transactions], [])
     #     await self.add_unspent_outputs(outputs)
 
-    async def remove_unspent_outputs(self, transactions: List[Transaction]) -> None:
-        inputs = sum([[(tx_input.tx_hash, tx_input.index) for tx_input in transaction.inputs] for transaction in transactions], [])
-        async with self.pool.acquire() as connection:
-            await connection.execute(f'DELETE FROM unspent_outputs WHERE (tx_hash, _index) IN (VALUES {str(inputs)[1:-1]})')
+    async def _delete_unspent_outputs(self, outputs: List[Tuple[str, int]]) -> None:
+        if not outputs:
+            return
+        async with self.acquire() as connection:
+            await connection.executemany('DELETE FROM unspent_outputs WHERE tx_hash = $1 AND _index = $2', [(bytes.fromhex(tx_hash), index) for tx_hash, index in outputs])
 
-    async def get_unspent_outputs(self, outputs: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
-        async with self.pool.acquire() as connection:
-            results = await connection.fetch(f'SELECT tx_hash, _index FROM unspent_outputs WHERE (tx_hash, _index) IN (VALUES {str(outputs)[1:-1]})')
-            return [(row['tx_hash'], row['_index']) for row in results]
+    async def _select_unspent_outputs_info(self, outputs: List[Tuple[str, int]]) -> Dict[Tuple[str, int], TransactionOutput]:
+        if not outputs:
+            return {}
+        async with self.acquire() as connection:
+            results = await connection.fetch(f'SELECT tx_hash, _index, address_bytes, amount FROM unspent_outputs WHERE (tx_hash, _index) IN (VALUES {_placeholders(outputs)})', *_outpoints_args(outputs))
+        return {(row['tx_hash'].hex(), row['_index']): TransactionOutput(bytes_to_string(row['address_bytes']), row['amount']) for row in results}
 
     # async def get_unspent_outputs_from_all_transactions(self):
-    #     async with self.pool.acquire() as connection:
+    #     async with self.acquire() as connection:
     #         txs = await connection.fetch('SELECT tx_hex FROM transactions WHERE true')
     #         transactions = {sha256(tx['tx_hex']): await Transaction.from_hex(tx['tx_hex'], False) for tx in txs}
     #         outputs = sum([[(transaction.hash(), index) for index in range(len(transaction.outputs))] for transaction in transactions.values()], [])
@@ -298,80 +399,85 @@ class LiteDatabase(Database) :
     #                     outputs.remove((tx_input.tx_hash, tx_input.index))
     #         return outputs
 
-    def intersetAddresse(self, addresses, rets):
-        txs_ = []
-        for address in addresses:
-            for row in rets:
-                inputs_addresses = row['inputs_addresses'] 
-                if address in inputs_addresses:
-                    txs_.append(row)
-        return txs_
+    async def add_outputs(self, outputs: List[Tuple[str, int, str, int, str]]) -> None:
+        outputs = [(bytes.fromhex(tx_hash), index, address, amount, bytes.fromhex(spent_by) if spent_by is not None else None) for tx_hash, index, address, amount, spent_by in outputs]
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO outputs (tx_hash, _index, address, amount, spent_by) VALUES ($1, $2, $3, $4, $5)', outputs)
+
+    async def spend_outputs(self, transactions: List[Transaction]) -> None:
+        inputs = sum([[(bytes.fromhex(transaction.hash()), bytes.fromhex(tx_input.tx_hash), tx_input.index) for tx_input in transaction.inputs] for transaction in transactions], [])
+        async with self.acquire() as connection:
+            await connection.executemany('UPDATE outputs SET spent_by = $1 WHERE tx_hash = $2 AND _index = $3', inputs)
+
+    async def add_spent_outpoints(self, transactions: List[Transaction], pending: bool = False) -> None:
+        outpoints = sum([[(bytes.fromhex(tx_input.tx_hash), tx_input.index, bytes.fromhex(transaction.hash()), pending) for tx_input in transaction.inputs] for transaction in transactions], [])
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO spent_outpoints (tx_hash, _index, spent_by, pending) VALUES ($1, $2, $3, $4)', outpoints)
+
+    async def get_outpoints_spender(self, outpoints: List[Tuple[str, int]], pending: bool = False, ignore: str = None) -> Union[str, None]:
+        if not outpoints:
+            return None
+        n = len(outpoints) * 2
+        async with self.acquire() as connection:
+            spender = await connection.fetchval(
+                f'SELECT spent_by FROM spent_outpoints WHERE (tx_hash, _index) IN (VALUES {_placeholders(outpoints)}) AND pending = ${n + 1} AND spent_by IS NOT ${n + 2} LIMIT 1',
+                *_outpoints_args(outpoints),
+                pending,
+                bytes.fromhex(ignore) if ignore is not None else None
+            )
+        return spender.hex() if spender is not None else None
+
+    async def fill_spent_outpoints(self) -> None:
+        async with self.acquire() as connection:
+            await connection.execute('INSERT INTO spent_outpoints (tx_hash, _index, spent_by, pending) SELECT tx_hash, _index, spent_by, false FROM outputs WHERE spent_by IS NOT NULL')
+            txs = await connection.fetch('SELECT tx_bytes FROM pending_transactions')
+        await self.add_spent_outpoints([await Transaction.from_hex(tx['tx_bytes']) for tx in txs], pending=True)
+
+    async def add_bulk_ingest(self, bulk_ingest) -> None:
+        records = self._bulk_ingest_records(bulk_ingest)
+        async with self.acquire() as connection:
+            await connection.executemany('INSERT INTO blocks (id, hash, address, random, difficulty, reward, timestamp) VALUES ($1, $2, $3, $4, $5, $6, $7)', records['blocks'])
+            await connection.executemany('INSERT INTO transactions (block_hash, tx_hash, tx_bytes, inputs_addresses, fees) VALUES ($1, $2, $3, $4, $5)', records['transactions'])
+            await connection.executemany('INSERT INTO outputs (tx_hash, _index, address, amount, spent_by) VALUES ($1, $2, $3, $4, $5)', records['outputs'])
+            await connection.executemany('UPDATE outputs SET spent_by = $1 WHERE tx_hash = $2 AND _index = $3', records['spent_by'])
+            await connection.executemany('INSERT INTO spent_outpoints (tx_hash, _index, spent_by, pending) VALUES ($1, $2, $3, $4)', records['spent_outpoints'])
+        await self._add_bulk_ingest_unspent_outputs(bulk_ingest)
+        await self.evict_pending_transactions(bulk_ingest.transactions_hashes, [outpoint[:2] for outpoint in bulk_ingest.spent_outpoints])
 
     async def get_address_transactions(self, address: str, check_pending_txs: bool = False, check_signatures: bool = False, limit: int = 50) -> List[Union[Transaction, CoinbaseTransaction]]:
         point = string_to_point(address)
-        search = ['%' + point_to_bytes(string_to_point(address), address_format).hex() + '%' for address_format in list(AddressFormat)]
-        addresses = [point_to_string(point, address_format) for address_format in list(AddressFormat)]
-        async with self.pool.acquire() as connection:
-            rets = await connection.fetch(f'''SELECT tx_hex, inputs_addresses, blocks.id AS block_no FROM transactions INNER JOIN blocks ON (transactions.block_hash = blocks.hash) WHERE {str(" or ".join([f'tx_hex LIKE "%{s}%"' for s in search]))} ORDER BY block_no DESC''')
-            txs = self.intersetAddresse(addresses, rets)[:limit]
+        async with self.acquire() as connection:
+            txs = await connection.fetch('SELECT tx_bytes, blocks.id AS block_no FROM transactions INNER JOIN blocks ON (transactions.block_hash = blocks.hash) WHERE tx_hash IN (SELECT tx_hash FROM outputs WHERE address = $1 UNION SELECT spent_by FROM outputs WHERE address = $1) ORDER BY block_no DESC LIMIT $2', point_to_string(point), limit)
             if check_pending_txs:
-                rets = await connection.fetch(f'''SELECT tx_hex, inputs_addresses FROM pending_transactions WHERE {str(" or ".join([f'tx_hex LIKE "%{s}%"' for s in addresses]))}''')
-                txs += self.intersetAddresse(addresses, rets)
-        return [await Transaction.from_hex(tx['tx_hex'], check_signatures) for tx in txs]
+                txs += await connection.fetch(
+                    'SELECT tx_bytes FROM pending_transactions WHERE tx_hash IN (SELECT tx_hash FROM pending_outputs WHERE address = $1 UNION '
+                    'SELECT spent_outpoints.spent_by FROM outputs INNER JOIN spent_outpoints ON (spent_outpoints.tx_hash = outputs.tx_hash AND spent_outpoints._index = outputs._index) WHERE outputs.address = $1 AND spent_outpoints.pending)',
+                    point_to_string(point)
+                )
+        return [await Transaction.from_hex(tx['tx_bytes'], check_signatures) for tx in txs]
 
     async def get_spendable_outputs(self, address: str, check_pending_txs: bool = False) -> List[TransactionInput]:
         point = string_to_point(address)
-        search = ['%'+point_to_bytes(string_to_point(address), address_format).hex()+'%' for address_format in list(AddressFormat)]
-        addresses = [point_to_string(point, address_format) for address_format in list(AddressFormat)]
-        async with self.pool.acquire() as connection:
-            txs = await connection.fetch(f'''SELECT tx_hex FROM transactions WHERE {str(" or ".join([f'tx_hex LIKE "%{s}%"' for s in search]))}''')
-
-            
-            rets = await connection.fetch("SELECT tx_hex, inputs_addresses FROM transactions")
-            spender_txs = self.intersetAddresse(addresses, rets)
-            if check_pending_txs:
-                rets = await connection.fetch("SELECT tx_hex, inputs_addresses FROM pending_transactions")
-                spender_txs += self.intersetAddresse(addresses, rets)
+        # without the mempool, the outputs spent by pending transactions are left out through spent_outpoints
+        not_pending = ' AND NOT EXISTS (SELECT 1 FROM spent_outpoints WHERE spent_outpoints.tx_hash = outputs.tx_hash AND spent_outpoints._index = outputs._index AND pending)' if check_pending_txs and self.mempool is None else ''
+        async with self.acquire() as connection:
+            outputs = await connection.fetch(f'SELECT tx_hash, _index, amount FROM outputs WHERE address = $1 AND spent_by IS NULL{not_pending}', point_to_string(point))
+        pending_spent_outputs = self.mempool.spenders if check_pending_txs and self.mempool is not None else set()
         inputs = []
-        outputs = []
-        for tx in txs:
-            tx_hash = sha256(tx['tx_hex'])
-            tx = await Transaction.from_hex(tx['tx_hex'], check_signatures=False)
-            for i, tx_output in enumerate(tx.outputs):
-                if tx_output.address in addresses:
-                    tx_input = TransactionInput(tx_hash, i)
-                    tx_input.amount = tx_output.amount
-                    tx_input.transaction = tx
-                    outputs.append((tx_hash, i))
-                    inputs.append(tx_input)
-        for spender_tx in spender_txs:
-            spender_tx = await Transaction.from_hex(spender_tx['tx_hex'], check_signatures=False)
-            for tx_input in spender_tx.inputs:
-                if (tx_input.tx_hash, tx_input.index) in outputs:
-                    outputs.remove((tx_input.tx_hash, tx_input.index))
-
-        unspent_outputs = await self.get_unspent_outputs(outputs)
-
-        final = []
-        for tx_input in inputs:
-            if (tx_input.tx_hash, tx_input.index) in unspent_outputs:
-                final.append(tx_input)
-
-        return final
-
-    async def get_address_balance(self, address: str, check_pending_txs: bool = False) -> Decimal:
-        balance = Decimal(0)
+        for output in outputs:
+            if (output['tx_hash'].hex(), output['_index']) in pending_spent_outputs:
+                continue
+            tx_input = TransactionInput(output['tx_hash'].hex(), output['_index'], amount=output['amount'])
+            tx_input.public_key = point
+            inputs.append(tx_input)
+        return inputs
+
+    async def get_address_balance(self, address: str, check_pending_txs: bool = False) -> int:
+        balance = 0
         point = string_to_point(address)
-        search = ['%'+point_to_bytes(string_to_point(address), address_format).hex()+'%' for address_format in list(AddressFormat)]
-        addresses = [point_to_string(point, address_format) for address_format in list(AddressFormat)]
         for input in await self.get_spendable_outputs(address, check_pending_txs=check_pending_txs):
             balance += input.amount
         if check_pending_txs:
-            async with self.pool.acquire() as connection:
-                txs = await connection.fetch(f'''SELECT tx_hex FROM pending_transactions WHERE {str(" or ".join([f'tx_hex LIKE "%{s}%"' for s in search]))}''')
-            for tx in txs:
-                tx = await Transaction.from_hex(tx['tx_hex'], check_signatures=False)
-                for i, tx_output in enumerate(tx.outputs):
-                    if tx_output.address in addresses:
-                        balance += tx_output.amount
+            async with self.acquire() as connection:
+                balance += await connection.fetchval('SELECT COALESCE(SUM(amount), 0) FROM pending_outputs WHERE address = $1', point_to_string(point))
         return balance
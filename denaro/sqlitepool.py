@@ -1,189 +1,250 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import decimal
 import re, datetime
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from queue import Queue
-from abc import abstractmethod
 
-#import aiosqlite
+from .constants import SMALLEST
 
-from asyncpg.pool import PoolAcquireContext
 
 class PoolException(Exception):
     pass
 
+
+def _unhex(string):
+    return bytes.fromhex(string) if string is not None else None
+
+
+def _smallest(amount):
+    return int(decimal.Decimal(str(amount)) * SMALLEST) if amount is not None else None
+
+
+def _connect(database: str, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        con = sqlite3.connect(Path(database).resolve().as_uri() + '?mode=ro', uri=True, detect_types=sqlite3.PARSE_DECLTYPES)
+    else:
+        # no implicit transactions, the writer runs its own BEGIN, COMMIT and SAVEPOINT statements
+        con = sqlite3.connect(database, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.create_function('unhex', 1, _unhex, deterministic=True)
+    con.create_function('smallest', 1, _smallest, deterministic=True)
+    return con
+
+
+def _set_future_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_future_exception(future: asyncio.Future, exception: BaseException):
+    if not future.done():
+        future.set_exception(exception)
+
+
+class SQLite3Writer(threading.Thread):
+    """
+    Owns the only writing connection. Jobs are run in submission order, so writes are serialized
+    without ever blocking the event loop.
+    """
+
+    def __init__(self, database: str):
+        super().__init__(name='sqlite-writer', daemon=True)
+        self.database = database
+        self.queue = Queue()
+
+    def run(self):
+        conn = _connect(self.database)
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            func, future, loop = job
+            try:
+                result = func(conn)
+            except BaseException as e:
+                loop.call_soon_threadsafe(_set_future_exception, future, e)
+            else:
+                loop.call_soon_threadsafe(_set_future_result, future, result)
+        conn.close()
+
+    async def submit(self, func):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.put((func, future, loop))
+        return await future
+
+    def stop(self):
+        self.queue.put(None)
+
+
 class Pool(object):
-    def __init__(self, maxActive=5, maxWait=None, init_size=0, db_type="SQLite3", **config):
-        self.__freeConns = Queue(maxActive)
-        self.maxWait = maxWait
-        self.db_type = db_type
-        self.config = config
-        if init_size > maxActive:
-            init_size = maxActive
-        for i in range(init_size):
-            self.release(self._create_conn())
-    
-    def __del__(self):
-        print("__del__ Pool..")
-        self.releaseAll()
-    
-    def releaseAll(self):
-        print("release Pool..")
-        while self.__freeConns and not self.__freeConns.empty():
-            con = self.get()
-            con.release()
-
-        self.__freeConns = None
- 
-    def _create_conn(self):
-        if self.db_type in dbcs:
-            return dbcs[self.db_type](**self.config)
-        
-    def get(self, timeout=None):
-        if timeout is None:
-            timeout = self.maxWait
-        conn = None
-        if self.__freeConns.empty():
-            conn = self._create_conn()
-        else:
-            conn = self.__freeConns.get(timeout=timeout)
-        conn.pool = self
+    """
+    SQLite pool for the event loop: reads run on a small thread pool of read-only WAL connections,
+    writes are queued to a single writer thread.
+    """
+
+    def __init__(self, database: str, readers: int = 4):
+        self.database = database
+        conn = _connect(database)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.close()
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='sqlite-reader')
+        self._writer = SQLite3Writer(database)
+        self._writer.start()
+        self.write_lock = asyncio.Lock()
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.database, read_only=True)
         return conn
-    
-    async def release(self, conn):
-        conn.pool = None
-        if(self.__freeConns.full()):
-            conn.release()
-            return
-        self.__freeConns.put_nowait(conn)
+
+    async def read(self, func):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, lambda: func(self._reader_connection()))
+
+    async def write(self, func):
+        return await self._writer.submit(func)
 
     async def _acquire(self, timeout):
-        return self.get(timeout)
+        return SQLit3PoolConnection(self)
+
+    async def release(self, conn):
+        pass
 
     def acquire(self, timeout=None):
         return PoolAcquireContext(self, timeout)
 
-class PoolingConnection(object):
-    def __init__(self, **config):
-        self.conn = None
-        self.config = config
-        
-    def __del__(self):
-        self.release()
-        
-    def __enter__(self):
-        pass
-    
-    def __exit__(self, exc_type, exc_value, traceback):
-        self.close()
-        
-    def release(self):
-        print("release PoolingConnection..")
-        if self.conn is not None:
-            self.conn.close()
-            self.conn = None
-            
     def close(self):
-        print("close")
-        
-    def __getattr__(self, val):
-        if self.conn is None and self.pool is not None:
-            self.conn = self._create_conn(**self.config)
-        if self.conn is None:
-            raise PoolException("PoolingConnection Error!")
-        return getattr(self.conn, val)
- 
-    @abstractmethod
-    def _create_conn(self, **config):
-        pass
-
-class SQLit3PoolConnection(PoolingConnection):
-
-    def _create_conn(self, **config):
-        con = sqlite3.connect(**config, detect_types=sqlite3.PARSE_DECLTYPES)
-        con.row_factory = sqlite3.Row
-        return con
-
-    @property
-    def Conn(self):
-        if self.conn is None:
-            self.conn = self._create_conn(**self.config)
-        return self.conn
-
-    def __enter__(self):
-        if self.conn is None:
-            self.conn = self._create_conn(**self.config)
-        return self.conn.cursor()
+        self._writer.stop()
+        self._readers.shutdown(wait=False)
+
+
+class PoolAcquireContext:
+    def __init__(self, pool: Pool, timeout=None):
+        self.pool = pool
+        self.timeout = timeout
+        self.connection = None
+
+    async def __aenter__(self):
+        if self.connection is not None:
+            raise PoolException('a connection is already acquired')
+        self.connection = await self.pool._acquire(self.timeout)
+        return self.connection
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        con = self.connection
+        self.connection = None
+        await self.pool.release(con)
+
+
+class SQLit3Transaction:
+    """
+    Same semantics as asyncpg's connection.transaction(): the outermost block holds the pool write lock
+    and runs BEGIN/COMMIT/ROLLBACK on the writer connection, nested blocks are savepoints.
+    """
+
+    def __init__(self, connection: 'SQLit3PoolConnection'):
+        self.connection = connection
+        self.savepoint = None
+
+    async def __aenter__(self):
+        connection = self.connection
+        if connection.in_transaction:
+            connection.savepoints += 1
+            self.savepoint = f'savepoint_{connection.savepoints}'
+            await connection.pool.write(lambda conn: conn.execute(f'SAVEPOINT {self.savepoint}'))
+            return self
+        await connection.pool.write_lock.acquire()
+        try:
+            await connection.pool.write(lambda conn: conn.execute('BEGIN'))
+        except BaseException:
+            connection.pool.write_lock.release()
+            raise
+        connection.in_transaction = True
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        connection = self.connection
+        if self.savepoint is not None:
+            def release(conn):
+                if exc_type is not None:
+                    conn.execute(f'ROLLBACK TO SAVEPOINT {self.savepoint}')
+                conn.execute(f'RELEASE SAVEPOINT {self.savepoint}')
+            try:
+                await connection.pool.write(release)
+            finally:
+                connection.savepoints -= 1
+            return
+        try:
+            await connection.pool.write(lambda conn: conn.execute('COMMIT' if exc_type is None else 'ROLLBACK'))
+        finally:
+            connection.in_transaction = False
+            connection.pool.write_lock.release()
+
+
+class SQLit3PoolConnection(object):
+    """
+    asyncpg-like interface over a Pool: fetch* methods read, execute* methods write and commit.
+    Inside transaction() everything runs on the writer connection, so reads see the uncommitted rows.
+    """
+
+    def __init__(self, pool: Pool):
+        self.pool = pool
+        self.in_transaction = False
+        self.savepoints = 0
+
+    def transaction(self):
+        return SQLit3Transaction(self)
+
+    async def _read(self, func):
+        if self.in_transaction:
+            return await self.pool.write(func)
+        return await self.pool.read(func)
+
+    async def _write(self, func):
+        if self.in_transaction:
+            return await self.pool.write(func)
+
+        def write_and_commit(conn):
+            conn.execute('BEGIN')
+            try:
+                result = func(conn)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+        async with self.pool.write_lock:
+            return await self.pool.write(write_and_commit)
 
     async def fetch(self, query, *args, timeout=None) -> list:
-        #print("fetch ->\n", query, *args)
         sql = self._formatQuerySymbol(query)
-        cur = self.Conn.execute(sql, args)
-        return cur.fetchall()
+        return await self._read(lambda conn: conn.execute(sql, args).fetchall())
 
     async def fetchval(self, query, *args, column=0, timeout=None):
-        #print("fetchval ->\n", query, args)
-        sql = self._formatQuerySymbol(query)
-        cur = self.Conn.execute(sql, args)
-        all = cur.fetchall()
-        if len(all) <= 0 : return 
-        rows = all[column]
-        if len(rows) > 0:
-            return rows[0]
-        return 
+        row = await self.fetchrow(query, *args, timeout=timeout)
+        return row[column] if row is not None else None
 
     async def fetchrow(self, query, *args, timeout=None):
-        #print("fetchrow ->\n", query, args)
         sql = self._formatQuerySymbol(query)
-        cur = self.Conn.execute(sql, args)
-        row = cur.fetchone()
-        return row
+        return await self._read(lambda conn: conn.execute(sql, args).fetchone())
 
     async def execute(self, query: str, *args, timeout: float=None) -> str:
-        #print("execute ->", query, args)
         sql = self._formatQuerySymbol(query)
-        cu = self.Conn.execute(sql, args)
-        self.Conn.commit()
-        return str(cu.rowcount)
+        return await self._write(lambda conn: str(conn.execute(sql, args).rowcount))
 
-    async def executemany(self, query: str, *args, timeout: float=None) -> str:
-        #print("executemany ->\n" , query, args)
+    async def executemany(self, query: str, args, *, timeout: float=None) -> str:
         sql = self._formatQuerySymbol(query)
-
-        cu = self.Conn.executemany(sql, *args)
-        self.Conn.commit()
-        return str(cu.rowcount)
-        
-    def _converKeyword(self, query) -> str:
-        return query
-
-        keywords = {
-            "index" : "'index'",
-        }
-        sql = re.sub(" index", "'index'", query)
-        sql = query
-        return sql
-
-    def _converArgs(self, *args) -> tuple:
-        newArgs = []
-        
-        for arg in args:
-            if isinstance(arg, list):
-                param = str(arg)
-            elif isinstance(arg, tuple):
-                param = str(arg)
-            else:
-                param = arg
-            newArgs.append(param)
-        return tuple(newArgs)         
+        return await self._write(lambda conn: str(conn.executemany(sql, args).rowcount))
 
     def _formatQuerySymbol(self, query) -> str:
-        sql = re.sub('\$\d+', "?", self._converKeyword(query))
-        #print("sql: " + sql)
-        return sql
+        return re.sub(r'\$(\d+)', r'?\1', query)
 
-dbcs = {"SQLite3": SQLit3PoolConnection}
- 
 
 #DECTEXT type
 def adapt_decimal(d):
@@ -221,4 +282,3 @@ def convert_text_array(s):
     return eval(s.decode())
 
 sqlite3.register_converter("TEXT[]", convert_text_array)
-
@@ -1,4 +1,4 @@
-from decimal import Decimal
+from copy import copy
 
 from ..constants import ENDIAN
 from ..helpers import sha256
@@ -6,13 +6,38 @@ from ..transactions import TransactionOutput
 
 
 class CoinbaseTransaction:
-    _hex: str = None
+    # a coinbase is never modified, its serialization is computed once
+    __slots__ = ('block_hash', 'outputs', '_hex', '_bytes', '_hash')
 
-    def __init__(self, block_hash: str, address: str, amount: Decimal):
+    def __init__(self, block_hash: str, address: str, amount: int):
         self.block_hash = block_hash
-        self.address = address
-        self.amount = amount
         self.outputs = [TransactionOutput(address, amount)]
+        self._hex = self._bytes = self._hash = None
+
+    @staticmethod
+    def from_output(block_hash: str, tx_output: TransactionOutput) -> 'CoinbaseTransaction':
+        transaction = CoinbaseTransaction.__new__(CoinbaseTransaction)
+        transaction.block_hash = block_hash
+        transaction.outputs = [tx_output]
+        transaction._hex = transaction._bytes = transaction._hash = None
+        return transaction
+
+    @property
+    def address(self) -> str:
+        return self.outputs[0].address
+
+    @property
+    def amount(self) -> int:
+        return self.outputs[0].amount
+
+    def copy(self):
+        transaction = copy(self)
+        transaction.outputs = list(self.outputs)
+        return transaction
+
+    @property
+    def as_dict(self):
+        return {'block_hash': self.block_hash, 'outputs': self.outputs}
 
     async def verify(self):
         from .. import Database
@@ -43,5 +68,12 @@ class CoinbaseTransaction:
 
         return self._hex
 
+    def tobytes(self):
+        if self._bytes is None:
+            self._bytes = bytes.fromhex(self.hex())
+        return self._bytes
+
     def hash(self):
-        return sha256(self.hex())
+        if self._hash is None:
+            self._hash = sha256(self.hex())
+        return self._hash
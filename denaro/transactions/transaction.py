@@ -1,22 +1,24 @@
-from decimal import Decimal
-from io import BytesIO
-from typing import List
+from typing import List, Union
 
 from fastecdsa import keys
 from icecream import ic
 
 from . import TransactionInput, TransactionOutput
 from .coinbase_transaction import CoinbaseTransaction
-from ..constants import ENDIAN, SMALLEST, CURVE
-from ..helpers import point_to_string, bytes_to_string, sha256
+from ..constants import ENDIAN, CURVE
+from ..helpers import point_to_string, sha256, smallest_to_decimal
+from ..lru_cache import LRUCache
 
 print = ic
 
 
 class Transaction:
-    _hex: str = None
-    fees: Decimal = None
-    block_hash: str = None
+    # _hex, _signing_hex, _bytes and _hash are the serialization, kept until sign() or a change of the inputs, outputs or signatures
+    __slots__ = ('inputs', 'outputs', 'message', 'version', 'fees', 'block_hash', '_hex', '_signing_hex', '_bytes', '_hash', '_serialized')
+    # parsed transactions by hash, from_hex hands out copies of them
+    parsed_cache: LRUCache = LRUCache(10_000)
+    # hashes of transactions whose signatures were found valid, the hash covers the inputs, outputs and signatures
+    verified_cache: LRUCache = LRUCache(10_000)
 
     def __init__(self, inputs: List[TransactionInput], outputs: List[TransactionOutput], message: bytes = None, version: int = None):
         if len(inputs) >= 256:
@@ -36,15 +38,28 @@ class Transaction:
         if version > 3:
             raise NotImplementedError()
         self.version = version
+        self.fees: int = None
+        self.block_hash: str = None
+        self._hex = self._signing_hex = self._bytes = self._hash = self._serialized = None
 
-    def hex(self, full: bool = True):
+    def _serialization_key(self) -> tuple:
+        # inputs and outputs compare by identity, so replacing or appending any of them changes the key
+        return self.version, self.message, tuple(self.inputs), tuple(self.outputs), tuple(tx_input.signed for tx_input in self.inputs)
+
+    def _check_serialization(self):
+        key = self._serialization_key()
+        if key != self._serialized:
+            self._serialized = key
+            self._hex = self._signing_hex = self._bytes = self._hash = None
+
+    def _build_hex(self, full: bool):
         inputs, outputs = self.inputs, self.outputs
         hex_inputs = ''.join(tx_input.tobytes().hex() for tx_input in inputs)
         hex_outputs = ''.join(tx_output.tobytes().hex() for tx_output in outputs)
 
         version = self.version
 
-        self._hex = ''.join([
+        tx_hex = ''.join([
             version.to_bytes(1, ENDIAN).hex(),
             len(inputs).to_bytes(1, ENDIAN).hex(),
             hex_inputs,
@@ -53,31 +68,50 @@ class Transaction:
         ])
 
         if not full and (version <= 2 or self.message is None):
-            return self._hex
+            return tx_hex
 
         if self.message is not None:
             if version <= 2:
-                self._hex += bytes([1, len(self.message)]).hex()
+                tx_hex += bytes([1, len(self.message)]).hex()
             else:
-                self._hex += bytes([1]).hex()
-                self._hex += (len(self.message)).to_bytes(2, ENDIAN).hex()
-            self._hex += self.message.hex()
+                tx_hex += bytes([1]).hex()
+                tx_hex += (len(self.message)).to_bytes(2, ENDIAN).hex()
+            tx_hex += self.message.hex()
             if not full:
-                return self._hex
+                return tx_hex
         else:
-            self._hex += (0).to_bytes(1, ENDIAN).hex()
+            tx_hex += (0).to_bytes(1, ENDIAN).hex()
 
         signatures = []
         for tx_input in inputs:
             signed = tx_input.get_signature()
             if signed not in signatures:
                 signatures.append(signed)
-                self._hex += signed
+                tx_hex += signed
+
+        return tx_hex
 
+    def hex(self, full: bool = True):
+        self._check_serialization()
+        if not full:
+            if self._signing_hex is None:
+                self._signing_hex = self._build_hex(False)
+            return self._signing_hex
+        if self._hex is None:
+            self._hex = self._build_hex(True)
         return self._hex
 
+    def tobytes(self):
+        tx_hex = self.hex()
+        if self._bytes is None:
+            self._bytes = bytes.fromhex(tx_hex)
+        return self._bytes
+
     def hash(self):
-        return sha256(self.hex())
+        tx_hex = self.hex()
+        if self._hash is None:
+            self._hash = sha256(tx_hex)
+        return self._hash
 
     def _verify_double_spend_same_transaction(self):
         used_inputs = []
@@ -90,29 +124,43 @@ class Transaction:
 
     async def _verify_double_spend(self):
         from .. import Database
-        check_inputs = [tx_input.tx_hash + bytes([tx_input.index]).hex() for tx_input in self.inputs]
-        tx = await Database.instance.get_transaction_by_contains_multi(check_inputs, sha256(self.hex()))
-        return tx is None
+        check_inputs = [(tx_input.tx_hash, tx_input.index) for tx_input in self.inputs]
+        spender = await Database.instance.get_outpoints_spender(check_inputs, ignore=self.hash())
+        return spender is None
 
-    async def _verify_double_spend_pending(self):
+    async def _verify_unspent(self):
+        """Whether every input spends an unspent output, read from the unspent outputs and not from spent_outpoints."""
         from .. import Database
-        check_inputs = [tx_input.tx_hash + bytes([tx_input.index]).hex() for tx_input in self.inputs]
-        tx = await Database.instance.get_pending_transaction_by_contains_multi(check_inputs, sha256(self.hex()))
-        return tx is None
+        check_inputs = [(tx_input.tx_hash, tx_input.index) for tx_input in self.inputs]
+        outputs = await Database.instance.get_unspent_outputs_info(check_inputs)
+        return all(outpoint in outputs for outpoint in check_inputs)
 
-    async def _fill_transaction_inputs(self, txs=None) -> None:
+    async def _verify_double_spend_pending(self):
         from .. import Database
-        check_inputs = [tx_input.tx_hash for tx_input in self.inputs if tx_input.transaction is None]
+        check_inputs = [(tx_input.tx_hash, tx_input.index) for tx_input in self.inputs]
+        mempool = Database.instance.mempool
+        if mempool is not None:
+            return mempool.get_spender(check_inputs, ignore=self.hash()) is None
+        spender = await Database.instance.get_outpoints_spender(check_inputs, pending=True, ignore=self.hash())
+        return spender is None
+
+    async def _fill_related_outputs(self, outputs=None) -> None:
+        from .. import Database
+        check_inputs = [(tx_input.tx_hash, tx_input.index) for tx_input in self.inputs if tx_input.related_output is None and tx_input.transaction is None]
         if not check_inputs:
             return
-        if txs is None:
-            txs = await Database.instance.get_transactions(check_inputs)
+        if outputs is None:
+            outputs = await Database.instance.get_unspent_outputs_info(check_inputs)
         for tx_input in self.inputs:
-            tx_hash = tx_input.tx_hash
-            if tx_hash in txs:
-                tx_input.transaction = txs[tx_hash]
+            related_output = outputs.get((tx_input.tx_hash, tx_input.index))
+            if related_output is not None:
+                tx_input.related_output = related_output
+                tx_input.amount = related_output.amount
 
     async def _check_signature(self):
+        cache = Transaction.verified_cache
+        if cache is not None and cache.get(self.hash()):
+            return True
         tx_hex = self.hex(False)
         for tx_input in self.inputs:
             if tx_input.signed is None:
@@ -121,12 +169,14 @@ class Transaction:
             if not await tx_input.verify(tx_hex):
                 print('signature not valid')
                 return False
+        if cache is not None:
+            cache.put(self.hash(), True)
         return True
 
     def _verify_outputs(self):
         return (self.outputs or self.hash() == '915ddf143e14647ba1e04c44cf61e57084254c44cd4454318240f359a414065c') and all(tx_output.verify() for tx_output in self.outputs)
 
-    async def verify(self, check_double_spend: bool = True) -> bool:
+    async def verify(self, check_double_spend: bool = True, check_signatures: bool = True) -> bool:
         if not self._verify_double_spend_same_transaction():
             print('double spend inside same transaction')
             return False
@@ -135,9 +185,9 @@ class Transaction:
             print('double spend')
             return False
 
-        await self._fill_transaction_inputs()
+        await self._fill_related_outputs()
 
-        if not await self._check_signature():
+        if check_signatures and not await self._check_signature():
             return False
 
         input_amount = 0
@@ -152,59 +202,106 @@ class Transaction:
 
         if input_amount >= output_amount:
             self.fees = input_amount - output_amount
-            assert (self.fees * SMALLEST) % 1 == 0.0
-            assert self.fees >= 0
         return input_amount >= output_amount
 
     async def verify_pending(self):
-        return await self.verify() and await self._verify_double_spend_pending()
+        # spent_outpoints can lack the outputs spent before it was filled, the unspent outputs can not
+        if not await self._verify_unspent():
+            print('double spend')
+            return False
+        return await self.verify(check_double_spend=False) and await self._verify_double_spend_pending()
 
     def sign(self, private_keys: list = []):
         for private_key in private_keys:
             for input in self.inputs:
-                if input.private_key is None and input.transaction is not None:
+                if input.private_key is None and (input.public_key is not None or input.transaction is not None):
                     public_key = keys.get_public_key(private_key, CURVE)
-                    if public_key == input.transaction.outputs[input.index].public_key:
+                    input_public_key = input.public_key if input.public_key is not None else input.transaction.outputs[input.index].public_key
+                    if public_key == input_public_key:
                         input.private_key = private_key
+        signing_hex = self.hex(False)
         for input in self.inputs:
             if input.signed is None and input.private_key is not None:
-                input.sign(self.hex(False))
+                input.sign(signing_hex)
+        self._serialized = None
         return self
 
+    def copy(self):
+        """Returns the transaction with new inputs, the outputs are never modified and are shared."""
+        inputs = []
+        for tx_input in self.inputs:
+            input_copy = TransactionInput(tx_input.tx_hash, tx_input.index)
+            input_copy.signed = tx_input.signed
+            inputs.append(input_copy)
+        transaction = Transaction(inputs, list(self.outputs), self.message, self.version)
+        if self._serialized == self._serialization_key():
+            transaction._serialized = transaction._serialization_key()
+            transaction._hex, transaction._signing_hex, transaction._bytes, transaction._hash = self._hex, self._signing_hex, self._bytes, self._hash
+        return transaction
+
+    @property
+    def as_dict(self):
+        return {'inputs': self.inputs, 'outputs': self.outputs, 'message': self.message, 'version': self.version, 'fees': smallest_to_decimal(self.fees) if self.fees is not None else None, 'block_hash': self.block_hash}
+
+    @staticmethod
+    async def from_hex(hexstring: Union[str, bytes], check_signatures: bool = True):
+        tx_bytes = hexstring if isinstance(hexstring, bytes) else bytes.fromhex(hexstring)
+        cache = Transaction.parsed_cache
+        if cache is None:
+            return await Transaction._parse(tx_bytes, check_signatures)
+        tx_hash = sha256(tx_bytes)
+        transaction = cache.get(tx_hash)
+        if transaction is not None:
+            return transaction.copy()
+        transaction = await Transaction._parse(tx_bytes, check_signatures)
+        # without check_signatures the inputs of a transaction signed by several keys can be left unsigned
+        if isinstance(transaction, CoinbaseTransaction) or all(tx_input.signed is not None for tx_input in transaction.inputs):
+            cache.put(tx_hash, transaction.copy())
+        return transaction
+
     @staticmethod
-    async def from_hex(hexstring: str, check_signatures: bool = True):
-        tx_bytes = BytesIO(bytes.fromhex(hexstring))
-        version = int.from_bytes(tx_bytes.read(1), ENDIAN)
+    async def _parse(tx_bytes: bytes, check_signatures: bool):
+        # fields are sliced out of a memoryview, outputs keep their slice and decode it when accessed
+        data = memoryview(tx_bytes)
+        version = int.from_bytes(data[0:1], ENDIAN)
         if version > 3:
             raise NotImplementedError()
 
-        inputs_count = int.from_bytes(tx_bytes.read(1), ENDIAN)
+        inputs_count = int.from_bytes(data[1:2], ENDIAN)
+        offset = 2
 
         inputs = []
 
         for i in range(0, inputs_count):
-            tx_hex = tx_bytes.read(32).hex()
-            tx_index = int.from_bytes(tx_bytes.read(1), ENDIAN)
+            tx_hex = data[offset:offset + 32].hex()
+            tx_index = int.from_bytes(data[offset + 32:offset + 33], ENDIAN)
             inputs.append(TransactionInput(tx_hex, index=tx_index))
+            offset += 33
 
-        outputs_count = int.from_bytes(tx_bytes.read(1), ENDIAN)
+        outputs_count = int.from_bytes(data[offset:offset + 1], ENDIAN)
+        offset += 1
 
         outputs = []
+        address_length = 64 if version == 1 else 33
 
         for i in range(0, outputs_count):
-            pubkey = tx_bytes.read(64 if version == 1 else 33)
-            amount_length = int.from_bytes(tx_bytes.read(1), ENDIAN)
-            amount = int.from_bytes(tx_bytes.read(amount_length), ENDIAN) / Decimal(SMALLEST)
-            outputs.append(TransactionOutput(bytes_to_string(pubkey), amount))
+            amount_length = int.from_bytes(data[offset + address_length:offset + address_length + 1], ENDIAN)
+            end = offset + address_length + 1 + amount_length
+            outputs.append(TransactionOutput.from_bytes(data[offset:end], address_length))
+            offset = end
 
-        specifier = int.from_bytes(tx_bytes.read(1), ENDIAN)
+        specifier = int.from_bytes(data[offset:offset + 1], ENDIAN)
+        offset += 1
         if specifier == 36:
             assert len(inputs) == 1 and len(outputs) == 1
-            return CoinbaseTransaction(inputs[0].tx_hash, outputs[0].address, outputs[0].amount)
+            return CoinbaseTransaction.from_output(inputs[0].tx_hash, outputs[0])
         else:
             if specifier == 1:
-                message_length = int.from_bytes(tx_bytes.read(1 if version <= 2 else 2), ENDIAN)
-                message = tx_bytes.read(message_length)
+                length_size = 1 if version <= 2 else 2
+                message_length = int.from_bytes(data[offset:offset + length_size], ENDIAN)
+                offset += length_size
+                message = bytes(data[offset:offset + message_length])
+                offset += message_length
             else:
                 message = None
                 assert specifier == 0
@@ -212,7 +309,8 @@ class Transaction:
             signatures = []
 
             while True:
-                signed = (int.from_bytes(tx_bytes.read(32), ENDIAN), int.from_bytes(tx_bytes.read(32), ENDIAN))
+                signed = (int.from_bytes(data[offset:offset + 32], ENDIAN), int.from_bytes(data[offset + 32:offset + 64], ENDIAN))
+                offset += 64
                 if signed[0] == 0:
                     break
                 signatures.append(signed)
@@ -224,8 +322,11 @@ class Transaction:
                 for i, tx_input in enumerate(inputs):
                     tx_input.signed = signatures[i]
             else:
+                transaction = Transaction(inputs, outputs, message, version)
                 if not check_signatures:
-                    return Transaction(inputs, outputs, message, version)
+                    return transaction
+                from .. import Database
+                await Database.instance.fill_related_outputs([transaction])
                 index = {}
                 for tx_input in inputs:
                     public_key = point_to_string(await tx_input.get_public_key())
@@ -236,6 +337,7 @@ class Transaction:
                 for i, signed in enumerate(signatures):
                     for tx_input in index[list(index.keys())[i]]:
                         tx_input.signed = signed
+                return transaction
 
             return Transaction(inputs, outputs, message, version)
 
@@ -1,24 +1,23 @@
-from decimal import Decimal
 from typing import Tuple
 
 from fastecdsa import ecdsa
 
 from ..constants import CURVE, ENDIAN
-from ..helpers import point_to_string
+from ..helpers import point_to_string, smallest_to_decimal
 
 
 class TransactionInput:
-    public_key = None
+    __slots__ = ('tx_hash', 'index', 'private_key', 'transaction', 'amount', 'public_key', 'related_output', 'signed')
 
-    signed: Tuple[int, int] = None
-    amount: Decimal = None
-
-    def __init__(self, input_tx_hash: str, index: int, private_key: int = None, transaction=None, amount: Decimal = None):
+    def __init__(self, input_tx_hash: str, index: int, private_key: int = None, transaction=None, amount: int = None):
         self.tx_hash = input_tx_hash
         self.index = index
         self.private_key = private_key
         self.transaction = transaction
         self.amount = amount
+        self.public_key = None
+        self.related_output = None
+        self.signed: Tuple[int, int] = None
         if transaction is not None and amount is None:
             self.get_related_output()
 
@@ -31,10 +30,11 @@ class TransactionInput:
         return self.transaction
 
     async def get_related_output(self):
-        tx = await self.get_transaction()
-        related_output = tx.outputs[self.index]
-        self.amount = related_output.amount
-        return related_output
+        if self.related_output is None:
+            tx = await self.get_transaction()
+            self.related_output = tx.outputs[self.index]
+        self.amount = self.related_output.amount
+        return self.related_output
 
     def sign(self, tx_hex: str, private_key: int = None):
         private_key = private_key if private_key is not None else self.private_key
@@ -56,15 +56,13 @@ class TransactionInput:
             return False
         # print('verifying with', point_to_string(public_key))
 
+        # wallets sign the bytes of the transaction, the hex string is tried after them
         return \
-            ecdsa.verify(self.signed, input_tx, public_key, CURVE) or \
-            ecdsa.verify(self.signed, bytes.fromhex(input_tx), public_key, CURVE)
+            ecdsa.verify(self.signed, bytes.fromhex(input_tx), public_key, CURVE) or \
+            ecdsa.verify(self.signed, input_tx, public_key, CURVE)
 
     @property
     def as_dict(self):
-        self_dict = vars(self).copy()
-        self_dict['signed'] = self_dict['signed'] is not None
-        if 'public_key' in self_dict: self_dict['public_key'] = point_to_string(self_dict['public_key'])
-        if 'transaction' in self_dict: del self_dict['transaction']
-        if 'private_key' in self_dict: del self_dict['private_key']
+        self_dict = {'tx_hash': self.tx_hash, 'index': self.index, 'amount': smallest_to_decimal(self.amount) if self.amount is not None else None, 'signed': self.signed is not None}
+        if self.public_key is not None: self_dict['public_key'] = point_to_string(self.public_key)
         return self_dict
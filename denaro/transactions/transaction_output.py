@@ -1,22 +1,62 @@
-from decimal import Decimal
-
-from ..constants import ENDIAN, SMALLEST, CURVE
-from ..helpers import byte_length, string_to_point, string_to_bytes
+from ..constants import ENDIAN, CURVE
+from ..helpers import byte_length, string_to_bytes, bytes_to_point, bytes_to_string, smallest_to_decimal
 
 
 class TransactionOutput:
-    def __init__(self, address: str, amount: Decimal):
+    # _raw is the encoded output this one was read from, its fields are decoded when accessed
+    __slots__ = ('_address', '_address_bytes', '_public_key', '_amount', '_raw', '_address_length')
+
+    def __init__(self, address: str, amount: int):
         from fastecdsa.point import Point
         if isinstance(address, Point):
             raise Exception('TransactionOutput does not accept Point anymore. Pass the address string instead')
-        self.address = address
-        self.address_bytes = string_to_bytes(address)
-        self.public_key = string_to_point(address)
-        assert (amount * SMALLEST) % 1 == 0.0
-        self.amount = amount
+        self._address = address
+        self._address_bytes = string_to_bytes(address)
+        self._public_key = bytes_to_point(self._address_bytes)
+        # amounts are integers of the smallest unit, see helpers.decimal_to_smallest
+        assert isinstance(amount, int)
+        self._amount = amount
+        self._raw = None
+        self._address_length = None
+
+    @staticmethod
+    def from_bytes(raw: memoryview, address_length: int) -> 'TransactionOutput':
+        tx_output = TransactionOutput.__new__(TransactionOutput)
+        tx_output._address = tx_output._address_bytes = tx_output._public_key = tx_output._amount = None
+        tx_output._raw = raw
+        tx_output._address_length = address_length
+        return tx_output
+
+    @property
+    def address_bytes(self) -> bytes:
+        if self._address_bytes is None:
+            address_bytes = bytes(self._raw[:self._address_length])
+            if len(address_bytes) == 33 and address_bytes[0] != 43:
+                # any specifier other than 43 is read as an even y and written back as 42
+                address_bytes = bytes([42]) + address_bytes[1:]
+            self._address_bytes = address_bytes
+        return self._address_bytes
+
+    @property
+    def address(self) -> str:
+        if self._address is None:
+            self._address = bytes_to_string(self.address_bytes)
+        return self._address
+
+    @property
+    def public_key(self):
+        if self._public_key is None:
+            self._public_key = bytes_to_point(self.address_bytes)
+        return self._public_key
+
+    @property
+    def amount(self) -> int:
+        if self._amount is None:
+            self._amount = int.from_bytes(self._raw[self._address_length + 1:], ENDIAN)
+        return self._amount
 
     def tobytes(self):
-        amount = int(self.amount * SMALLEST)
+        amount = self.amount
         count = byte_length(amount)
         return self.address_bytes + count.to_bytes(1, ENDIAN) + amount.to_bytes(count, ENDIAN)
 
@@ -25,6 +65,4 @@ class TransactionOutput:
 
     @property
     def as_dict(self):
-        res = vars(self).copy()
-        if 'public_key' in res: del res['public_key']
-        return res
+        return {'address': self.address, 'address_bytes': self.address_bytes, 'amount': smallest_to_decimal(self.amount)}
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import List, Tuple, Dict
+
+from .transactions import TransactionOutput
+
+
+class UnspentOutputsCache:
+    """
+    Unspent outputs kept in memory in front of the unspent_outputs table.
+    Outputs added by blocks stay in memory until a flush writes them, outputs spent before being written never are.
+    Clean outputs, the ones already in the table, are evicted least recently used first past max_size.
+    Changes made inside a database transaction are journaled and undone with it.
+    """
+
+    def __init__(self, max_size: int = 500_000, max_dirty: int = 100_000, flush_interval: float = 60):
+        self.max_size = max_size
+        self.max_dirty = max_dirty
+        self.flush_interval = flush_interval
+        self.clean: OrderedDict = OrderedDict()
+        self.added: Dict[Tuple[str, int], TransactionOutput] = {}
+        self.removed = set()
+        self.journal = None
+        self.depth = 0
+        # bumped by every change, so outputs read from the database before a change are not cached after it
+        self.version = 0
+        self.last_flush = monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.clean) + len(self.added)
+
+    @property
+    def dirty(self) -> int:
+        return len(self.added) + len(self.removed)
+
+    def flush_due(self) -> bool:
+        return self.dirty >= self.max_dirty or (self.dirty and monotonic() - self.last_flush >= self.flush_interval)
+
+    def _journal(self, outpoint: Tuple[str, int]):
+        self.version += 1
+        if self.journal is not None:
+            self.journal.append((outpoint, self.clean.get(outpoint), self.added.get(outpoint), outpoint in self.removed))
+
+    def savepoint(self) -> int:
+        if self.journal is None:
+            self.journal = []
+        self.depth += 1
+        return len(self.journal)
+
+    def rollback(self, savepoint: int):
+        self.version += 1
+        while len(self.journal) > savepoint:
+            entry = self.journal.pop()
+            if entry[0] == 'flush':
+                _, added, removed = entry
+                for outpoint in added:
+                    self.clean.pop(outpoint, None)
+                self.added.update(added)
+                self.removed.update(removed)
+                continue
+            outpoint, clean, added, removed = entry
+            self.clean.pop(outpoint, None)
+            self.added.pop(outpoint, None)
+            self.removed.discard(outpoint)
+            if clean is not None:
+                self.clean[outpoint] = clean
+            if added is not None:
+                self.added[outpoint] = added
+            if removed:
+                self.removed.add(outpoint)
+        self.release(savepoint)
+
+    def release(self, savepoint: int):
+        self.depth -= 1
+        if self.depth == 0:
+            self.journal = None
+
+    def get(self, outpoints: List[Tuple[str, int]]) -> Tuple[Dict[Tuple[str, int], TransactionOutput], List[Tuple[str, int]]]:
+        """Returns the cached unspent outputs and the outpoints to look up in the database."""
+        found, missing = {}, []
+        for outpoint in outpoints:
+            if outpoint in self.added:
+                found[outpoint] = self.added[outpoint]
+            elif outpoint in self.clean:
+                self.clean.move_to_end(outpoint)
+                found[outpoint] = self.clean[outpoint]
+            elif outpoint in self.removed:
+                pass
+            else:
+                missing.append(outpoint)
+                continue
+            self.hits += 1
+        self.misses += len(missing)
+        return found, missing
+
+    def _evict(self):
+        while len(self.clean) > self.max_size:
+            self.clean.popitem(last=False)
+
+    def load(self, outputs: Dict[Tuple[str, int], TransactionOutput], version: int):
+        """Caches outputs read from the database when the cache was at version."""
+        if version != self.version:
+            return
+        for outpoint, tx_output in outputs.items():
+            if self.journal is not None:
+                self.journal.append((outpoint, None, None, False))
+            self.clean[outpoint] = tx_output
+        self._evict()
+
+    def add(self, outputs: Dict[Tuple[str, int], TransactionOutput]):
+        for outpoint, tx_output in outputs.items():
+            self._journal(outpoint)
+            self.removed.discard(outpoint)
+            self.clean.pop(outpoint, None)
+            self.added[outpoint] = tx_output
+
+    def remove(self, outpoints: List[Tuple[str, int]]):
+        for outpoint in outpoints:
+            self._journal(outpoint)
+            self.clean.pop(outpoint, None)
+            if self.added.pop(outpoint, None) is None:
+                self.removed.add(outpoint)
+
+    def discard(self, outpoints: List[Tuple[str, int]]):
+        """Forgets outpoints written to the database without going through the cache."""
+        for outpoint in outpoints:
+            self._journal(outpoint)
+            self.clean.pop(outpoint, None)
+            self.added.pop(outpoint, None)
+            self.removed.discard(outpoint)
+
+    def flushed(self) -> Tuple[Dict[Tuple[str, int], TransactionOutput], set]:
+        """Marks the dirty outputs as written and returns them."""
+        added, removed = self.added, self.removed
+        self.version += 1
+        if self.journal is not None:
+            self.journal.append(('flush', added, removed))
+        self.clean.update(added)
+        self._evict()
+        self.added, self.removed = {}, set()
+        self.last_flush = monotonic()
+        return added, removed
+
+    def clear(self):
+        assert not self.dirty
+        self.version += 1
+        self.clean.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'max_size': self.max_size,
+            'dirty': self.dirty,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None
+        }
@@ -2,7 +2,6 @@ import argparse
 import asyncio
 import os
 import sys
-from decimal import Decimal
 
 import pickledb
 import requests
@@ -13,7 +12,7 @@ sys.path.insert(0, dir_path + "/../..")
 
 from denaro.transactions import Transaction, TransactionOutput, TransactionInput
 from denaro.constants import CURVE
-from denaro.helpers import point_to_string, sha256, string_to_point
+from denaro.helpers import point_to_string, sha256, string_to_point, decimal_to_smallest
 
 node_url = 'https://denaro-node.gaetano.eu.org'
 
@@ -24,14 +23,14 @@ def get_address_info(address: str):
     tx_inputs = []
     for spendable_tx_input in result['spendable_outputs']:
         tx_input = TransactionInput(spendable_tx_input['tx_hash'], spendable_tx_input['index'])
-        tx_input.amount = Decimal(str(spendable_tx_input['amount']))
+        tx_input.amount = decimal_to_smallest(str(spendable_tx_input['amount']))
         tx_input.public_key = string_to_point(address)
         tx_inputs.append(tx_input)
     return result['balance'], tx_inputs
 
 
 def create_transaction(private_keys, receiving_address, amount):
-    amount = Decimal(amount)
+    amount = decimal_to_smallest(amount)
     inputs = []
     for private_key in private_keys:
         address = point_to_string(keys.get_public_key(private_key, curve.P256))
@@ -1,16 +1,14 @@
-from decimal import Decimal
-
 from fastecdsa import keys
 
 from denaro import Database
 from denaro.constants import CURVE
-from denaro.helpers import point_to_string
+from denaro.helpers import point_to_string, decimal_to_smallest
 from denaro.transactions import Transaction, TransactionOutput
 
 
 async def create_transaction(private_keys, receiving_address, amount, message: bytes = None):
     denaro_database: Database = await Database.get()
-    amount = Decimal(amount)
+    amount = decimal_to_smallest(amount)
     inputs = []
     for private_key in private_keys:
         address = point_to_string(keys.get_public_key(private_key, CURVE))
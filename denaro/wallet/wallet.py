@@ -14,7 +14,7 @@ from utils import create_transaction
 from denaro import Database, node
 
 from denaro.constants import CURVE
-from denaro.helpers import point_to_string, sha256
+from denaro.helpers import point_to_string, sha256, smallest_to_decimal
 
 Database.credentials = {
     'user': os.environ.get('DENARO_DATABASE_USER', 'denaro'),
@@ -56,8 +56,8 @@ async def main():
             total_balance += balance
             pending_balance = await denaro_database.get_address_balance(address, True)
             total_pending_balance += pending_balance
-            print(f'\nAddress: {address}\nPrivate key: {hex(private_key)}\nBalance: {balance}{f" ({pending_balance - balance} pending)" if pending_balance - balance != 0 else ""}')
-        print(f'\nTotal Balance: {total_balance}{f" ({total_pending_balance - total_balance} pending)" if total_pending_balance - total_balance != 0 else ""}')
+            print(f'\nAddress: {address}\nPrivate key: {hex(private_key)}\nBalance: {smallest_to_decimal(balance)}{f" ({smallest_to_decimal(pending_balance - balance)} pending)" if pending_balance - balance != 0 else ""}')
+        print(f'\nTotal Balance: {smallest_to_decimal(total_balance)}{f" ({smallest_to_decimal(total_pending_balance - total_balance)} pending)" if total_pending_balance - total_balance != 0 else ""}')
     elif command == 'send':
         parser = argparse.ArgumentParser()
         parser.add_argument('command', metavar='command', type=str, help='action to do with the wallet')
@@ -0,0 +1,22 @@
+import asyncio
+from os import environ
+
+import denaro
+from denaro import Database
+
+
+async def run():
+    db = denaro.node.main.db = await Database.create(
+        user=environ.get('DENARO_DATABASE_USER', 'denaro'),
+        password=environ.get('DENARO_DATABASE_PASSWORD', ''),
+        database=environ.get('DENARO_DATABASE_NAME', 'denaro'),
+        host=environ.get('DENARO_DATABASE_HOST', None),
+        ignore=True
+    )
+    print('Converting transactions and hashes to binary... This will take a few minutes')
+    await db.migrate_binary_storage()
+    print('Done.')
+
+
+loop = asyncio.get_event_loop()
+loop.run_until_complete(run())
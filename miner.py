@@ -3,9 +3,10 @@ import sys
 import time
 import denaro
 from denaro.constants import ENDIAN
-from denaro.manager import get_difficulty, check_block_is_valid, Manager, get_transactions_merkle_tree
-from denaro.helpers import sha256, timestamp, string_to_bytes
+from denaro.manager import check_block_is_valid, get_block_template
+from denaro.helpers import timestamp, string_to_bytes
 
+from fastapi import BackgroundTasks
 from icecream import ic
 
 from denaro.node.main import sync_blockchain, push_block, startup
@@ -16,22 +17,20 @@ print = ic
 
 async def run():
     await startup()
-    db = denaro.node.main.db
 
     while True:
         await sync_blockchain()
-        difficulty, last_block = await get_difficulty()
+        template = await get_block_template()
+        difficulty, last_block = template.difficulty, dict(template.last_block)
         last_block['hash'] = last_block['hash'] if 'hash' in last_block else (30_06_2005).to_bytes(32, ENDIAN).hex()
         print(difficulty)
-        Manager.difficulty = None
         address = sys.argv[1]
         address_bytes = string_to_bytes(address)
         t = time.process_time()
         i = 0
         a = timestamp()
-        txs = await db.get_pending_transactions_limit(1000)
-        merkle_tree = get_transactions_merkle_tree(txs)
-        prefix = bytes.fromhex(last_block['hash']) + address_bytes + bytes.fromhex(merkle_tree) + a.to_bytes(4, byteorder=ENDIAN) + int(difficulty * 10).to_bytes(2, ENDIAN)
+        txs = template.transactions
+        prefix = bytes.fromhex(last_block['hash']) + address_bytes + bytes.fromhex(template.merkle_root) + a.to_bytes(4, byteorder=ENDIAN) + int(difficulty * 10).to_bytes(2, ENDIAN)
 
         if len(address_bytes) == 33:
             prefix = (2).to_bytes(1, ENDIAN) + prefix
@@ -49,11 +48,8 @@ async def run():
         if found:
             await sync_blockchain()
             print(f'win!!\n\n_hex:\n{_hex} \ntxs:{txs}\n')
-            res = await push_block(None, _hex.hex(), [tx.hex() for tx in txs], False)
-            Manager.difficulty = None
-            if res['ok'] and txs:
-                for tx in txs:
-                    await db.remove_pending_transaction(sha256(tx.hex()))
+            # connecting the block evicts its transactions from the pending ones
+            await push_block(None, BackgroundTasks(), _hex.hex(), [tx.hex() for tx in txs], False)
 
 loop = asyncio.get_event_loop()
 loop.run_until_complete(run())
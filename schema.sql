@@ -1,38 +1,84 @@
 CREATE TABLE IF NOT EXISTS blocks (
 	id SERIAL PRIMARY KEY,
-	hash CHAR(64) UNIQUE,
+	hash BYTEA UNIQUE,
 	address VARCHAR(128) NOT NULL,
 	random BIGINT NOT NULL,
 	difficulty NUMERIC(3, 1) NOT NULL,
-	reward NUMERIC(14, 6) NOT NULL,
+	reward BIGINT NOT NULL,
 	timestamp TIMESTAMP(0)
 );
 
 CREATE TABLE IF NOT EXISTS transactions (
-	block_hash CHAR(64) NOT NULL REFERENCES blocks(hash) ON DELETE CASCADE,
-	tx_hash CHAR(64) UNIQUE,
-	tx_hex TEXT,
+	block_hash BYTEA NOT NULL REFERENCES blocks(hash) ON DELETE CASCADE,
+	tx_hash BYTEA UNIQUE,
+	tx_bytes BYTEA,
 	inputs_addresses TEXT[],
-	fees NUMERIC(14, 6) NOT NULL
+	fees BIGINT NOT NULL
 );
 
 CREATE TYPE tx_output AS (
-    tx_hash CHAR(64),
+    tx_hash BYTEA,
     index SMALLINT
 );
 
 CREATE TABLE IF NOT EXISTS unspent_outputs (
-	tx_hash CHAR(64) REFERENCES transactions(tx_hash) ON DELETE CASCADE,
-	index SMALLINT NOT NULL
+	tx_hash BYTEA REFERENCES transactions(tx_hash) ON DELETE CASCADE,
+	index SMALLINT NOT NULL,
+	address_bytes BYTEA NOT NULL,
+	amount BIGINT NOT NULL,
+	PRIMARY KEY (tx_hash, index)
+);
+
+CREATE TABLE IF NOT EXISTS outputs (
+	tx_hash BYTEA REFERENCES transactions(tx_hash) ON DELETE CASCADE,
+	index SMALLINT NOT NULL,
+	address TEXT NOT NULL,
+	amount BIGINT NOT NULL,
+	spent_by BYTEA REFERENCES transactions(tx_hash) ON DELETE SET NULL,
+	PRIMARY KEY (tx_hash, index)
+);
+
+CREATE INDEX IF NOT EXISTS outputs_address_idx ON outputs (address);
+CREATE INDEX IF NOT EXISTS outputs_spent_by_idx ON outputs (spent_by);
+
+CREATE TABLE IF NOT EXISTS spent_outpoints (
+	tx_hash BYTEA NOT NULL,
+	index SMALLINT NOT NULL,
+	spent_by BYTEA NOT NULL,
+	pending BOOLEAN NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS spent_outpoints_outpoint_idx ON spent_outpoints (tx_hash, index);
+CREATE INDEX IF NOT EXISTS spent_outpoints_spent_by_idx ON spent_outpoints (spent_by);
+
+-- last block whose changes to unspent_outputs were flushed from the node cache
+CREATE TABLE IF NOT EXISTS unspent_outputs_state (
+	block_id INTEGER NOT NULL
+);
+
+-- first block synced without verifying its signatures, until the assume valid checkpoint is checked
+CREATE TABLE IF NOT EXISTS assume_valid_state (
+	block_id INTEGER NOT NULL,
+	checkpoint_hash BYTEA NOT NULL
 );
 
 CREATE TABLE IF NOT EXISTS pending_transactions (
-	tx_hash CHAR(64) UNIQUE,
-	tx_hex TEXT,
+	tx_hash BYTEA UNIQUE,
+	tx_bytes BYTEA,
 	inputs_addresses TEXT[],
-	fees NUMERIC(14, 6) NOT NULL
+	fees BIGINT NOT NULL
 );
 
+-- outputs of the pending transactions by address, the outputs they spend are found through spent_outpoints
+CREATE TABLE IF NOT EXISTS pending_outputs (
+	tx_hash BYTEA NOT NULL,
+	address TEXT NOT NULL,
+	amount BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS pending_outputs_tx_hash_idx ON pending_outputs (tx_hash);
+CREATE INDEX IF NOT EXISTS pending_outputs_address_idx ON pending_outputs (address);
+
 -- if your user is denaro
 -- GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO denaro;
 -- GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO denaro;
\ No newline at end of file
@@ -0,0 +1,34 @@
+import asyncio
+import re
+import sys
+from os import environ
+from pathlib import Path
+
+from denaro import Database
+
+# the checkpoint is taken this many blocks below the tip, so it is not removed by a reorganization
+DEPTH = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+CONSTANTS_PATH = Path(__file__).parent / 'denaro' / 'constants.py'
+
+
+async def run():
+    db = await Database.create(
+        user=environ.get('DENARO_DATABASE_USER', 'denaro'),
+        password=environ.get('DENARO_DATABASE_PASSWORD', ''),
+        database=environ.get('DENARO_DATABASE_NAME', 'denaro'),
+        host=environ.get('DENARO_DATABASE_HOST', None),
+        ignore=True
+    )
+    height = await db.get_next_block_id() - 1 - DEPTH
+    if height < 1:
+        print(f'The node has less than {DEPTH} blocks, sync it first')
+        return
+    block = await db.get_block_by_id(height)
+    constants = CONSTANTS_PATH.read_text()
+    constants = re.sub(r'^ASSUME_VALID = .*$', f"ASSUME_VALID = ({height}, '{block['hash']}')", constants, count=1, flags=re.MULTILINE)
+    CONSTANTS_PATH.write_text(constants)
+    print(f'Assume valid checkpoint set to block {height} {block["hash"]}, check this hash against other nodes before releasing it')
+
+
+loop = asyncio.get_event_loop()
+loop.run_until_complete(run())